@@ -0,0 +1,125 @@
+# Shared inference scheduler for the WebRTC tracks.
+#
+# Every `AITransformTrack` used to call `model(img)` itself, on the event loop,
+# so peers were served one after the other and ICE/DTLS stalled meanwhile.
+# Now each track hands its frame to one `InferenceScheduler`, which groups the
+# frames of all peers into small batches (up to `max_batch` frames, or whatever
+# arrived within `max_wait_ms` after the first one), runs them in a worker
+# thread through the model's `predict_batch`, and routes each result back to
+# the track that asked for it. Tracks may use different models (see the model
+# registry): a batch is then split into one call per model.
+import asyncio
+import time
+
+
+# Frames grouped in one call to the accelerator
+MAX_BATCH = 4
+# How long the first frame of a batch may wait for others (ms)
+MAX_WAIT_MS = 10
+# Smoothing factor for the batch statistics
+STATS_ALPHA = 0.1
+
+
+class InferenceScheduler:
+    """Micro-batches frames from many tracks into `model.predict_batch` calls."""
+
+    def __init__(self, model, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = None
+        self._task = None
+        self.batches = 0
+        self.frames = 0
+        self.avg_batch_size = 0.0
+        self.avg_batch_ms = 0.0
+
+    def _start(self):
+        # Created lazily so they belong to the running event loop.
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def infer(self, frame, model=None):
+        """Run `model` (default: the scheduler's) on one frame; returns the inference result."""
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((frame, model or self.model, future))
+        return await future
+
+    async def _collect(self):
+        """Wait for one frame, then gather more until the batch is full or the deadline passes."""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Skip frames whose track stopped waiting (peer closed)
+        return [item for item in batch if not item[2].done()]
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            start = time.perf_counter()
+            try:
+                # Off the event loop: other peers and ICE/DTLS keep running.
+                results = await asyncio.to_thread(self._predict, batch)
+            except Exception as exc:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+
+            self._record(len(batch), time.perf_counter() - start)
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def _predict(self, batch):
+        # One call per model, results put back in the order of the batch
+        by_model = {}
+        for position, (frame, model, _) in enumerate(batch):
+            by_model.setdefault(id(model), (model, []))[1].append((position, frame))
+        results = [None] * len(batch)
+        for model, items in by_model.values():
+            frames = [frame for _, frame in items]
+            predict_batch = getattr(model, "predict_batch", None)
+            if predict_batch is None or len(frames) == 1:
+                outputs = [model(frame) for frame in frames]
+            else:
+                # DeGirum pipelines the frames on the accelerator and yields results in order.
+                outputs = list(predict_batch(frames))
+            for (position, _), result in zip(items, outputs):
+                results[position] = result
+        return results
+
+    def _record(self, size, seconds):
+        self.batches += 1
+        self.frames += size
+        if self.batches == 1:
+            self.avg_batch_size, self.avg_batch_ms = float(size), seconds * 1000
+        else:
+            self.avg_batch_size += STATS_ALPHA * (size - self.avg_batch_size)
+            self.avg_batch_ms += STATS_ALPHA * (seconds * 1000 - self.avg_batch_ms)
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "frames": self.frames,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "avg_batch_size": round(self.avg_batch_size, 2),
+            "avg_batch_ms": round(self.avg_batch_ms, 2),
+        }
@@ -0,0 +1,288 @@
+# Background jobs for video detection.
+#
+# A video is submitted once and gets a job id. A small pool of workers runs
+# the detection off the event loop (so WebRTC sessions keep streaming), and the
+# client polls the job, follows its progress with Server-Sent Events, then
+# downloads the annotated MP4. Pending jobs are served round-robin per client,
+# so one user uploading ten videos can't make everyone else wait.
+import asyncio
+import itertools
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict, deque
+
+import cv2
+
+
+FFMPEG = "ffmpeg"
+# Finished jobs (and their MP4) are deleted after this many seconds
+JOB_TTL_S = 3600
+# Smoothing factor for the processing FPS shown in the progress
+FPS_ALPHA = 0.1
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when its job was cancelled."""
+
+
+class Job:
+    """State of one video detection job."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, owner, filename, input_path, workspace, model=None, detections=False):
+        self.id = f"{next(self._ids):06d}-{os.urandom(4).hex()}"
+        self.owner = owner
+        self.filename = filename
+        self.input_path = input_path
+        # Scratch folder holding the input and the result (see scratch.py)
+        self.workspace = workspace
+        self.output_path = workspace.file("annotated.mp4")
+        # Model name (None: the server's default model)
+        self.model = model
+        # JSON list of the raw detections of every frame, if asked for
+        self.detections_path = workspace.file("detections.json") if detections else None
+        self.status = QUEUED
+        self.error = None
+        self.frames_done = 0
+        self.total_frames = 0
+        self.fps = 0.0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = threading.Event()
+        self.done = asyncio.Event()
+
+    @property
+    def eta_s(self):
+        if self.status != RUNNING or self.fps <= 0 or self.total_frames <= 0:
+            return None
+        return max(self.total_frames - self.frames_done, 0) / self.fps
+
+    def report(self, frames_done, total_frames, frame_seconds):
+        """Progress callback, called from the worker thread after each frame."""
+        self.frames_done = frames_done
+        self.total_frames = total_frames
+        if frame_seconds > 0:
+            fps = 1 / frame_seconds
+            self.fps = fps if self.fps == 0 else self.fps + FPS_ALPHA * (fps - self.fps)
+        if self.cancel_requested.is_set():
+            raise JobCancelled()
+
+    def to_dict(self, position=None):
+        eta = self.eta_s
+        return {
+            "job_id": self.id,
+            "filename": self.filename,
+            "model": self.model,
+            "status": self.status,
+            "position": position,
+            "frames_done": self.frames_done,
+            "total_frames": self.total_frames,
+            "progress": round(self.frames_done / self.total_frames, 3) if self.total_frames else None,
+            "fps": round(self.fps, 1),
+            "eta_s": round(eta, 1) if eta is not None else None,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Bounded, fair job queue with a fixed number of workers.
+
+    - process(job): blocking function doing the work (runs in a worker thread)
+    - workers: number of jobs processed at the same time
+    - max_queued: pending jobs accepted before `submit` raises QueueFullError
+    """
+
+    def __init__(self, process, workers=1, max_queued=8, ttl_s=JOB_TTL_S):
+        self.process = process
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl_s = ttl_s
+        self.jobs = {}
+        # owner -> deque of pending jobs; the first owner is served next
+        self._pending = OrderedDict()
+        self._ready = None
+        self._tasks = []
+
+    @property
+    def queued_count(self):
+        return sum(len(q) for q in self._pending.values())
+
+    def _start(self):
+        # Workers are started lazily, inside the running event loop.
+        if not self._tasks:
+            self._ready = asyncio.Semaphore(0)
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, job):
+        self._start()
+        self._drop_expired()
+        if self.queued_count >= self.max_queued:
+            raise QueueFullError("Queue is full, try again later")
+        self.jobs[job.id] = job
+        self._pending.setdefault(job.owner, deque()).append(job)
+        self._ready.release()
+        return job
+
+    def position(self, job):
+        """1-based place in the round-robin order, None if not queued."""
+        if job.status != QUEUED:
+            return None
+        queues = [list(q) for q in self._pending.values()]
+        order = [j for batch in itertools.zip_longest(*queues) for j in batch if j is not None]
+        return order.index(job) + 1 if job in order else None
+
+    def cancel(self, job):
+        if job.status == QUEUED:
+            queue = self._pending.get(job.owner)
+            if queue and job in queue:
+                queue.remove(job)
+                if not queue:
+                    del self._pending[job.owner]
+            self._finish(job, CANCELLED)
+        elif job.status == RUNNING:
+            # The worker stops at the next frame.
+            job.cancel_requested.set()
+
+    def _next_job(self):
+        if not self._pending:
+            return None
+        owner, queue = self._pending.popitem(last=False)
+        job = queue.popleft()
+        if queue:
+            # This client goes to the back of the line.
+            self._pending[owner] = queue
+        return job
+
+    async def _worker(self):
+        while True:
+            await self._ready.acquire()
+            job = self._next_job()
+            if job is None:
+                continue  # It was cancelled while waiting
+            job.status = RUNNING
+            job.started = time.time()
+            try:
+                await asyncio.to_thread(self.process, job)
+            except JobCancelled:
+                self._finish(job, CANCELLED)
+            except Exception as exc:
+                job.error = str(exc) or exc.__class__.__name__
+                self._finish(job, FAILED)
+            else:
+                self._finish(job, DONE)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished = time.time()
+        if os.path.exists(job.input_path):
+            os.remove(job.input_path)
+        if status != DONE:
+            job.workspace.cleanup()
+        job.done.set()
+
+    def forget(self, job):
+        """Remove a finished job from the registry (its files are handled by the caller)."""
+        self.jobs.pop(job.id, None)
+
+    def _drop_expired(self):
+        now = time.time()
+        for job in list(self.jobs.values()):
+            if job.finished and now - job.finished > self.ttl_s:
+                job.workspace.cleanup()
+                del self.jobs[job.id]
+
+
+async def save_upload(upload, path, chunk_size=1024 * 1024, digest=None):
+    """
+    Copy an UploadFile to `path` chunk by chunk (never the whole file in memory).
+    `digest` (a hashlib object) is updated with the content on the way.
+    """
+    def write(chunk):
+        out.write(chunk)
+        if digest is not None:
+            digest.update(chunk)
+
+    with open(path, "wb") as out:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            await asyncio.to_thread(write, chunk)
+
+
+def annotate_video_file(input_path, output_path, annotate, progress=None):
+    """
+    Decode `input_path`, annotate every frame and encode it once to an H.264 MP4.
+    `progress(frames_done, total_frames, frame_seconds)` is called after each frame.
+    """
+    cap = cv2.VideoCapture(input_path)
+    if not cap.isOpened():
+        raise ValueError("Cannot open video file")
+
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) // 2 * 2
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) // 2 * 2
+
+    # Raw frames go straight into the H.264 encoder: no intermediate AVI.
+    encoder = subprocess.Popen([
+        FFMPEG, "-y", "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps:.3f}",
+        "-i", "pipe:0",
+        "-c:v", "libx264", "-profile:v", "baseline", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart",
+        output_path,
+    ], stdin=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    prev_frame_time = time.time()
+    frames = 0
+    # Decoded in place: one frame buffer for the whole video
+    frame = None
+    try:
+        while True:
+            ok, frame = cap.read(frame)
+            if not ok:
+                break
+            annotated_frame = annotate(frame)
+            if annotated_frame.shape[:2] != (height, width):
+                annotated_frame = cv2.resize(annotated_frame, (width, height))
+
+            # Calculate FPS
+            new_frame_time = time.time()
+            frame_seconds = new_frame_time - prev_frame_time
+            prev_frame_time = new_frame_time
+            fps_text = f"FPS: {1 / max(frame_seconds, 1e-6):.0f}"
+            cv2.putText(annotated_frame, fps_text, (20, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+            # The pipe takes the array's buffer directly (no .tobytes() copy)
+            encoder.stdin.write(memoryview(annotated_frame).cast("B"))
+            frames += 1
+            if progress is not None:
+                progress(frames, max(total, frames), frame_seconds)
+    except BaseException:
+        encoder.kill()
+        raise
+    finally:
+        cap.release()
+        if encoder.stdin:
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
+        encoder.wait()
+
+    if encoder.returncode != 0:
+        raise RuntimeError("Video encoding failed")
+    return frames
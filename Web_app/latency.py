@@ -0,0 +1,132 @@
+# Latency control for the WebRTC tracks.
+#
+# When inference is slower than the browser camera, `AITransformTrack` used to
+# process every frame anyway: frames piled up in the relay and the returned
+# video drifted further and further behind. Three tools keep it live:
+#
+# - `LatestFrameReader` drains the incoming track in the background and only
+#   keeps the newest frame (latest frame wins), counting the stale ones skipped;
+# - `InferenceCadence` runs the model on every Nth frame only; the frames in
+#   between reuse the previous detections (stream_engine's `draw_detections`);
+# - with a target latency, `InferenceCadence` picks N from the measured
+#   inference and reuse times, so the average time spent per frame stays under
+#   the target.
+import asyncio
+import math
+import time
+
+
+# Smoothing factor for the measured times
+TIMING_ALPHA = 0.1
+# Highest N the latency controller may choose
+MAX_INFER_EVERY = 10
+
+
+class LatestFrameReader:
+    """Reads `track` continuously; `get()` returns the newest frame not returned yet."""
+
+    def __init__(self, track):
+        self.track = track
+        self._frame = None
+        self._arrived = 0.0
+        self._error = None
+        self._new = asyncio.Event()
+        self._task = None
+        self.received = 0
+        self.skipped = 0
+
+    def _start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                frame = await self.track.recv()
+                if self._frame is not None:
+                    self.skipped += 1  # Never returned: a newer one replaces it
+                self._frame, self._arrived = frame, time.perf_counter()
+                self.received += 1
+                self._new.set()
+        except Exception as exc:
+            # Usually MediaStreamError when the peer goes away; raised by `get()`.
+            self._error = exc
+            self._new.set()
+
+    async def get(self):
+        """(frame, arrival time in perf_counter seconds)."""
+        self._start()
+        await self._new.wait()
+        if self._frame is None:
+            raise self._error
+        frame, arrived = self._frame, self._arrived
+        self._frame = None
+        if self._error is None:
+            # Set again by the next frame (or the end of the track)
+            self._new.clear()
+        # else the track already ended: the next `get()` raises its error right away
+        return frame, arrived
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+class InferenceCadence:
+    """
+    Decides which frames go through the model.
+
+    - every_n: run inference on one frame out of N (1 = every frame)
+    - target_latency_ms: if > 0, N is adapted (never below `every_n`) so that
+      the average processing time per frame stays under this target
+    """
+
+    def __init__(self, every_n=1, target_latency_ms=0, max_every_n=MAX_INFER_EVERY):
+        self.min_every_n = max(1, every_n)
+        self.max_every_n = max(self.min_every_n, max_every_n)
+        self.every_n = self.min_every_n
+        self.target = target_latency_ms / 1000.0
+        self.infer_s = 0.0
+        self.reuse_s = 0.0
+        self._since_inference = None  # None: no detections yet
+        self.inferred = 0
+        self.reused = 0
+
+    def should_infer(self):
+        if self._since_inference is None or self._since_inference + 1 >= self.every_n:
+            self._since_inference = 0
+            return True
+        self._since_inference += 1
+        return False
+
+    def record(self, seconds, inferred):
+        """Time spent on one frame, with or without inference."""
+        if inferred:
+            self.inferred += 1
+            self.infer_s = seconds if self.inferred == 1 else self.infer_s + TIMING_ALPHA * (seconds - self.infer_s)
+        else:
+            self.reused += 1
+            self.reuse_s = seconds if self.reused == 1 else self.reuse_s + TIMING_ALPHA * (seconds - self.reuse_s)
+        if self.target > 0:
+            self._adapt()
+
+    def _adapt(self):
+        # Average time per frame with N: (infer + (N - 1) * reuse) / N <= target
+        if self.infer_s <= self.target:
+            needed = 1
+        elif self.reuse_s >= self.target:
+            needed = self.max_every_n
+        else:
+            needed = math.ceil((self.infer_s - self.reuse_s) / (self.target - self.reuse_s))
+        self.every_n = min(max(needed, self.min_every_n), self.max_every_n)
+
+    def stats(self):
+        return {
+            "infer_every_n": self.every_n,
+            "target_latency_ms": self.target * 1000,
+            "inference_ms": round(self.infer_s * 1000, 2),
+            "reuse_ms": round(self.reuse_s * 1000, 2),
+            "frames_inferred": self.inferred,
+            "frames_reused": self.reused,
+        }
+
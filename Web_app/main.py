@@ -1,7 +1,6 @@
-import cv2, time, subprocess, io, os
+import asyncio, cv2, hashlib, json, time, io, os, sys
 import numpy as np
 from pathlib import Path
-import degirum as dg
 from fastapi import FastAPI, UploadFile, File, Request
 from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
@@ -11,6 +10,22 @@ from aiortc.contrib.media import MediaRelay
 from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
 from av import VideoFrame
 
+# Inference backends are shared with the other servers (stream_engine/ at the repo root)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from stream_engine.backends import draw_detections
+from stream_engine.metrics import CONTENT_TYPE, MetricsRegistry
+from stream_engine.models import ModelRegistry, input_size, read_model_list
+from stream_engine.motion import MOTION_DEFAULTS, MotionGate
+from stream_engine.tiling import TiledModel
+from stream_engine.workers import DeferredFrame, RenderPool
+
+from batching import InferenceScheduler
+from jobs import DONE, Job, JobQueue, QueueFullError, annotate_video_file, save_upload
+from latency import InferenceCadence, LatestFrameReader
+from result_cache import CachedFileResponse, ResultCache, cache_key, detections_json
+from scratch import ScratchFileResponse, ScratchManager
+from video_stream import MP4_MEDIA_TYPE, StreamingDetection, VideoDecodeError
+
 ### I use a WebRTC peer-to-peer (P2P) communication
 
 # Removing warnning just use C for YUV→BGR conversion on the Pi 5
@@ -25,19 +40,28 @@ token = ''
 device_type = "HAILORT/HAILO8L"
 
 ## Models 
-# - Object detection models
+# - Default model: object detection
 model_name ="yolo11n_coco--640x640_quant_hailort_multidevice_1"
-# - Pose estimation model
-#model_name = "yolov8n_relu6_coco_pose--640x640_quant_hailort_hailo8l_1"
-
-# Load Degirum model
-model = dg.load_model(
-    model_name=model_name,
-    inference_host_address=inference_host_address,
-    zoo_url=zoo_url,
-    token=token,
-    device_type=device_type
-)
+# - Others a session or /detect request can pick with `model` (e.g. the pose model
+#   "yolov8n_relu6_coco_pose--640x640_quant_hailort_hailo8l_1"): one name per line
+MODEL_LIST = Path(__file__).resolve().parent.parent / "Ressources" / "model.text"
+# Models kept loaded at the same time, the least recently used idle one is unloaded
+MODEL_CACHE_SIZE = int(os.environ.get("MODEL_CACHE_SIZE", 2))
+
+# Models are loaded on first use (INFERENCE_BACKEND=simulator runs without the Hailo chip)
+models = ModelRegistry({
+    "backend": os.environ.get("INFERENCE_BACKEND", "degirum"),
+    "name": model_name,
+    "inference_host_address": inference_host_address,
+    "zoo_url": zoo_url,
+    "token": token,
+    "device_type": device_type,
+}, read_model_list(MODEL_LIST) if MODEL_LIST.is_file() else [], capacity=MODEL_CACHE_SIZE)
+# The default model is loaded now and always stays resident
+model = models.acquire(model_name)
+# Uploads larger than the model input (1080p phone videos...) are cut into overlapping
+# model-sized tiles inferred as one batch, so small objects aren't lost (see stream_engine/tiling.py)
+DETECT_TILING = os.environ.get("DETECT_TILING", "0") != "0"
 
 BASE_DIR = Path(__file__).resolve().parent  # folder that has main.py
 
@@ -52,49 +76,174 @@ app.mount(
     name="static",
 )
 
+# Frames of all WebRTC peers are grouped into small batches for the accelerator
+INFER_BATCH_SIZE = int(os.environ.get("INFER_BATCH_SIZE", 4))
+# Max time (ms) a frame waits for other peers' frames before its batch runs
+INFER_BATCH_WAIT_MS = float(os.environ.get("INFER_BATCH_WAIT_MS", 10))
+scheduler = InferenceScheduler(model, max_batch=INFER_BATCH_SIZE, max_wait_ms=INFER_BATCH_WAIT_MS)
+
+# Latency control (see latency.py):
+# - only the newest camera frame is processed, stale ones are skipped
+LATEST_FRAME_WINS = os.environ.get("LATEST_FRAME_WINS", "1") != "0"
+# - run the model on 1 frame out of N, the others reuse its detections
+INFER_EVERY_N = int(os.environ.get("INFER_EVERY_N", 1))
+# - if > 0, raise N automatically to keep the time per frame under this (ms)
+TARGET_LATENCY_MS = float(os.environ.get("TARGET_LATENCY_MS", 0))
+# - skip the model while the camera sees a still scene (see stream_engine/motion.py):
+#   inference when more than MOTION_THRESHOLD of the pixels changed, or every MOTION_REFRESH_S
+MOTION_GATE = os.environ.get("MOTION_GATE", "0") != "0"
+MOTION_THRESHOLD = float(os.environ.get("MOTION_THRESHOLD", MOTION_DEFAULTS["threshold"]))
+MOTION_REFRESH_S = float(os.environ.get("MOTION_REFRESH_S", MOTION_DEFAULTS["refresh_s"]))
+# Worker processes for the per-frame CPU work of the WebRTC tracks: YUV→BGR conversion
+# and overlay drawing (see stream_engine/workers.py). 0 = in threads of this process
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 0))
+render_pool = RenderPool(RENDER_WORKERS) if RENDER_WORKERS > 0 else None
+# Active WebRTC tracks, for GET /inference
+tracks = set()
+# Weight of the newest frame interval in the FPS overlay (EMA, 1 = no smoothing)
+FPS_SMOOTHING = float(os.environ.get("FPS_SMOOTHING", 0.1))
+
+# Per-stage histograms for GET /metrics (cheap enough to stay on)
+metrics = MetricsRegistry(app="web_app")
+STAGE_SECONDS = {
+    stage: metrics.histogram("webrtc_stage_seconds", "Time spent in each stage of a WebRTC frame", stage=stage)
+    for stage in ("decode", "inference", "overlay", "encode")
+}
+FRAME_LATENCY = metrics.histogram("webrtc_frame_latency_seconds", "Time from frame arrival to annotated frame")
+DETECT_SECONDS = {
+    kind: metrics.histogram("detect_seconds", "Time to answer POST /detect", buckets=(
+        0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300), kind=kind)
+    for kind in ("image", "video")
+}
+
 # Relay allows multiple consumers to access the same video stream without duplicating processing
 relay = MediaRelay()
 # Keeps track of all active peer connections for cleanup and management
 pcs = set()
 
 
+def frame_to_bgr(frame):
+    """BGR pixels of an incoming av.VideoFrame (blocking: runs in a thread)."""
+    if render_pool is not None and frame.format.name == "yuv420p" and frame.width % 2 == 0 and frame.height % 2 == 0:
+        # Only the planes are copied here, the colour conversion runs in a worker
+        return render_pool.to_bgr(frame.to_ndarray(format="yuv420p"))
+    return frame.to_ndarray(format="bgr24")
+
+
+def overlay(image, detections):
+    """`image` with the boxes and labels of `detections` (blocking: runs in a thread)."""
+    if render_pool is not None:
+        annotated, _ = render_pool.render(DeferredFrame(image).add("detections", detections), None)
+        return annotated
+    return draw_detections(image, detections)
+
+
 # Define class to run inference on the model and compute FPS.
 class AITransformTrack(VideoStreamTrack):
     """
     Pulls frames from the incoming client video track,
     runs the model, and returns annotated frames.
     """
-    def __init__(self, track):
+    def __init__(self, track, model_name=None):
         super().__init__()  
+        # Model picked by this session (already resident: /offer loaded it)
+        self.model_name = model_name or models.default
+        self.model = models.acquire(self.model_name)
         self.track = relay.subscribe(track)
-        self.track = relay.subscribe(track)
-        self.last_time = time.time()
+        self.reader = LatestFrameReader(self.track) if LATEST_FRAME_WINS else None
+        self.cadence = InferenceCadence(INFER_EVERY_N, TARGET_LATENCY_MS)
+        self.motion = MotionGate(threshold=MOTION_THRESHOLD, refresh_s=MOTION_REFRESH_S) if MOTION_GATE else None
+        self.last_detections = []
+        self.last_time = time.perf_counter()
+        self.frame_interval = None
         self.fps = 0
+        self.latency_ms = 0.0
+        tracks.add(self)
 
     async def recv(self):
-        frame = await self.track.recv()  # an av.VideoFrame
-        img = frame.to_ndarray(format="bgr24")
-
-        # Update FPS
-        current_time = time.time()
+        try:
+            if self.reader is not None:
+                frame, arrived = await self.reader.get()  # newest av.VideoFrame
+            else:
+                frame, arrived = await self.track.recv(), time.perf_counter()
+        except Exception:
+            # Client track ended
+            self.stop()
+            raise
+        start = time.perf_counter()
+        # Off the event loop, like the overlay (in a worker process with RENDER_WORKERS)
+        img = await asyncio.to_thread(frame_to_bgr, frame)
+        STAGE_SECONDS["decode"].observe(time.perf_counter() - start)
+
+        # Update FPS (moving average of the frame interval, a single stall doesn't make it jump)
+        current_time = time.perf_counter()
         delta = current_time - self.last_time
         self.last_time = current_time
-        self.fps = 1 / delta if delta > 0 else 0
-
-        # Run model 
-        annotated = model(img).image_overlay
+        if self.frame_interval is None:
+            self.frame_interval = delta
+        else:
+            self.frame_interval += FPS_SMOOTHING * (delta - self.frame_interval)
+        self.fps = 1 / self.frame_interval if self.frame_interval > 0 else 0
+
+        start = time.perf_counter()
+        # Frames the cadence picks still skip the model if nothing moved
+        inferred = self.cadence.should_infer() and (self.motion is None or self.motion.should_infer(img))
+        if inferred:
+            # Run model (batched with the other peers, off the event loop)
+            result = await scheduler.infer(img, self.model)
+            overlay_start = time.perf_counter()
+            STAGE_SECONDS["inference"].observe(overlay_start - start)
+            if render_pool is None:
+                annotated = await asyncio.to_thread(lambda: result.image_overlay)
+            else:
+                # Boxes and labels from the results (keypoints / masks need RENDER_WORKERS=0)
+                annotated = await asyncio.to_thread(overlay, img, result.results)
+            self.last_detections = result.results
+        else:
+            # Reuse the last detections on this newer frame
+            overlay_start = time.perf_counter()
+            annotated = await asyncio.to_thread(overlay, img, self.last_detections)
+        self.cadence.record(time.perf_counter() - start, inferred)
 
         # Add FPS overlay
         text = f"FPS: {self.fps:.2f}"
         cv2.putText(annotated, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 
                     1, (0, 255, 0), 2, cv2.LINE_AA)
+        STAGE_SECONDS["overlay"].observe(time.perf_counter() - overlay_start)
 
+        start = time.perf_counter()
         new_frame = VideoFrame.from_ndarray(annotated, format="bgr24")
         # preserve timing
         new_frame.pts = frame.pts
         new_frame.time_base = frame.time_base
+        STAGE_SECONDS["encode"].observe(time.perf_counter() - start)
+
+        # Time from frame arrival to annotated frame (smoothed)
+        FRAME_LATENCY.observe(time.perf_counter() - arrived)
+        latency_ms = (time.perf_counter() - arrived) * 1000
+        self.latency_ms = latency_ms if not self.latency_ms else self.latency_ms + 0.1 * (latency_ms - self.latency_ms)
         return new_frame
 
+    def stop(self):
+        super().stop()
+        if self.reader is not None:
+            self.reader.stop()
+        if self in tracks:
+            # The model may be unloaded once no session uses it
+            models.release(self.model_name)
+        tracks.discard(self)
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "fps": round(self.fps, 1),
+            "latency_ms": round(self.latency_ms, 2),
+            "frames_received": self.reader.received if self.reader else None,
+            "stale_frames_skipped": self.reader.skipped if self.reader else None,
+            **self.cadence.stats(),
+            "motion": self.motion.stats() if self.motion is not None else None,
+        }
+
 
 # Route for main HTML client interface
 @app.get("/", response_class=HTMLResponse)
@@ -116,6 +265,14 @@ async def offer(request: Request):
     """
     params = await request.json()
     offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
+    model_name = params.get("model") or models.default
+    if model_name not in models.names:
+        return JSONResponse({"error": f"Unknown model {model_name}"}, status_code=400)
+    try:
+        # Load the session's model off the event loop: the other sessions keep streaming
+        await asyncio.to_thread(models.acquire, model_name)
+    except Exception as exc:
+        return JSONResponse({"error": f"Cannot load model {model_name}: {exc}"}, status_code=503)
 
     pc = RTCPeerConnection()
     pcs.add(pc)
@@ -124,13 +281,17 @@ async def offer(request: Request):
     def on_track(track):
         if track.kind == "video":
             # wrap incoming track in our AI‑transform
-            ai_track = AITransformTrack(track)
+            ai_track = AITransformTrack(track, model_name)
             pc.addTrack(ai_track)
 
-    # set remote/ local descriptions
-    await pc.setRemoteDescription(offer)
-    answer = await pc.createAnswer()
-    await pc.setLocalDescription(answer)
+    try:
+        # set remote/ local descriptions
+        await pc.setRemoteDescription(offer)
+        answer = await pc.createAnswer()
+        await pc.setLocalDescription(answer)
+    finally:
+        # The tracks hold the model from now on
+        models.release(model_name)
 
     return JSONResponse({
         "sdp": pc.localDescription.sdp,
@@ -141,96 +302,391 @@ async def offer(request: Request):
 # Valide video format
 VIDEO_EXTS = {".mp4", ".mov", ".avi", ".mkv", ".webm"}
 
+# Background video jobs: videos processed at the same time, pending jobs accepted
+DETECT_WORKERS = int(os.environ.get("DETECT_WORKERS", 1))
+DETECT_QUEUE_SIZE = int(os.environ.get("DETECT_QUEUE_SIZE", 8))
+# Scratch files go to RAM (/dev/shm) up to this quota, then to disk
+SCRATCH_RAM_QUOTA_MB = int(os.environ.get("SCRATCH_RAM_QUOTA_MB", 512))
+
+scratch = ScratchManager(ram_quota_bytes=SCRATCH_RAM_QUOTA_MB * 1024 * 1024)
+
+# Results of /detect kept on disk (annotated file + raw detections), keyed by the
+# upload's content, the model and the settings below: re-uploads skip inference
+DETECT_CACHE_MB = int(os.environ.get("DETECT_CACHE_MB", 1024))  # 0 = no cache
+DETECT_CACHE_DIR = os.environ.get("DETECT_CACHE_DIR", str(BASE_DIR / "detect_cache"))
+# Bump the version when the drawing of the results changes (older entries stop matching)
+CACHE_SETTINGS = {"version": 1, "backend": models.cfg["backend"], "tiling": DETECT_TILING}
+
+result_cache = ResultCache(DETECT_CACHE_DIR, DETECT_CACHE_MB * 1024 * 1024) if DETECT_CACHE_MB > 0 else None
+
+
+def detector(model, model_name=None):
+    """What /detect runs: `model`, over tiles of the frame when DETECT_TILING is on."""
+    if not DETECT_TILING:
+        return model
+    return TiledModel(model, tile=min(input_size(model_name or models.default)))
+
+
+def annotate_frame(frame, model_name=None):
+    """Run the model (default or by name, loaded if needed) on one frame, return the annotated image and detections."""
+    with models.use(model_name) as model:
+        result = detector(model, model_name)(frame)
+        return result.image_overlay, result.results
+
+
+def run_job(job):
+    """Worker thread: annotate the job's video into its MP4 (and its detections), reporting progress."""
+    with models.use(job.model) as model:
+        detect = detector(model, job.model)
+        if job.detections_path is None:
+            annotate_video_file(job.input_path, job.output_path, lambda frame: detect(frame).image_overlay,
+                                job.report)
+            return
+        # One JSON list of detections per frame, written as the frames go
+        with open(job.detections_path, "wb") as out:
+            out.write(b"[")
+
+            def annotate(frame):
+                result = detect(frame)
+                out.write((b",\n" if out.tell() > 1 else b"") + detections_json(result.results))
+                return result.image_overlay
+
+            annotate_video_file(job.input_path, job.output_path, annotate, job.report)
+            out.write(b"]\n")
+
+
+def result_key(content_hash, model_name=None):
+    return cache_key(content_hash, model_name or models.default, CACHE_SETTINGS)
+
+
+def cache_headers(key, hit):
+    """Tells the client whether the result came from the cache, and its key (for GET /cache/{key}/detections)."""
+    return {"X-Cache": "HIT" if hit else "MISS", "X-Cache-Key": key} if key is not None else None
+
+
+def store_result(key, files):
+    """Add a result to the cache; a full or failing disk only costs the next upload an inference."""
+    try:
+        result_cache.put(key, files)
+    except OSError as exc:
+        print(f"⚠️  Result cache: cannot store {key[:12]}: {exc}")
+
+
+def unknown_model(model_name):
+    """Error response if `model_name` is not offered, else None."""
+    if model_name is not None and model_name not in models.names:
+        return JSONResponse({"error": f"Unknown model {model_name}"}, status_code=400)
+    return None
+
+
+jobs = JobQueue(run_job, workers=DETECT_WORKERS, max_queued=DETECT_QUEUE_SIZE)
+
+
+def is_video(file):
+    name_lc = file.filename.lower()
+    return not (file.content_type.startswith("image/") or os.path.splitext(name_lc)[1] not in VIDEO_EXTS)
+
+
+async def receive_video(file, digest=None):
+    """Save the upload in its own scratch folder (hashing it into `digest`), returns (workspace, path)."""
+    # Room for the upload and the annotated MP4 (roughly the same size)
+    workspace = scratch.workspace(2 * (file.size or 0), prefix="job_")
+    input_path = workspace.file("input" + os.path.splitext(file.filename.lower())[1])
+    try:
+        await save_upload(file, input_path, digest=digest)
+    except BaseException:
+        workspace.cleanup()
+        raise
+    return workspace, input_path
+
+
+def queue_video(request, file, workspace, input_path, model_name=None, detections=False):
+    """Queue a received video. Raises QueueFullError (the scratch folder is then deleted)."""
+    # Pending jobs are shared round-robin between clients (one line per IP address)
+    owner = request.client.host if request.client else "unknown"
+    try:
+        return jobs.submit(Job(owner, file.filename, input_path, workspace, model_name, detections))
+    except BaseException:
+        workspace.cleanup()
+        raise
+
+
+async def submit_video(request, file, model_name=None):
+    """Save the upload in its own scratch folder and queue it. Raises QueueFullError."""
+    workspace, input_path = await receive_video(file)
+    return queue_video(request, file, workspace, input_path, model_name)
+
+
 # Route that run inference on the video of the image the use gave
 @app.post("/detect")
-async def detect(file: UploadFile = File(...)):
+async def detect(request: Request, file: UploadFile = File(...), model: str | None = None):
     """
-    Accepts an image **or** a video file, runs inference with Degirum,
+    Accepts an image **or** a video file, runs inference with Degirum
+    (the `model` query parameter picks one of GET /models, default model otherwise),
     returns:
       • image  -> JPEG  (image/jpeg)
       • video  -> MP4   (video/mp4) 
+    A file already processed with the same model and settings is answered from
+    the result cache, without inference (header `X-Cache: HIT`).
     """
-    raw = await file.read()
-    name_lc  = file.filename.lower()
-
+    start = time.perf_counter()
+    if (error := unknown_model(model)) is not None:
+        return error
     # -------- case 1 :  IMAGE  ------------------------------------------
-    if file.content_type.startswith("image/") or os.path.splitext(name_lc)[1] not in VIDEO_EXTS:
+    if not is_video(file):
+        raw = await file.read()
+        key = None
+        if result_cache is not None:
+            key = result_key(await asyncio.to_thread(lambda: hashlib.sha256(raw).hexdigest()), model)
+            if (cached := result_cache.acquire(key)) is not None:
+                try:
+                    jpg = await asyncio.to_thread(Path(cached, "annotated.jpg").read_bytes)
+                finally:
+                    result_cache.release(key)
+                DETECT_SECONDS["image"].observe(time.perf_counter() - start)
+                return Response(jpg, media_type="image/jpeg", headers=cache_headers(key, hit=True))
         img = cv2.imdecode(np.frombuffer(raw, np.uint8), cv2.IMREAD_COLOR)
         if img is None:
             return {"error": "Cannot decode image"}
-        annotated = model(img).image_overlay
+        # Run the model off the event loop so live WebRTC sessions keep streaming
+        annotated, detections = await asyncio.to_thread(annotate_frame, img, model)
         ok, jpg = cv2.imencode(".jpg", annotated)
         if not ok:
             return {"error": "Encoding failed"}
-        return StreamingResponse(io.BytesIO(jpg.tobytes()),
-                                 media_type="image/jpeg")
+        jpg = jpg.tobytes()
+        if key is not None:
+            await asyncio.to_thread(store_result, key, {
+                "annotated.jpg": jpg, "detections.json": detections_json(detections)})
+        DETECT_SECONDS["image"].observe(time.perf_counter() - start)
+        return StreamingResponse(io.BytesIO(jpg),
+                                 media_type="image/jpeg", headers=cache_headers(key, hit=False))
 
     # -------- case 2 :  VIDEO  ------------------------------------------
-    # write uploaded bytes to a temp file in /dev/shm (RAM) so OpenCV can open it
-    tmp_in_path = "/dev/shm/" + file.filename  # Directly use RAM disk for input
-    with open(tmp_in_path, "wb") as tmp_in:
-        tmp_in.write(raw)
-    
-    # Load video sent
-    cap = cv2.VideoCapture(tmp_in_path)
- 
-    # Check is we can open it
-    if not cap.isOpened():
-        os.remove(tmp_in_path)
-        return {"error": "Cannot open video file"}
-
-    # Prepare temp file for the output MP4 in /dev/shm (RAM)
-    fourcc = cv2.VideoWriter_fourcc(*"MJPG")
-    fps = cap.get(cv2.CAP_PROP_FPS) or 25
-    width  = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-
-    tmp_out_path = "/dev/shm/" + "output.avi"  # Save output in RAM as well
-    writer = cv2.VideoWriter(tmp_out_path, fourcc, fps, (width, height))
-    
-    # start FPS counter
-    prev_frame_time = time.time()
-
-    # Performe object detection 
-    while True:
-        ok, frame = cap.read()
-        if not ok:
-            break
-        annotated_frame = model(frame).image_overlay
-
-        # Calculate FPS
-        new_frame_time = time.time()
-        fps = 1 / (new_frame_time - prev_frame_time)
-        prev_frame_time = new_frame_time
-
-        fps_text = f"FPS: {fps:.0f}"
-        cv2.putText(annotated_frame, fps_text, (20, 30),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-
-        writer.write(annotated_frame)
-
-    cap.release()
-    writer.release()
-    os.remove(tmp_in_path)
-    
-    # Transcode AVI→MP4 with H.264 (baseline profile + faststart)
-    mp4_path = "/dev/shm/" + "output.mp4"  # Output the MP4 to RAM
-    subprocess.run([
-        "ffmpeg", "-y",
-        "-i", tmp_out_path,
-        "-c:v", "libx264",
-        "-profile:v", "baseline",
-        "-preset", "veryfast",
-        "-movflags", "+faststart",
-        mp4_path
-    ], check=True)
-
-    # Clean up the AVI
-    os.remove(tmp_out_path)
-
-    # Return the MP4 from RAM
-    return FileResponse(
-        mp4_path,
+    # The upload is hashed while it is saved
+    digest = hashlib.sha256() if result_cache is not None else None
+    workspace, input_path = await receive_video(file, digest)
+    key = None
+    if digest is not None:
+        key = result_key(digest.hexdigest(), model)
+        if (cached := result_cache.acquire(key)) is not None:
+            workspace.cleanup()
+            DETECT_SECONDS["video"].observe(time.perf_counter() - start)
+            return CachedFileResponse(os.path.join(cached, "annotated.mp4"), result_cache, key,
+                                      media_type="video/mp4", filename="annotated.mp4",
+                                      headers=cache_headers(key, hit=True))
+    # Same work as a background job: queued fairly and processed off the event loop
+    try:
+        job = queue_video(request, file, workspace, input_path, model, detections=key is not None)
+    except QueueFullError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=503)
+    await job.done.wait()
+    # Nobody polls this job: its files are deleted once the response is sent
+    jobs.forget(job)
+    if job.status != DONE:
+        job.workspace.cleanup()
+        return {"error": job.error or "Cannot open video file"}
+    DETECT_SECONDS["video"].observe(time.perf_counter() - start)
+
+    # Copy the result to the cache in a thread while the MP4 is sent; the scratch
+    # folder is deleted once both are done
+    store = None
+    if key is not None:
+        store = asyncio.create_task(asyncio.to_thread(store_result, key, {
+            "annotated.mp4": job.output_path, "detections.json": job.detections_path}))
+    return ScratchFileResponse(
+        job.output_path,
+        job.workspace,
+        reader=store,
         media_type="video/mp4",
-        filename="annotated.mp4"
+        filename="annotated.mp4",
+        headers=cache_headers(key, hit=False),
     )
+
+
+# Batches of the WebRTC scheduler and latency of each open track
+@app.get("/inference")
+def inference_stats():
+    """Batching statistics of the WebRTC inference scheduler, and per-track latency."""
+    return {**scheduler.stats(), "render_pool": render_pool.stats() if render_pool is not None else None,
+            "tracks": [track.stats() for track in list(tracks)]}
+
+
+# Scratch usage: folders in RAM / on disk, bytes used and reserved, fallbacks
+@app.get("/scratch")
+def scratch_stats():
+    return scratch.stats()
+
+
+# Result cache of /detect: entries, size, hits / misses / evictions
+@app.get("/cache")
+def cache_stats():
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+
+@app.get("/cache/{key}/detections")
+def cached_detections(key: str):
+    """Raw detections of a cached result (key from the X-Cache-Key header): a list, one list per frame for videos."""
+    cached = result_cache.acquire(key, count=False) if result_cache is not None else None
+    if cached is None:
+        return JSONResponse({"error": "Unknown or evicted result"}, status_code=404)
+    return CachedFileResponse(os.path.join(cached, "detections.json"), result_cache, key,
+                              media_type="application/json")
+
+
+def motion_skip_ratio():
+    gates = [t.motion for t in list(tracks) if t.motion]
+    frames = sum(g.inferred + g.skipped for g in gates)
+    return sum(g.skipped for g in gates) / frames if frames else 0.0
+
+
+metrics.gauge("webrtc_peers", "Open WebRTC peer connections", lambda: len(pcs))
+metrics.gauge("webrtc_tracks", "WebRTC tracks being annotated", lambda: len(tracks))
+metrics.counter("webrtc_stale_frames_skipped_total", "Camera frames skipped to stay on the newest one",
+                lambda: sum(t.reader.skipped for t in list(tracks) if t.reader))
+metrics.counter("webrtc_motion_skipped_total", "Frames not sent to the model because nothing moved",
+                lambda: sum(t.motion.skipped for t in list(tracks) if t.motion))
+metrics.gauge("webrtc_motion_skip_ratio", "Fraction of the frames of the open tracks skipped by the motion gate",
+              motion_skip_ratio)
+metrics.gauge("inference_queue_depth", "Frames waiting for the batching scheduler",
+              lambda: scheduler.stats()["queued"])
+metrics.counter("inference_batches_total", "Batches run by the scheduler", lambda: scheduler.batches)
+metrics.counter("inference_frames_total", "Frames inferred by the scheduler", lambda: scheduler.frames)
+metrics.gauge("models_resident", "Models loaded in memory", lambda: len(models.stats()["resident"]))
+metrics.counter("model_loads_total", "Models loaded (first use or after an eviction)", lambda: models.loads)
+metrics.counter("model_evictions_total", "Idle models unloaded to stay within MODEL_CACHE_SIZE",
+                lambda: models.evictions)
+metrics.gauge("detect_jobs_queued", "Video jobs waiting for a worker", lambda: jobs.queued_count)
+if result_cache is not None:
+    metrics.counter("detect_cache_hits_total", "/detect uploads answered from the result cache",
+                    lambda: result_cache.hits)
+    metrics.counter("detect_cache_misses_total", "/detect uploads not in the result cache (inferred)",
+                    lambda: result_cache.misses)
+    metrics.counter("detect_cache_evictions_total", "Results deleted to stay within DETECT_CACHE_MB",
+                    lambda: result_cache.evictions)
+    metrics.gauge("detect_cache_bytes", "Disk space used by the result cache", lambda: result_cache.bytes_used)
+
+
+# Stage latency histograms, queue depths and connections for Prometheus
+@app.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
+
+
+# -------- Background jobs ---------------------------------------------
+def get_job(job_id):
+    return jobs.jobs.get(job_id)
+
+
+@app.post("/jobs")
+async def create_job(request: Request, file: UploadFile = File(...), model: str | None = None):
+    """Queue a video for detection, returns its job id right away."""
+    if not is_video(file):
+        return JSONResponse({"error": "Only videos can be submitted as jobs"}, status_code=400)
+    if (error := unknown_model(model)) is not None:
+        return error
+    try:
+        job = await submit_video(request, file, model)
+    except QueueFullError as exc:
+        return JSONResponse({"error": str(exc)}, status_code=503)
+    return job.to_dict(jobs.position(job))
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Poll a job: status, frames done, current FPS and ETA."""
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+    return job.to_dict(jobs.position(job))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events stream of the job progress, ends when the job is finished."""
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+
+    async def events():
+        last_state = None
+        while True:
+            state = job.to_dict(jobs.position(job))
+            if state != last_state:
+                yield f"data: {json.dumps(state)}\n\n"
+                last_state = state
+            if job.done.is_set():
+                break
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=0.5)
+            except asyncio.TimeoutError:
+                pass
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """Download the annotated MP4 of a finished job."""
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+    if job.status != DONE:
+        return JSONResponse(job.to_dict(jobs.position(job)), status_code=409)
+    return FileResponse(job.output_path, media_type="video/mp4", filename="annotated.mp4")
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+    jobs.cancel(job)
+    return job.to_dict()
+
+
+# Route that streams the annotated video back while the upload is still arriving
+@app.post("/detect/stream")
+async def detect_stream(request: Request, model: str | None = None):
+    """
+    Streaming video detection. The request body is the raw video file
+    (not a form), the response is a fragmented MP4 (video/mp4) sent
+    progressively: decoding, inference and H.264 encoding run chunk by chunk,
+    so memory stays bounded whatever the size of the video.
+    """
+    if (error := unknown_model(model)) is not None:
+        return error
+    try:
+        # Held until the response ends, so it isn't unloaded between two frames
+        loaded = await asyncio.to_thread(models.acquire, model)
+    except Exception as exc:
+        return JSONResponse({"error": f"Cannot load model {model}: {exc}"}, status_code=503)
+    # Upload spool: on the RAM disk only if the declared size fits the quota
+    expected = int(request.headers.get("content-length") or 0)
+    detect = detector(loaded, model)
+    detection = StreamingDetection(lambda frame: detect(frame).image_overlay,
+                                   scratch.workspace(expected, prefix="stream_"))
+    try:
+        await detection.open(request.stream())
+    except VideoDecodeError:
+        models.release(model)
+        return {"error": "Cannot open video file"}
+    except BaseException:
+        models.release(model)
+        raise
+
+    async def body():
+        try:
+            async for chunk in detection.body():
+                yield chunk
+        finally:
+            models.release(model)
+
+    return StreamingResponse(body(), media_type=MP4_MEDIA_TYPE)
+
+
+# Models this server offers, the ones loaded now and the cache counters
+@app.get("/models")
+def models_stats():
+    return models.stats()
@@ -0,0 +1,205 @@
+# On-disk cache of /detect results, keyed by the content of the upload.
+#
+# The same demo images and clips are uploaded again and again. The key of an
+# upload is the SHA-256 of its bytes plus the model name and the settings that
+# change the result (backend, tiling...): a renamed copy of a file is a hit, the
+# same file with another model is not. A hit returns the stored annotated
+# JPEG / MP4 without decoding, inference or encoding.
+#
+# Each entry is a folder named after its key, holding the annotated file and
+# the raw detections as JSON. Entries are written to a temporary folder first
+# and renamed into place, so a crash never leaves half an entry behind. The
+# folder's mtime is its last use: the index is rebuilt from the folders at
+# startup (the cache survives restarts), and when the cache grows over its size
+# limit the least recently used entries are deleted. Entries being sent to a
+# client are never deleted (they are pinned until the response ends).
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+from fastapi.responses import FileResponse
+
+from scratch import _folder_size
+
+
+# Temporary folders of entries being written (leftovers are removed at startup)
+_TMP_PREFIX = ".tmp-"
+
+
+def cache_key(content_hash, model, settings=None):
+    """Key of an upload: its content hash (hex), the model and the settings that change the result."""
+    parts = json.dumps({"content": content_hash, "model": model, "settings": settings or {}}, sort_keys=True)
+    return hashlib.sha256(parts.encode()).hexdigest()
+
+
+def detections_json(detections):
+    """JSON bytes of model results (numpy values are converted)."""
+    return json.dumps(detections, default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o)).encode()
+
+
+class _Entry:
+    def __init__(self, size):
+        self.size = size
+        # Responses sending one of its files
+        self.readers = 0
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of result folders on disk.
+
+    - acquire(key) / release(key): folder of a cached result (pinned while in use), None on a miss
+    - put(key, files): store {file name: bytes or path to copy} as the entry `key`
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        # key -> _Entry, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _load(self):
+        """Index the entries left by the previous runs, oldest use first."""
+        found = []
+        for name in os.listdir(self.directory):
+            path = self._path(name)
+            if not os.path.isdir(path):
+                continue
+            if name.startswith(_TMP_PREFIX):
+                # Entry that was being written when the server stopped
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            found.append((os.path.getmtime(path), name, _folder_size(path)))
+        for _, name, size in sorted(found):
+            self._entries[name] = _Entry(size)
+        self._evict()
+        if self._entries:
+            print(f"✅ Result cache: {len(self._entries)} entries ({self.bytes_used / 1e6:.1f} MB) in {self.directory}")
+
+    @property
+    def bytes_used(self):
+        return sum(entry.size for entry in self._entries.values())
+
+    def acquire(self, key, count=True):
+        """
+        Folder of entry `key`, kept until `release(key)`; None if it isn't cached.
+        `count=False`: not a lookup of /detect (hits and misses aren't counted).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += count
+                return None
+            self.hits += count
+            entry.readers += 1
+            self._entries.move_to_end(key)
+        path = self._path(key)
+        try:
+            # The last use is kept on disk for the next startup
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.readers > 0:
+                entry.readers -= 1
+        self._evict()
+
+    def put(self, key, files):
+        """
+        Store `files` ({name: bytes, or path of a file to copy in}) as entry `key`.
+        Returns False if the entry is larger than the whole cache.
+        """
+        tmp = self._path(f"{_TMP_PREFIX}{key}-{os.urandom(4).hex()}")
+        os.makedirs(tmp)
+        try:
+            for name, data in files.items():
+                target = os.path.join(tmp, name)
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    with open(target, "wb") as f:
+                        f.write(data)
+                else:
+                    # Copied: the file is in a scratch folder (often on the RAM
+                    # disk), which may still be sending it and deletes it afterwards
+                    shutil.copyfile(data, target)
+            size = _folder_size(tmp)
+            if size > self.max_bytes:
+                shutil.rmtree(tmp, ignore_errors=True)
+                return False
+            try:
+                os.rename(tmp, self._path(key))
+            except OSError:
+                # The same upload was stored by a concurrent request
+                shutil.rmtree(tmp, ignore_errors=True)
+                return True
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        with self._lock:
+            self._entries[key] = _Entry(size)
+            self.stores += 1
+        self._evict()
+        return True
+
+    def _evict(self):
+        with self._lock:
+            excess = self.bytes_used - self.max_bytes
+            evicted = []
+            # Oldest first; entries being sent are skipped
+            for key, entry in self._entries.items():
+                if excess <= 0:
+                    break
+                if entry.readers == 0:
+                    evicted.append(key)
+                    excess -= entry.size
+            for key in evicted:
+                del self._entries[key]
+            self.evictions += len(evicted)
+        for key in evicted:
+            shutil.rmtree(self._path(key), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "directory": self.directory,
+                "entries": len(self._entries),
+                "bytes_used": self.bytes_used,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+                "stores": self.stores,
+                "evictions": self.evictions,
+            }
+
+
+class CachedFileResponse(FileResponse):
+    """FileResponse of a cached file: its entry can't be evicted until it has been sent."""
+
+    def __init__(self, path, cache, key, **kwargs):
+        super().__init__(path, **kwargs)
+        self.cache = cache
+        self.key = key
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.cache.release(self.key)
@@ -0,0 +1,179 @@
+# Per-request scratch folders for uploads and results.
+#
+# Every upload/job gets its own folder with a unique name, so concurrent
+# requests never overwrite each other's files. Folders go to the RAM disk
+# (/dev/shm) while it has room and our quota allows it, otherwise to the normal
+# disk. `ScratchFileResponse` deletes the folder once the file has been sent
+# (or the client went away), so the RAM disk doesn't slowly fill up.
+import asyncio
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from fastapi.responses import FileResponse
+
+
+RAM_DIR = "/dev/shm/hailo_scratch"
+DISK_DIR = os.path.join(tempfile.gettempdir(), "hailo_scratch")
+# Max bytes our workspaces may reserve on the RAM disk
+RAM_QUOTA_BYTES = 512 * 1024 * 1024
+# Always leave at least this much free on the RAM disk for the rest of the system
+RAM_MIN_FREE_BYTES = 128 * 1024 * 1024
+# Leftover folders older than this (e.g. after a crash) are removed at startup
+STALE_AFTER_S = 6 * 3600
+
+
+def _folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass  # Deleted while walking
+    return total
+
+
+class Workspace:
+    """One unique scratch folder. Call `cleanup()` (or use `with`) when done."""
+
+    def __init__(self, manager, path, on_ram, reserved_bytes):
+        self.manager = manager
+        self.path = path
+        self.on_ram = on_ram
+        self.reserved_bytes = reserved_bytes
+        self.cleaned = False
+
+    def file(self, name):
+        """Path of a file inside the workspace."""
+        return os.path.join(self.path, name)
+
+    def size(self):
+        return 0 if self.cleaned else _folder_size(self.path)
+
+    def cleanup(self):
+        self.manager.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cleanup()
+
+
+class ScratchManager:
+    """Creates workspaces on the RAM disk when possible, on disk otherwise."""
+
+    def __init__(self, ram_dir=RAM_DIR, disk_dir=DISK_DIR,
+                 ram_quota_bytes=RAM_QUOTA_BYTES, ram_min_free_bytes=RAM_MIN_FREE_BYTES):
+        self.ram_dir = ram_dir
+        self.disk_dir = disk_dir
+        self.ram_quota_bytes = ram_quota_bytes
+        self.ram_min_free_bytes = ram_min_free_bytes
+        self._active = set()
+        self._ram_reserved = 0
+        # Jobs create/release workspaces from worker threads too
+        self._lock = threading.Lock()
+        self.created = 0
+        self.cleaned = 0
+        self.disk_fallbacks = 0
+        self.peak_ram_reserved = 0
+        for base in (ram_dir, disk_dir):
+            self._remove_stale(base)
+
+    def _ram_has_room(self, needed):
+        if not os.path.isdir(os.path.dirname(self.ram_dir)):
+            return False  # No RAM disk on this system
+        if self._ram_reserved + needed > self.ram_quota_bytes:
+            return False
+        return shutil.disk_usage(os.path.dirname(self.ram_dir)).free - needed >= self.ram_min_free_bytes
+
+    def workspace(self, expected_bytes=0, prefix="req_"):
+        """New unique folder; `expected_bytes` is how much it will roughly hold."""
+        with self._lock:
+            on_ram = self._ram_has_room(expected_bytes)
+            if on_ram:
+                self._ram_reserved += expected_bytes
+                self.peak_ram_reserved = max(self.peak_ram_reserved, self._ram_reserved)
+            else:
+                self.disk_fallbacks += 1
+            base = self.ram_dir if on_ram else self.disk_dir
+            os.makedirs(base, exist_ok=True)
+            workspace = Workspace(self, tempfile.mkdtemp(prefix=prefix, dir=base),
+                                  on_ram, expected_bytes if on_ram else 0)
+            self._active.add(workspace)
+            self.created += 1
+        return workspace
+
+    def release(self, workspace):
+        with self._lock:
+            if workspace.cleaned:
+                return
+            workspace.cleaned = True
+            self._active.discard(workspace)
+            self._ram_reserved -= workspace.reserved_bytes
+            self.cleaned += 1
+        shutil.rmtree(workspace.path, ignore_errors=True)
+
+    def _remove_stale(self, base):
+        if not os.path.isdir(base):
+            return
+        now = time.time()
+        for name in os.listdir(base):
+            path = os.path.join(base, name)
+            try:
+                if now - os.path.getmtime(path) > STALE_AFTER_S:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+
+    def stats(self):
+        """Scratch usage metrics (bytes are measured on disk, so call it sparingly)."""
+        with self._lock:
+            active = list(self._active)
+            reserved = self._ram_reserved
+        ram = [w for w in active if w.on_ram]
+        disk = [w for w in active if not w.on_ram]
+        ram_free = None
+        if os.path.isdir(os.path.dirname(self.ram_dir)):
+            ram_free = shutil.disk_usage(os.path.dirname(self.ram_dir)).free
+        return {
+            "active_workspaces": len(active),
+            "created": self.created,
+            "cleaned": self.cleaned,
+            "disk_fallbacks": self.disk_fallbacks,
+            "ram": {
+                "workspaces": len(ram),
+                "bytes_used": sum(w.size() for w in ram),
+                "bytes_reserved": reserved,
+                "peak_bytes_reserved": self.peak_ram_reserved,
+                "quota_bytes": self.ram_quota_bytes,
+                "free_bytes": ram_free,
+            },
+            "disk": {
+                "workspaces": len(disk),
+                "bytes_used": sum(w.size() for w in disk),
+            },
+        }
+
+
+class ScratchFileResponse(FileResponse):
+    """
+    FileResponse that deletes its workspace once sent, even if the client disconnects.
+    `reader`: task still reading the workspace (e.g. copying the result), awaited before.
+    """
+
+    def __init__(self, path, workspace, reader=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.workspace = workspace
+        self.reader = reader
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            if self.reader is not None:
+                await asyncio.gather(self.reader, return_exceptions=True)
+            self.workspace.cleanup()
@@ -9,14 +9,96 @@ const toast = m => {
   toast.t = setTimeout(() => t.classList.remove('show'), 2400);
 };
 
+/* ---------- Model choice ---------- */
+// Models the server offers; the choice applies to the next live stream / upload.
+const modelSelect = $('#modelSelect');
+
+fetch('/models').then(r => r.json()).then(({ available, default: def }) => {
+  available.forEach(name => modelSelect.add(new Option(name, name, false, name === def)));
+}).catch(() => toast('Cannot list the models'));
+
+// Query string of the chosen model ('' until the list is loaded)
+const modelQuery = () => modelSelect.value ? `?model=${encodeURIComponent(modelSelect.value)}` : '';
+
 /* ---------- Drag‑&‑drop upload ---------- */
 const up = $('#uploader');
 
+/* ---------- Streaming video detection ---------- */
+// The server answers /detect/stream with a fragmented H.264 MP4.
+const MP4_CODEC = 'video/mp4; codecs="avc1.42E01E"';
+
+// Append one chunk to a SourceBuffer and wait until it is processed.
+function appendChunk(buffer, chunk){
+  return new Promise((resolve, reject) => {
+    buffer.addEventListener('updateend', resolve, { once: true });
+    buffer.addEventListener('error', reject, { once: true });
+    buffer.appendBuffer(chunk);
+  });
+}
+
+// Upload a video and play the annotated result while it is still being processed.
+async function streamVideo(file){
+  const loader = document.getElementById('loader');
+
+  // Remove old preview video
+  document.querySelectorAll('#fileCard img, #fileCard video')
+  .forEach(el => el.remove());
+  loader.style.display = 'block';
+  toast('Uploading…');
+
+  let resp;
+  try {
+    resp = await fetch('/detect/stream' + modelQuery(), {
+      method: 'POST',
+      headers: { 'Content-Type': file.type || 'application/octet-stream' },
+      body: file
+    });
+  } catch {
+    loader.style.display = 'none';
+    toast('Upload failed');
+    return;
+  }
+
+  if (!resp.ok || !(resp.headers.get('content-type') || '').startsWith('video/')){
+    loader.style.display = 'none';
+    toast(`Error: ${resp.ok ? 'Cannot open video file' : resp.statusText}`);
+    return;
+  }
+
+  const vid = document.createElement('video');
+  vid.controls = true; vid.autoplay = true; vid.muted = true;
+  document.getElementById('fileCard').appendChild(vid);
+
+  if (window.MediaSource && MediaSource.isTypeSupported(MP4_CODEC)){
+    // Play fragments as soon as they arrive
+    const source = new MediaSource();
+    vid.src = URL.createObjectURL(source);
+    await new Promise(r => source.addEventListener('sourceopen', r, { once: true }));
+    const buffer = source.addSourceBuffer(MP4_CODEC);
+    const reader = resp.body.getReader();
+    loader.style.display = 'none';
+    for (;;){
+      const { done, value } = await reader.read();
+      if (done) break;
+      await appendChunk(buffer, value);
+    }
+    source.endOfStream();
+  } else {
+    // No MediaSource support: wait for the whole file
+    vid.src = URL.createObjectURL(await resp.blob());
+    loader.style.display = 'none';
+  }
+  toast('Detection done');
+}
+
 function sendFile(file){
+  // Videos are streamed, images still use the simple /detect route
+  if (file.type.startsWith('video/')) return streamVideo(file);
+
   const xhr = new XMLHttpRequest();
   const loader = document.getElementById('loader');
 
-  xhr.open('POST','/detect',true);
+  xhr.open('POST','/detect' + modelQuery(),true);
   xhr.responseType = 'blob';
 
   // Remove old preview video
@@ -114,9 +196,10 @@ startBtn.addEventListener('click', async () => {
   const resp = await fetch('/offer', {
     method: 'POST',
     headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(offer)
+    body: JSON.stringify({ sdp: offer.sdp, type: offer.type, model: modelSelect.value || null })
   });
   const answer = await resp.json();
+  if (!resp.ok) { toast(`Error: ${answer.error}`); return; }
   await pc.setRemoteDescription(answer);
 });
 
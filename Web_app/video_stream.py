@@ -0,0 +1,217 @@
+# Streaming video detection used by `/detect/stream`.
+#
+# Instead of reading the whole upload in memory, writing an AVI and running a
+# second ffmpeg pass, the video goes through one chain of processes:
+#
+#   upload chunks -> ffmpeg decoder -> model -> ffmpeg H.264 encoder -> response
+#
+# - every upload chunk is written to a spool file AND fed to the decoder,
+#   so frames are decoded and inferred while the upload is still arriving;
+# - inputs that ffmpeg can't decode from a pipe (e.g. MP4 with its index at the
+#   end of the file) are decoded from the spool file once the upload finished;
+# - the encoder writes a fragmented MP4 that is streamed to the client as soon
+#   as the first fragment is ready.
+# Memory stays bounded by the pipe buffers, whatever the size of the video.
+import asyncio
+import time
+
+import cv2
+import numpy as np
+
+
+FFMPEG = "ffmpeg"
+# Bytes read/written per step (upload and response)
+CHUNK_SIZE = 256 * 1024
+MP4_MEDIA_TYPE = "video/mp4"
+
+
+class VideoDecodeError(Exception):
+    """Raised when the uploaded data can't be decoded as a video."""
+
+
+def _decoder_args(source):
+    # Only the pipe decoder reads stdin
+    stdin_flag = [] if source == "pipe:0" else ["-nostdin"]
+    return [
+        FFMPEG, "-loglevel", "error", *stdin_flag,
+        "-i", source,
+        # H.264 / yuv420p need even dimensions
+        "-vf", "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+        "-f", "yuv4mpegpipe", "-pix_fmt", "yuv420p", "pipe:1",
+    ]
+
+
+def _encoder_args(width, height, fps):
+    return [
+        FFMPEG, "-loglevel", "error",
+        "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps:.3f}",
+        "-i", "pipe:0",
+        "-c:v", "libx264", "-profile:v", "baseline", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+        # Fragmented MP4: playable while it is being written, no second pass
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-f", "mp4", "pipe:1",
+    ]
+
+
+class Y4MReader:
+    """Reads raw yuv420p frames from an ffmpeg `yuv4mpegpipe` output."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.width = self.height = 0
+        self.fps = 25.0
+
+    async def read_header(self):
+        """Returns False if the decoder exited without producing a video."""
+        line = await self.stream.readline()
+        if not line.startswith(b"YUV4MPEG2"):
+            return False
+        for field in line.split()[1:]:
+            key, value = field[:1], field[1:].decode()
+            if key == b"W":
+                self.width = int(value)
+            elif key == b"H":
+                self.height = int(value)
+            elif key == b"F":
+                num, den = value.split(":")
+                if int(den):
+                    self.fps = int(num) / int(den)
+        return self.width > 0 and self.height > 0
+
+    async def read_frame(self):
+        """Next frame as an (H * 3/2, W) I420 array, or None at the end."""
+        line = await self.stream.readline()
+        if not line.startswith(b"FRAME"):
+            return None
+        try:
+            data = await self.stream.readexactly(self.width * self.height * 3 // 2)
+        except asyncio.IncompleteReadError:
+            return None
+        return np.frombuffer(data, np.uint8).reshape(self.height * 3 // 2, self.width)
+
+
+async def _start(args, stdin):
+    return await asyncio.create_subprocess_exec(
+        *args, stdin=stdin, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+    )
+
+
+def _kill(process):
+    if process is not None and process.returncode is None:
+        process.kill()
+
+
+async def _spool_and_feed(chunks, spool_path, decoder):
+    """Write each upload chunk to the spool file, and to the decoder while it accepts input."""
+    feeding = True
+    try:
+        with open(spool_path, "wb") as spool:
+            async for chunk in chunks:
+                await asyncio.to_thread(spool.write, chunk)
+                if not feeding:
+                    continue
+                try:
+                    decoder.stdin.write(chunk)
+                    await decoder.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The decoder gave up (not streamable): keep spooling only.
+                    feeding = False
+    finally:
+        # End of upload (or client gone): let the decoder finish.
+        if feeding:
+            decoder.stdin.close()
+
+
+class StreamingDetection:
+    """One streaming `/detect` request: decoder, encoder and cleanup."""
+
+    def __init__(self, annotate, workspace):
+        # annotate(frame_bgr) -> annotated frame_bgr (runs in a worker thread)
+        self.annotate = annotate
+        # Scratch folder for the upload spool, deleted by `close()` (see scratch.py)
+        self.workspace = workspace
+        self.spool_path = workspace.file("upload")
+        self.decoder = None
+        self.encoder = None
+        self.feeder = None
+        self.frames = 0
+
+    async def open(self, chunks):
+        """Start decoding `chunks` (async iterable of bytes). Raises VideoDecodeError."""
+        try:
+            self.decoder = await _start(_decoder_args("pipe:0"), asyncio.subprocess.PIPE)
+            self.feeder = asyncio.create_task(_spool_and_feed(chunks, self.spool_path, self.decoder))
+            self.reader = Y4MReader(self.decoder.stdout)
+            if await self.reader.read_header():
+                return
+
+            # Not decodable from a pipe: wait for the full upload, then decode the file.
+            await self.feeder
+            _kill(self.decoder)
+            self.decoder = await _start(_decoder_args(self.spool_path), asyncio.subprocess.DEVNULL)
+            self.reader = Y4MReader(self.decoder.stdout)
+            if not await self.reader.read_header():
+                raise VideoDecodeError("Cannot open video file")
+        except BaseException:
+            await self.close()
+            raise
+
+    async def _encode_frames(self):
+        prev_frame_time = time.time()
+        try:
+            while True:
+                yuv = await self.reader.read_frame()
+                if yuv is None:
+                    break
+                annotated = await asyncio.to_thread(self._annotate_yuv, yuv)
+
+                # Same FPS overlay as the non-streaming path
+                new_frame_time = time.time()
+                fps = 1 / max(new_frame_time - prev_frame_time, 1e-6)
+                prev_frame_time = new_frame_time
+                cv2.putText(annotated, f"FPS: {fps:.0f}", (20, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+
+                self.encoder.stdin.write(memoryview(annotated).cast("B"))
+                await self.encoder.stdin.drain()
+                self.frames += 1
+        finally:
+            self.encoder.stdin.close()
+
+    def _annotate_yuv(self, yuv):
+        frame = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
+        annotated = self.annotate(frame)
+        if annotated.shape[:2] != frame.shape[:2]:
+            annotated = cv2.resize(annotated, (frame.shape[1], frame.shape[0]))
+        return annotated
+
+    async def body(self):
+        """Async generator of fragmented MP4 bytes (use it as a StreamingResponse body)."""
+        try:
+            self.encoder = await _start(
+                _encoder_args(self.reader.width, self.reader.height, self.reader.fps),
+                asyncio.subprocess.PIPE,
+            )
+            writer = asyncio.create_task(self._encode_frames())
+            try:
+                while True:
+                    chunk = await self.encoder.stdout.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+                await writer
+            finally:
+                writer.cancel()
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Stop the ffmpeg processes and delete the workspace (safe to call twice)."""
+        if self.feeder is not None and not self.feeder.done():
+            self.feeder.cancel()
+            await asyncio.gather(self.feeder, return_exceptions=True)
+        for process in (self.decoder, self.encoder):
+            _kill(process)
+            if process is not None:
+                await process.wait()
+        self.workspace.cleanup()
@@ -38,6 +38,45 @@ function updateStats(payload) {
   }
 }
 
+// Client-side overlay (overlay = "client" in stream.toml): the server sends the
+// raw frame, prefixed with its 4-byte frame id, and the detections in the
+// stats message of the same frame id. Boxes and labels are drawn here.
+const pendingStats = new Map();  // frame id -> stats with detections
+const labels = {};               // class id -> label (sent when new labels appear)
+const BOX_COLOR = '#00ff00';
+let frameInterval = null;        // smoothed time between frames (ms), for the FPS
+let lastFrameTime = null;
+
+function drawDetections(stats) {
+  // Detections are in frame pixels: scale them to the canvas.
+  const sx = canvas.width / stats.size[0];
+  const sy = canvas.height / stats.size[1];
+  ctx.strokeStyle = BOX_COLOR;
+  ctx.fillStyle = BOX_COLOR;
+  ctx.lineWidth = 2;
+  ctx.font = '14px sans-serif';
+  for (const [x1, y1, x2, y2, classId, score] of stats.detections) {
+    ctx.strokeRect(x1 * sx, y1 * sy, (x2 - x1) * sx, (y2 - y1) * sy);
+    const text = `${labels[classId] ?? classId} ${score.toFixed(2)}`;
+    ctx.fillText(text, x1 * sx, Math.max(y1 * sy - 5, 12));
+  }
+}
+
+function drawFps() {
+  // Moving average of the frame interval, like the server-side FPS overlay.
+  const now = performance.now();
+  if (lastFrameTime !== null) {
+    const interval = now - lastFrameTime;
+    frameInterval = frameInterval === null ? interval : frameInterval + 0.1 * (interval - frameInterval);
+  }
+  lastFrameTime = now;
+  if (frameInterval) {
+    ctx.fillStyle = BOX_COLOR;
+    ctx.font = 'bold 20px sans-serif';
+    ctx.fillText(`FPS: ${Math.round(1000 / frameInterval)}`, 20, 30);
+  }
+}
+
 // Reset displayed stats when stream is closed/stopped.
 function resetStats() {
   personsNowEl.textContent = '0';
@@ -52,6 +91,8 @@ startBtn.addEventListener('click', () => {
 
   // Start each session with fresh counters.
   resetStats();
+  pendingStats.clear();
+  frameInterval = lastFrameTime = null;
 
   // Open a WebSocket connection to the server
   socket = new WebSocket("ws://" + location.host + "/ws");
@@ -74,6 +115,10 @@ startBtn.addEventListener('click', () => {
         const payload = JSON.parse(event.data);
         if (payload.type === 'stats') {
           updateStats(payload);
+          Object.assign(labels, payload.labels || {});
+          if (payload.detections) {
+            pendingStats.set(payload.frame_id, payload);
+          }
         }
       } catch {
         // Ignore malformed text messages.
@@ -82,8 +127,24 @@ startBtn.addEventListener('click', () => {
     }
 
     // Non-text message is a video frame blob.
-    const bitmap = await createImageBitmap(event.data); // Decode image
+    let image = event.data;
+    let frameStats = null;
+    if (pendingStats.size) {
+      // Client-side overlay: the frame id comes first, then the image.
+      const frameId = new DataView(await image.slice(0, 4).arrayBuffer()).getUint32(0);
+      frameStats = pendingStats.get(frameId);
+      // Stats of this frame and of frames that never arrived are no longer needed.
+      for (const id of pendingStats.keys()) {
+        if (id <= frameId) pendingStats.delete(id);
+      }
+      image = image.slice(4);
+    }
+    const bitmap = await createImageBitmap(image); // Decode image
     ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height); // Draw on canvas
+    if (frameStats) {
+      drawDetections(frameStats);
+      drawFps();
+    }
   };
 
   // Keep all stop/reset UI logic centralized in one close handler.
@@ -0,0 +1,4 @@
+# Shared streaming engine of the HTTP, WebSocket, Webcam and raspberry_PI5_hailo_web_app servers.
+#
+# Modules are imported directly (e.g. `from stream_engine.app import create_app`)
+# so that `python -m stream_engine.<module>` demos and benchmarks run cleanly.
@@ -0,0 +1,226 @@
+# People counting analytics: enter/exit events stored on disk, aggregated on demand.
+#
+# The "tracker" step reports the tracks it creates (enter) and drops (exit) to
+# an `AnalyticsSession`, one per run of the stream. Events go through a queue to
+# a writer thread that appends them to SQLite (WAL mode) in batches, so the
+# frame loop never waits for the disk and readers (the query API) never block
+# the writer. In memory there are only the tracks currently inside.
+#
+# Table `events`: ts (time.time()), app, session (start time of the stream run),
+# track (tracker ID, unique within a session), kind (1 = enter, 0 = exit),
+# occupancy (tracks inside after the event). An exit is stamped with the time
+# the track was last seen, not when the tracker gave up on it (`max_misses`
+# frames later).
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+
+ANALYTICS_DEFAULTS = {
+    "enabled": False,
+    # SQLite file, relative to the config file
+    "path": "analytics.db",
+    # Pending events are written at least this often (s), or when `batch` are waiting
+    "flush_s": 1.0,
+    "batch": 500,
+    # Events not written yet above which new ones are dropped (disk too slow)
+    "max_pending": 100_000,
+    # Older events are deleted (0 = keep everything)
+    "retention_days": 30,
+}
+
+INTERVALS = {"minute": 60, "hour": 3600}
+# Aggregates returned when no `since` is given: the last hour by minute, the last day by hour
+DEFAULT_SPANS = {"minute": 3600, "hour": 86400}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts REAL NOT NULL,
+    app TEXT NOT NULL,
+    session REAL NOT NULL,
+    track INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    occupancy INTEGER NOT NULL
+);
+-- Covers the aggregate queries (no table lookups)
+CREATE INDEX IF NOT EXISTS events_app_ts ON events (app, ts, kind, occupancy);
+"""
+_INSERT = "INSERT INTO events (ts, app, session, track, kind, occupancy) VALUES (?, ?, ?, ?, ?, ?)"
+ENTER, EXIT = 1, 0
+# Sent through the queue to stop the writer
+_STOP = object()
+
+
+class AnalyticsStore:
+    """Append-only event store of one app, with its writer thread."""
+
+    def __init__(self, path, app, flush_s=1.0, batch=500, max_pending=100_000, retention_days=30):
+        self.path = str(path)
+        self.app = app
+        self.flush_s = flush_s
+        self.batch = batch
+        self.max_pending = max_pending
+        self.retention_days = retention_days
+        self.written = 0
+        self.dropped = 0
+        self.sessions = 0
+        # Session of the running stream, if any (for the live occupancy)
+        self.current = None
+        self._queue = queue.SimpleQueue()
+        with closing(self._connect()) as db:
+            # Stays in WAL mode: readers don't block the writer (and the other way round)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name="analytics-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10.0)
+
+    def _query(self, sql, params):
+        # A connection per query: the API handlers run in different threads
+        with closing(self._connect()) as db:
+            return db.execute(sql, params).fetchall()
+
+    def session(self):
+        """Recorder for a new run of the stream."""
+        self.sessions += 1
+        self.current = AnalyticsSession(self)
+        return self.current
+
+    def put(self, event):
+        # Called from the frame loop: never blocks
+        if self._queue.qsize() >= self.max_pending:
+            self.dropped += 1
+            return
+        self._queue.put(event)
+
+    @property
+    def pending(self):
+        return self._queue.qsize()
+
+    def _write_loop(self):
+        db = self._connect()
+        # Fsync at checkpoints only: safe with WAL, a crash loses at most the last batches
+        db.execute("PRAGMA synchronous=NORMAL")
+        rows = []
+        flush_at = time.monotonic() + self.flush_s
+        cleanup_at = 0.0
+        stopping = False
+        while not stopping:
+            try:
+                event = self._queue.get(timeout=max(flush_at - time.monotonic(), 0.0))
+                if event is _STOP:
+                    stopping = True
+                else:
+                    rows.append(event)
+            except queue.Empty:
+                pass
+            if rows and (stopping or len(rows) >= self.batch or time.monotonic() >= flush_at):
+                try:
+                    with db:  # One transaction per batch
+                        db.executemany(_INSERT, rows)
+                    self.written += len(rows)
+                except sqlite3.Error as exc:
+                    print(f"⚠️  Analytics: cannot write {len(rows)} events: {exc}")
+                    self.dropped += len(rows)
+                rows = []
+            if time.monotonic() >= flush_at:
+                flush_at = time.monotonic() + self.flush_s
+            if self.retention_days and time.monotonic() >= cleanup_at:
+                cleanup_at = time.monotonic() + 3600
+                try:
+                    with db:
+                        db.execute("DELETE FROM events WHERE app = ? AND ts < ?",
+                                   (self.app, time.time() - self.retention_days * 86400))
+                except sqlite3.Error as exc:
+                    print(f"⚠️  Analytics: cannot delete old events: {exc}")
+        db.close()
+
+    def counts(self, interval="minute", since=None, until=None):
+        """
+        Enters, exits and peak occupancy per minute or hour, oldest first.
+        Only intervals with events are listed (the occupancy didn't change in the others).
+        """
+        seconds = INTERVALS[interval]
+        until = time.time() if until is None else until
+        since = until - DEFAULT_SPANS[interval] if since is None else since
+        rows = self._query(
+            "SELECT CAST(ts / ? AS INTEGER) * ? AS start, SUM(kind = ?), SUM(kind = ?), MAX(occupancy) "
+            "FROM events WHERE app = ? AND ts >= ? AND ts < ? GROUP BY start ORDER BY start",
+            (seconds, seconds, ENTER, EXIT, self.app, since, until),
+        )
+        return [
+            {"start": start, "enters": enters, "exits": exits, "occupancy_max": occupancy}
+            for start, enters, exits, occupancy in rows
+        ]
+
+    def occupancy(self):
+        """Tracks inside now (live), and the people counted in the last hour and day."""
+        now = time.time()
+        entered = {
+            span: self._query("SELECT COUNT(*) FROM events WHERE app = ? AND kind = ? AND ts >= ?",
+                              (self.app, ENTER, now - seconds))[0][0]
+            for span, seconds in (("last_hour", 3600), ("last_day", 86400))
+        }
+        current = self.current
+        return {
+            "occupancy": current.occupancy if current is not None and not current.closed else 0,
+            "session": current.started if current is not None else None,
+            # Written events only (at most `flush_s` behind)
+            "entered": entered,
+        }
+
+    def stats(self):
+        return {"written": self.written, "pending": self.pending, "dropped": self.dropped,
+                "sessions": self.sessions}
+
+    def close(self):
+        """Write what is pending and stop the writer thread."""
+        if self.current is not None:
+            self.current.close()
+        self._queue.put(_STOP)
+        self._writer.join()
+
+
+class AnalyticsSession:
+    """Enter/exit events of one run of the stream (track IDs restart with it)."""
+
+    def __init__(self, store):
+        self.store = store
+        self.started = time.time()
+        # Tracks inside (entered, not exited yet) -> time last seen: bounded by the
+        # tracker's active tracks
+        self.inside = {}
+        self.closed = False
+
+    @property
+    def occupancy(self):
+        return len(self.inside)
+
+    def record(self, entered, exited, seen=()):
+        """Track IDs created, dropped and seen (matched or created) by one tracker update."""
+        if self.closed:
+            return
+        now = time.time()
+        for track in exited:
+            track = int(track)
+            if track in self.inside:
+                last_seen = self.inside.pop(track)
+                self.store.put((last_seen, self.store.app, self.started, track, EXIT, len(self.inside)))
+        for track in entered:
+            track = int(track)
+            self.inside[track] = now
+            self.store.put((now, self.store.app, self.started, track, ENTER, len(self.inside)))
+        for track in seen.tolist() if hasattr(seen, "tolist") else seen:
+            if track in self.inside:
+                self.inside[track] = now
+
+    def close(self):
+        """The stream stopped: everyone still tracked leaves."""
+        if self.closed:
+            return
+        self.record([], sorted(self.inside))
+        self.closed = True
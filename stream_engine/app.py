@@ -0,0 +1,81 @@
+# FastAPI app factory: what each server script's `main.py` calls.
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from fastapi import FastAPI, Request
+from fastapi.responses import HTMLResponse, JSONResponse, Response
+
+from .analytics import INTERVALS
+from .config import load_config
+from .engine import StreamEngine
+from .backends import load_model
+from .metrics import CONTENT_TYPE
+from .transports import index_page, mount_transports
+
+
+def create_app(app_name, base_dir=None, model=None, config_path=None):
+    """
+    Build the app described by the [apps.<app_name>] config section.
+
+    - base_dir: folder of the calling script (for `template` and its static/ folder)
+    - model: use this model instead of loading the one from the config
+    """
+    config = load_config(app_name, config_path)
+    if model is None:
+        model = load_model(config["model"])
+    engine = StreamEngine(config, model)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        yield
+        await engine.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.engine = engine
+
+    if config["template"]:
+        from fastapi.staticfiles import StaticFiles
+        from fastapi.templating import Jinja2Templates
+
+        template = Path(base_dir or ".") / config["template"]
+        templates = Jinja2Templates(directory=str(template.parent))
+        static_dir = template.parent / "static"
+        if static_dir.is_dir():
+            app.mount("/static", StaticFiles(directory=str(static_dir)), name="static")
+
+        @app.get("/", response_class=HTMLResponse)
+        def index(request: Request):
+            return templates.TemplateResponse(request, template.name)
+    else:
+        page = index_page(config)
+
+        @app.get("/", response_class=HTMLResponse)
+        def index():
+            return page
+
+    mount_transports(app, engine, config)
+
+    # Subscriber counts, per-viewer drop counters and stage timings
+    @app.get("/viewers")
+    def viewers():
+        return engine.stats()
+
+    # Stage latency histograms, queue depths, drops and connections for Prometheus
+    @app.get("/metrics")
+    def metrics():
+        return Response(engine.metrics.render(), media_type=CONTENT_TYPE)
+
+    if engine.analytics is not None:
+        # Enter/exit counts of the tracker, from the analytics store (see analytics.py)
+        @app.get("/analytics/occupancy")
+        def occupancy():
+            return engine.analytics.occupancy()
+
+        @app.get("/analytics/counts")
+        def counts(interval: str = "minute", since: float | None = None, until: float | None = None):
+            """Per-minute or per-hour enters, exits and peak occupancy; `since`/`until` are Unix times."""
+            if interval not in INTERVALS:
+                return JSONResponse({"error": f"interval must be one of {sorted(INTERVALS)}"}, status_code=400)
+            return {"interval": interval, "counts": engine.analytics.counts(interval, since, until)}
+
+    return app
@@ -0,0 +1,228 @@
+# Inference backends: the real DeGirum/Hailo model, or a simulator.
+#
+# Everything downstream (pipeline, tracker, encoders, transports) only needs a
+# model with this small interface:
+#   model(frame) -> result            result.image, .image_overlay, .results
+#   model.predict_batch(frames)       yields one result per frame, in order
+#   model.label_dictionary            {class_id: label}
+#
+# `DeGirumBackend` is the Hailo model loaded from the zoo. `SimulatedBackend`
+# returns deterministic detections (recorded JSON or moving synthetic boxes)
+# with a configurable latency, so the servers can be started, load-tested and
+# sized on any machine. Pick one with `backend` in [model] (or the
+# INFERENCE_BACKEND environment variable).
+import json
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from .recording import read_detections
+
+
+BOX_COLOR = (0, 255, 0)
+
+SIMULATOR_DEFAULTS = {
+    # Time for one frame on the simulated accelerator, plus random jitter (ms)
+    "latency_ms": 25.0,
+    "jitter_ms": 0.0,
+    # Frames the accelerator works on at the same time (pipeline depth)
+    "parallel": 1,
+    # Time to load the model (ms), like fetching it from the zoo onto the chip
+    "load_ms": 0.0,
+    # Recorded `inf_result.results` (JSON list, one entry per frame), replayed in a loop;
+    # empty = synthetic boxes
+    "detections": "",
+    # Synthetic boxes: how many, which labels, random seed
+    "objects": 5,
+    "labels": ["person"],
+    "seed": 0,
+}
+
+
+class DeGirumBackend:
+    """DeGirum PySDK model (Hailo accelerator, local or remote AI server)."""
+
+    def __init__(self, cfg):
+        import degirum as dg  # Only needed for the real hardware
+
+        self.model = dg.load_model(
+            model_name=cfg["name"],
+            inference_host_address=cfg["inference_host_address"],
+            zoo_url=cfg["zoo_url"],
+            token=cfg["token"],
+            device_type=cfg["device_type"],
+        )
+
+    def __call__(self, frame):
+        return self.model(frame)
+
+    def predict_batch(self, frames):
+        return self.model.predict_batch(frames)
+
+    def __getattr__(self, name):
+        # Everything else (label_dictionary, overlay settings...) comes from the model.
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+def draw_detections(image, detections):
+    """
+    Draw boxes and labels (in place), roughly like DeGirum's `image_overlay`.
+    Entries without a 4-value bbox (classification, malformed results) are skipped.
+    """
+    for det in detections if isinstance(detections, list) else []:
+        bbox = det.get("bbox") if isinstance(det, dict) else None
+        if not isinstance(bbox, (list, tuple)) or len(bbox) != 4:
+            continue
+        x1, y1, x2, y2 = (int(v) for v in bbox)
+        cv2.rectangle(image, (x1, y1), (x2, y2), BOX_COLOR, 2)
+        label = f"{det.get('label', '')} {det.get('score', 0):.2f}".strip()
+        cv2.putText(image, label, (x1, max(y1 - 5, 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, BOX_COLOR, 1, cv2.LINE_AA)
+    return image
+
+
+class SimulatedResult:
+    """Look-alike of a DeGirum inference result."""
+
+    def __init__(self, image, results):
+        self.image = image
+        self.results = results
+
+    @property
+    def image_overlay(self):
+        # Like the real property: a new annotated image each time.
+        return draw_detections(self.image.copy(), self.results)
+
+
+class SyntheticDetections:
+    """Boxes moving in straight lines and bouncing off the edges; frame k is always the same."""
+
+    def __init__(self, objects=5, labels=("person",), seed=0):
+        rng = np.random.default_rng(seed)
+        self.labels = list(labels)
+        self.label_dictionary = dict(enumerate(self.labels))
+        # Normalized (0..1) center, size and speed (per frame) of each object
+        self.sizes = rng.uniform(0.08, 0.25, (objects, 2))
+        self.start = rng.uniform(0, 1, (objects, 2))
+        self.speed = rng.uniform(-0.01, 0.01, (objects, 2))
+        self.scores = rng.uniform(0.5, 0.99, objects).round(3)
+
+    def __call__(self, index, width, height):
+        # Triangle wave keeps the centers inside [0, 1]
+        pos = (self.start + self.speed * index) % 2.0
+        centers = np.where(pos > 1.0, 2.0 - pos, pos)
+        half = self.sizes / 2
+        x1y1 = np.clip(centers - half, 0, 1) * (width, height)
+        x2y2 = np.clip(centers + half, 0, 1) * (width, height)
+        return [
+            {
+                "bbox": [round(float(v), 1) for v in (*x1y1[i], *x2y2[i])],
+                "score": float(self.scores[i]),
+                "label": self.labels[i % len(self.labels)],
+                "category_id": i % len(self.labels),
+            }
+            for i in range(len(self.scores))
+        ]
+
+
+class RecordedDetections:
+    """Replays recorded `inf_result.results` lists in a loop (JSON file or recording)."""
+
+    def __init__(self, path):
+        if str(path).endswith(".json"):
+            with open(path) as f:
+                self.frames = json.load(f)
+        else:
+            # Detections stored in a recording (python -m stream_engine.recording record --detections)
+            self.frames = read_detections(path)
+        if not isinstance(self.frames, list) or not self.frames:
+            raise ValueError(f"{path}: expected a JSON list with one entry per frame, or a recording with detections")
+
+    @property
+    def label_dictionary(self):
+        labels = {}
+        for frame in self.frames:
+            for det in frame if isinstance(frame, list) else []:
+                if det.get("label", "") not in labels.values():
+                    labels[det.get("category_id", len(labels))] = det.get("label", "")
+        return labels
+
+    def __call__(self, index, width, height):
+        return list(self.frames[index % len(self.frames)])
+
+
+class SimulatedBackend:
+    """
+    Deterministic stand-in for the Hailo model.
+
+    Each call takes `latency_ms` (+/- `jitter_ms`); at most `parallel` frames
+    are "on the accelerator" at once, so throughput is capped at
+    parallel / latency like on the real chip. Frame N always gets the same
+    detections, whoever asks for it.
+    """
+
+    def __init__(self, cfg=None):
+        cfg = {**SIMULATOR_DEFAULTS, **(cfg or {})}
+        if cfg["load_ms"]:
+            time.sleep(cfg["load_ms"] / 1000.0)
+        self.latency = cfg["latency_ms"] / 1000.0
+        self.jitter = cfg["jitter_ms"] / 1000.0
+        self.parallel = max(1, int(cfg["parallel"]))
+        if cfg["detections"]:
+            self.source = RecordedDetections(cfg["detections"])
+        else:
+            self.source = SyntheticDetections(cfg["objects"], cfg["labels"], cfg["seed"])
+        self.label_dictionary = self.source.label_dictionary
+        self._rng = np.random.default_rng(cfg["seed"])
+        self._slots = threading.Semaphore(self.parallel)
+        self._lock = threading.Lock()
+        self.frames = 0
+
+    def _next(self):
+        with self._lock:
+            index = self.frames
+            self.frames += 1
+            jitter = self._rng.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return index, max(self.latency + jitter, 0.0)
+
+    def _result(self, index, frame):
+        # Frames replayed from a recording get the detections recorded for them
+        recorded_index = getattr(frame, "frame_index", None)
+        if recorded_index is not None:
+            index = recorded_index
+        height, width = frame.shape[:2]
+        return SimulatedResult(frame, self.source(index, width, height))
+
+    def __call__(self, frame):
+        index, latency = self._next()
+        with self._slots:
+            time.sleep(latency)
+        return self._result(index, frame)
+
+    def predict_batch(self, frames):
+        # Frames are pipelined: the first one takes the full latency,
+        # the next ones come out every latency / parallel.
+        with self._slots:
+            for position, frame in enumerate(frames):
+                index, latency = self._next()
+                time.sleep(latency if position == 0 else latency / self.parallel)
+                yield self._result(index, frame)
+
+
+BACKENDS = {
+    "degirum": lambda cfg: DeGirumBackend(cfg),
+    "simulator": lambda cfg: SimulatedBackend(cfg.get("simulator")),
+}
+
+
+def load_model(cfg):
+    """Model from a [model] config section; $INFERENCE_BACKEND overrides its `backend`."""
+    backend = os.environ.get("INFERENCE_BACKEND") or cfg.get("backend", "degirum")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](cfg)
@@ -0,0 +1,127 @@
+# Benchmark of detection-result parsing (no camera or Hailo chip needed).
+#
+# Compares the original per-dict filtering (`_extract_person_centers` before
+# the columnar parser) with `parse_detections` + a vectorized mask, on
+# recorded result payloads or on synthetic ones.
+#
+#   python -m stream_engine.bench_detections
+#   python -m stream_engine.bench_detections --payloads recorded.json
+#
+# A recording is a JSON list with one entry per frame, each entry being the
+# `inf_result.results` value of that frame (e.g. saved with
+# `json.dump([inf.results for inf in results], f)`).
+import argparse
+import json
+import time
+
+import numpy as np
+
+from stream_engine.detections import LabelMap, parse_detections
+
+COCO_LABELS = ["person", "bicycle", "car", "motorcycle", "bus", "truck", "dog", "backpack"]
+PERSON_LABEL = "person"
+MIN_PERSON_SCORE = 0.30
+
+
+class Result:
+    """Holds one frame's `results` like a DeGirum inference result."""
+
+    def __init__(self, results):
+        self.results = results
+
+
+def synthetic_payloads(frames, detections, person_share=0.5, seed=0):
+    """Per-frame result lists in the DeGirum format; `person_share` of them are people."""
+    rng = np.random.default_rng(seed)
+    payloads = []
+    for _ in range(frames):
+        frame = []
+        for _ in range(detections):
+            x1, y1 = rng.uniform(0, 600), rng.uniform(0, 440)
+            is_person = rng.random() < person_share
+            class_id = 0 if is_person else int(rng.integers(1, len(COCO_LABELS)))
+            frame.append({
+                "bbox": [x1, y1, x1 + rng.uniform(5, 40), y1 + rng.uniform(5, 40)],
+                "category_id": class_id,
+                "label": COCO_LABELS[class_id],
+                "score": float(rng.uniform(0.1, 1.0)),
+            })
+        payloads.append(frame)
+    return payloads
+
+
+def legacy_extract_person_centers(inf_result):
+    """The original implementation, kept as the baseline."""
+    detections = getattr(inf_result, "results", [])
+    if isinstance(detections, str):
+        try:
+            detections = json.loads(detections)
+        except json.JSONDecodeError:
+            return []
+    if not isinstance(detections, list):
+        return []
+    person_centers = []
+    for det in detections:
+        if not isinstance(det, dict):
+            continue
+        label = str(det.get("label", "")).strip().lower()
+        score = float(det.get("score", 0.0))
+        bbox = det.get("bbox")
+        if label != PERSON_LABEL or score < MIN_PERSON_SCORE:
+            continue
+        if not isinstance(bbox, (list, tuple)) or len(bbox) != 4:
+            continue
+        try:
+            x1, y1, x2, y2 = [float(v) for v in bbox]
+        except (TypeError, ValueError):
+            continue
+        person_centers.append(((x1 + x2) / 2.0, (y1 + y2) / 2.0))
+    return person_centers
+
+
+def columnar_extract_person_centers(inf_result, label_map, person_ids):
+    detections = parse_detections(inf_result, label_map)
+    return detections.centers()[detections.mask(person_ids, MIN_PERSON_SCORE)]
+
+
+def timed(fn, results):
+    start = time.perf_counter()
+    for result in results:
+        fn(result)
+    return (time.perf_counter() - start) / len(results) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detection parsing benchmark")
+    parser.add_argument("--payloads", help="JSON file with recorded per-frame results")
+    parser.add_argument("--frames", type=int, default=500)
+    parser.add_argument("--detections", type=int, nargs="+", default=[5, 50, 300])
+    parser.add_argument("--person-share", type=float, nargs="+", default=[0.1, 0.5, 1.0])
+    args = parser.parse_args()
+
+    if args.payloads:
+        with open(args.payloads) as f:
+            datasets = [("recorded", json.load(f))]
+    else:
+        datasets = [
+            (f"{n} dets {share:.0%} ppl", synthetic_payloads(args.frames, n, share))
+            for n in args.detections
+            for share in args.person_share
+        ]
+
+    label_map = LabelMap({i: label for i, label in enumerate(COCO_LABELS)})
+    person_ids = label_map.ids_for([PERSON_LABEL])
+
+    print(f"{'payload':>20} {'format':>6} {'legacy us/frame':>16} {'columnar us/frame':>18}")
+    for name, payloads in datasets:
+        for fmt, results in (
+            ("list", [Result(p) for p in payloads]),
+            ("json", [Result(json.dumps(p)) for p in payloads]),
+        ):
+            legacy_us = timed(legacy_extract_person_centers, results)
+            columnar_us = timed(lambda r: columnar_extract_person_centers(r, label_map, person_ids), results)
+            print(f"{name:>20} {fmt:>6} {legacy_us:>16.1f} {columnar_us:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
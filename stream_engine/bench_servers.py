@@ -0,0 +1,432 @@
+# End-to-end benchmark of the streaming servers (run from the repo root).
+#
+# Starts each server with uvicorn, connects N concurrent clients for a fixed
+# time, and measures what the clients actually receive:
+#
+#   http       HTTP/ MJPEG /video_feed            frames, latency from X-Timestamp
+#   websocket  WebSocket/ /ws                     frames, latency from the stats message
+#   raspberry  raspberry_PI5_hailo_web_app/ /ws   frames + stats, latency from the stats message
+#   web_app    Web_app/ POST /detect              requests (image or video upload), round-trip time
+#
+# Reports throughput, latency percentiles, bytes received, and the CPU / RSS of
+# the server process (and its children, e.g. ffmpeg) as JSON. The simulator
+# backend is used unless --backend degirum is given, so it runs on any machine.
+#
+#   python -m stream_engine.bench_servers
+#   python -m stream_engine.bench_servers --servers http raspberry --clients 1 4 8 --output run.json
+#   python -m stream_engine.bench_servers --baseline run.json   # exit code 1 on regression
+#
+# Needs `httpx` and `websockets` (pip install httpx websockets). CPU and RSS are
+# read from /proc (Linux).
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from stream_engine.config import CONFIG_PATH, ROOT_DIR, _read
+
+try:
+    import httpx
+    import websockets
+except ImportError:
+    sys.exit("bench_servers needs httpx and websockets: pip install httpx websockets")
+
+
+SAMPLE_VIDEO = ROOT_DIR / "Ressources" / "example_640.mp4"
+SERVERS = {
+    "http": {"folder": "HTTP", "client": "mjpeg"},
+    "websocket": {"folder": "WebSocket", "client": "websocket"},
+    # Its camera is replaced by a sample video so it runs without hardware
+    "raspberry": {"folder": "raspberry_PI5_hailo_web_app", "client": "websocket",
+                  "source": {"type": "file", "path": str(SAMPLE_VIDEO)}},
+    "web_app": {"folder": "Web_app", "client": "detect"},
+}
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+# Accepted slowdown before --baseline reports a regression
+TOLERANCE = 0.10
+
+
+# ---------------------------------------------------------------- server side
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _bench_config(backend):
+    """stream.toml with looping sources (the run length is set by --duration) and stats on /ws."""
+    data = _read(os.environ.get("STREAM_CONFIG") or CONFIG_PATH)
+    data.setdefault("model", {})["backend"] = backend
+    for name, app in data.get("apps", {}).items():
+        source = dict(SERVERS.get(name, {}).get("source") or app.get("source", {}))
+        if source.get("path") and not os.path.isabs(source["path"]):
+            source["path"] = str(ROOT_DIR / source["path"])
+        if source.get("type") in ("file", "images"):
+            source["loop"] = True
+        if source.get("type") == "file":
+            # Throughput is bounded by the servers, not by the video's frame rate
+            source["realtime"] = False
+        app["source"] = source
+        # Every frame then carries its capture time
+        app["websocket"] = {**app.get("websocket", {}), "send_stats": True}
+    return data
+
+
+def _children(pid):
+    """Pids of all processes started (directly or not) by `pid`."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces: fields start after the last ")"
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    found, todo = [], [pid]
+    while todo:
+        parent = todo.pop()
+        kids = [p for p, pp in parents.items() if pp == parent]
+        found += kids
+        todo += kids
+    return found
+
+
+def _cpu_and_rss(pids):
+    """(CPU seconds used so far, resident bytes) summed over `pids`."""
+    cpu = rss = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            with open(f"/proc/{pid}/statm") as f:
+                rss += int(f.read().split()[1]) * PAGE_SIZE
+            cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS  # utime + stime
+        except (OSError, IndexError, ValueError):
+            pass  # Process ended meanwhile
+    return cpu, rss
+
+
+class ResourceSampler:
+    """Samples CPU and RSS of the server process tree every `interval` seconds."""
+
+    def __init__(self, pid, interval=0.5):
+        self.pid = pid
+        self.interval = interval
+        self.rss = []
+        self._start = None
+        self._end = None
+
+    async def run(self):
+        self._start = (time.perf_counter(), _cpu_and_rss([self.pid, *_children(self.pid)])[0])
+        while True:
+            await asyncio.sleep(self.interval)
+            cpu, rss = _cpu_and_rss([self.pid, *_children(self.pid)])
+            self._end = (time.perf_counter(), cpu)
+            self.rss.append(rss)
+
+    def result(self):
+        if not self._end:
+            return {"cpu_percent": None, "rss_mb_avg": None, "rss_mb_max": None}
+        elapsed = self._end[0] - self._start[0]
+        return {
+            # 100% = one full core
+            "cpu_percent": round(100 * (self._end[1] - self._start[1]) / elapsed, 1),
+            "rss_mb_avg": round(float(np.mean(self.rss)) / 2**20, 1),
+            "rss_mb_max": round(max(self.rss) / 2**20, 1),
+        }
+
+
+async def start_server(name, config_path, backend, port, log):
+    env = {**os.environ, "STREAM_CONFIG": str(config_path), "INFERENCE_BACKEND": backend,
+           # The same file is uploaded every time: with Web_app's result cache on, /detect
+           # would only measure cache hits (and fill Web_app/detect_cache/)
+           "DETECT_CACHE_MB": "0"}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT_DIR / SERVERS[name]["folder"], env=env,
+        stdout=log, stderr=subprocess.STDOUT,
+    )
+    # Ready once it answers HTTP (any status)
+    async with httpx.AsyncClient() as client:
+        for _ in range(600):
+            if process.poll() is not None:
+                raise RuntimeError(f"{name} server exited, see {log.name}")
+            try:
+                await client.get(f"http://127.0.0.1:{port}/openapi.json", timeout=1)
+                return process
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{name} server did not start")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+# ---------------------------------------------------------------- client side
+
+class ClientStats:
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.latencies = []
+        self.errors = 0
+
+    def frame(self, size, captured_at=None):
+        self.frames += 1
+        self.bytes += size
+        if captured_at:
+            self.latencies.append((time.time() - captured_at) * 1000)
+
+
+async def mjpeg_client(base, stats, stop):
+    async with httpx.AsyncClient(timeout=30) as client:
+        async with client.stream("GET", f"{base}/video_feed") as response:
+            buffer = b""
+            async for chunk in response.aiter_bytes():
+                if stop.is_set():
+                    return
+                buffer += chunk
+                # A part is complete when the next boundary arrived
+                while True:
+                    start = buffer.find(b"--frame\r\n")
+                    end = buffer.find(b"--frame\r\n", start + 1)
+                    if start < 0 or end < 0:
+                        break
+                    part, buffer = buffer[start:end], buffer[end:]
+                    headers = part.split(b"\r\n\r\n", 1)[0]
+                    captured_at = None
+                    for line in headers.split(b"\r\n"):
+                        if line.lower().startswith(b"x-timestamp:"):
+                            captured_at = float(line.split(b":", 1)[1])
+                    stats.frame(len(part), captured_at)
+
+
+async def websocket_client(base, stats, stop):
+    async with websockets.connect(base.replace("http", "ws", 1) + "/ws", max_size=None) as ws:
+        captured_at = None
+        while not stop.is_set():
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout=1)
+            except asyncio.TimeoutError:
+                continue
+            if isinstance(message, str):
+                # Stats message of the next frame
+                captured_at = json.loads(message).get("captured_at")
+                stats.bytes += len(message)
+            else:
+                stats.frame(len(message), captured_at)
+                captured_at = None
+
+
+async def detect_client(base, stats, stop, upload):
+    filename, data, media_type = upload
+    async with httpx.AsyncClient(timeout=300) as client:
+        while not stop.is_set():
+            start = time.time()
+            response = await client.post(f"{base}/detect", files={"file": (filename, data, media_type)})
+            if response.status_code != 200 or not response.headers.get("content-type", "").startswith(("image", "video")):
+                stats.errors += 1
+                continue
+            stats.frame(len(response.content), start)
+
+
+def detect_upload(kind):
+    """(filename, bytes, media type) uploaded to /detect: a frame of the sample video, or the video."""
+    if kind == "video":
+        return SAMPLE_VIDEO.name, SAMPLE_VIDEO.read_bytes(), "video/mp4"
+    import cv2
+
+    cap = cv2.VideoCapture(str(SAMPLE_VIDEO))
+    ok, frame = cap.read()
+    cap.release()
+    if not ok:
+        sys.exit(f"Cannot read {SAMPLE_VIDEO}")
+    return "frame.jpg", cv2.imencode(".jpg", frame)[1].tobytes(), "image/jpeg"
+
+
+async def run_clients(name, base, clients, duration, warmup, upload):
+    kind = SERVERS[name]["client"]
+    per_client = [ClientStats() for _ in range(clients)]
+    stop = asyncio.Event()
+
+    async def client(stats):
+        try:
+            if kind == "mjpeg":
+                await mjpeg_client(base, stats, stop)
+            elif kind == "websocket":
+                await websocket_client(base, stats, stop)
+            else:
+                await detect_client(base, stats, stop, upload)
+        except Exception as exc:
+            if not stop.is_set():
+                stats.errors += 1
+                print(f"⚠️  {name} client error: {exc!r}")
+
+    tasks = [asyncio.create_task(client(stats)) for stats in per_client]
+    # Warm-up (source opening, first inferences) is not measured
+    await asyncio.sleep(warmup)
+    for stats in per_client:
+        stats.__init__()
+    start = time.perf_counter()
+    await asyncio.sleep(duration)
+    stop.set()
+    elapsed = time.perf_counter() - start
+    snapshot = [(s.frames, s.bytes, list(s.latencies), s.errors) for s in per_client]
+    # Long requests (video uploads) are not waited for
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return snapshot, elapsed
+
+
+def summarize(snapshot, elapsed):
+    frames = [s[0] for s in snapshot]
+    latencies = np.array([lat for s in snapshot for lat in s[2]], dtype=np.float64)
+    total_bytes = sum(s[1] for s in snapshot)
+
+    def pct(q):
+        return round(float(np.percentile(latencies, q)), 2) if latencies.size else None
+
+    return {
+        "frames": sum(frames),
+        "throughput_fps": round(sum(frames) / elapsed, 2),
+        "fps_per_client_min": round(min(frames) / elapsed, 2),
+        "fps_per_client_avg": round(float(np.mean(frames)) / elapsed, 2),
+        "latency_ms": {
+            "p50": pct(50), "p90": pct(90), "p99": pct(99),
+            "max": round(float(latencies.max()), 2) if latencies.size else None,
+        },
+        "bytes": total_bytes,
+        "mbit_per_s": round(total_bytes * 8 / elapsed / 1e6, 2),
+        "errors": sum(s[3] for s in snapshot),
+    }
+
+
+async def bench_server(name, client_counts, args, workdir):
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    upload = detect_upload(args.detect_upload) if SERVERS[name]["client"] == "detect" else None
+    log = open(workdir / f"{name}.log", "wb")
+    process = await start_server(name, workdir / "bench_stream.json", args.backend, port, log)
+    results = []
+    try:
+        for clients in client_counts:
+            if process.poll() is not None:
+                log.flush()
+                print(f"❌ {name} server exited ({process.returncode}):\n{Path(log.name).read_text()[-2000:]}")
+                break
+            sampler = ResourceSampler(process.pid)
+            sampling = asyncio.create_task(sampler.run())
+            snapshot, elapsed = await run_clients(name, base, clients, args.duration, args.warmup, upload)
+            sampling.cancel()
+            result = {"server": name, "clients": clients, "duration_s": round(elapsed, 2),
+                      **summarize(snapshot, elapsed), **sampler.result()}
+            results.append(result)
+            print(f"{name:10s} clients={clients:<3d} {result['throughput_fps']:8.1f} fps  "
+                  f"p50={result['latency_ms']['p50']} ms  p99={result['latency_ms']['p99']} ms  "
+                  f"cpu={result['cpu_percent']}%  rss={result['rss_mb_max']} MB  errors={result['errors']}")
+            # Let the server release the source before the next round
+            await asyncio.sleep(1)
+    finally:
+        stop_server(process)
+        log.close()
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    """Regressions against a previous run: lower throughput or higher p90 latency."""
+    with open(baseline_path) as f:
+        baseline = {(r["server"], r["clients"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        old = baseline.get((result["server"], result["clients"]))
+        if old is None:
+            continue
+        key = f"{result['server']} clients={result['clients']}"
+        if result["throughput_fps"] < old["throughput_fps"] * (1 - tolerance):
+            regressions.append(f"{key}: throughput {old['throughput_fps']} -> {result['throughput_fps']} fps")
+        old_p90, new_p90 = old["latency_ms"]["p90"], result["latency_ms"]["p90"]
+        if old_p90 and new_p90 and new_p90 > old_p90 * (1 + tolerance):
+            regressions.append(f"{key}: p90 latency {old_p90} -> {new_p90} ms")
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        # Generated config and server logs
+        workdir = Path(tmp)
+        (workdir / "bench_stream.json").write_text(json.dumps(_bench_config(args.backend)))
+        results = []
+        for name in args.servers:
+            results += await bench_server(name, args.clients, args, workdir)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "machine": platform.machine(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "backend": args.backend,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "detect_upload": args.detect_upload,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for line in regressions:
+            print(f"⚠️  Regression: {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--servers", nargs="+", choices=sorted(SERVERS), default=list(SERVERS))
+    parser.add_argument("--clients", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per round")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before each round")
+    parser.add_argument("--backend", choices=["simulator", "degirum"], default="simulator")
+    parser.add_argument("--detect-upload", choices=["image", "video"], default="image",
+                        help="what web_app clients upload to /detect")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="previous JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,93 @@
+# Microbenchmark for the person tracker (no camera or Hailo chip needed).
+#
+# Feeds synthetic detection sequences (people walking randomly across a
+# 1920x1080 frame, some leaving and new ones entering) to the original greedy
+# loop and to `CentroidTracker`, and prints the time per frame for each.
+#
+#   python -m stream_engine.bench_tracker
+#   python -m stream_engine.bench_tracker --people 50 200 500 --frames 300
+import argparse
+import math
+import time
+
+import numpy as np
+
+from stream_engine.tracker import MAX_MATCH_DISTANCE_PX, MAX_TRACK_MISSES, CentroidTracker
+
+
+def synthetic_sequence(people, frames, width=1920, height=1080, seed=0):
+    """List of (N, 2) center arrays: random walkers, ~1% replaced every frame."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform((0, 0), (width, height), size=(people, 2))
+    sequence = []
+    for _ in range(frames):
+        positions += rng.normal(0, 6, size=positions.shape)
+        # Some people leave the scene and new ones appear elsewhere.
+        replaced = rng.random(people) < 0.01
+        positions[replaced] = rng.uniform((0, 0), (width, height), size=(int(replaced.sum()), 2))
+        np.clip(positions, 0, (width, height), out=positions)
+        # The detector misses ~5% of people on each frame.
+        visible = rng.random(people) > 0.05
+        sequence.append(positions[visible].copy())
+    return sequence
+
+
+class GreedyTracker:
+    """The original dict-of-dicts greedy loop, kept here as the baseline."""
+
+    def __init__(self):
+        self.tracks = {}
+        self.next_track_id = 0
+
+    def update(self, person_centers):
+        unmatched_track_ids = set(self.tracks.keys())
+        assigned = []
+        for center in map(tuple, person_centers):
+            best_track_id = None
+            best_distance = float("inf")
+            for track_id in unmatched_track_ids:
+                distance = math.dist(center, self.tracks[track_id]["center"])
+                if distance < best_distance and distance <= MAX_MATCH_DISTANCE_PX:
+                    best_track_id = track_id
+                    best_distance = distance
+            if best_track_id is None:
+                best_track_id = self.next_track_id
+                self.next_track_id += 1
+                self.tracks[best_track_id] = {"center": center, "misses": 0}
+            else:
+                self.tracks[best_track_id]["center"] = center
+                self.tracks[best_track_id]["misses"] = 0
+                unmatched_track_ids.remove(best_track_id)
+            assigned.append(best_track_id)
+        for track_id in unmatched_track_ids:
+            self.tracks[track_id]["misses"] += 1
+            if self.tracks[track_id]["misses"] > MAX_TRACK_MISSES:
+                del self.tracks[track_id]
+        return assigned
+
+
+def run(tracker, sequence):
+    start = time.perf_counter()
+    for centers in sequence:
+        tracker.update(centers)
+    return (time.perf_counter() - start) / len(sequence) * 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tracker microbenchmark")
+    parser.add_argument("--people", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--frames", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'people':>7} {'greedy ms/frame':>16} {'numpy ms/frame':>15} {'unique (greedy/numpy)':>22}")
+    for people in args.people:
+        sequence = synthetic_sequence(people, args.frames)
+        greedy, vectorized = GreedyTracker(), CentroidTracker()
+        greedy_ms = run(greedy, sequence)
+        numpy_ms = run(vectorized, sequence)
+        print(f"{people:>7} {greedy_ms:>16.2f} {numpy_ms:>15.2f} "
+              f"{greedy.next_track_id:>11}/{vectorized.unique_count:<10}")
+
+
+if __name__ == "__main__":
+    main()
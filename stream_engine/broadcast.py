@@ -0,0 +1,141 @@
+# One camera, one inference loop, many viewers.
+#
+# `SharedProducer` opens the camera and runs the capture/inference loop ONCE,
+# no matter how many browsers are connected. Every encoded frame is published
+# to a `BroadcastHub`, which hands it to each `Subscriber`. A subscriber only
+# keeps the latest frame, so a slow client skips frames instead of stalling
+# the camera or the other viewers.
+import asyncio
+import itertools
+
+from .pipeline import END_OF_STREAM
+
+
+class Subscriber:
+    """One viewer's mailbox: holds only the newest (payload, stats) item."""
+
+    def __init__(self, subscriber_id):
+        self.id = subscriber_id
+        self._latest = None
+        self._ready = asyncio.Event()
+        self.delivered = 0
+        self.dropped = 0
+
+    def offer(self, item):
+        # Replace an item the client did not pick up yet (drop-to-latest).
+        if self._latest is not None and self._latest is not END_OF_STREAM:
+            self.dropped += 1
+        self._latest = item
+        self._ready.set()
+
+    async def get(self):
+        """Wait for the next item; returns END_OF_STREAM when the producer stops."""
+        await self._ready.wait()
+        self._ready.clear()
+        item, self._latest = self._latest, None
+        if item is not END_OF_STREAM:
+            self.delivered += 1
+        return item
+
+
+class BroadcastHub:
+    """Fans out every published frame to all current subscribers."""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._ids = itertools.count()
+        self.frames_published = 0
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = Subscriber(next(self._ids))
+        self._subscribers[subscriber.id] = subscriber
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.pop(subscriber.id, None)
+
+    async def publish(self, payload, stats=None):
+        # Async so it can be used directly as the `send` stage of a FramePipeline.
+        self.frames_published += 1
+        for subscriber in self._subscribers.values():
+            subscriber.offer((payload, stats))
+
+    def close(self):
+        """Tell every subscriber that the stream ended."""
+        for subscriber in self._subscribers.values():
+            subscriber.offer(END_OF_STREAM)
+
+    def stats(self):
+        return {
+            "subscribers": self.subscriber_count,
+            "frames_published": self.frames_published,
+            "per_subscriber": [
+                {"id": s.id, "delivered": s.delivered, "dropped": s.dropped}
+                for s in self._subscribers.values()
+            ],
+        }
+
+
+class SharedProducer:
+    """
+    Owns the camera and the inference loop for all viewers.
+
+    - open_source(): returns an opened capture object, or None if unavailable
+    - run_stream(cap, publish): coroutine running capture + inference and
+      calling `await publish(payload, stats)` for each frame
+
+    Started by the first subscriber and stopped when the last one leaves,
+    so the camera is only busy while someone is watching.
+    """
+
+    def __init__(self, hub, open_source, run_stream):
+        self.hub = hub
+        self.open_source = open_source
+        self.run_stream = run_stream
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def subscribe(self):
+        """Join the stream (starting it if needed). Returns None if the camera can't be opened."""
+        async with self._lock:
+            if not self.running:
+                cap = await asyncio.to_thread(self.open_source)
+                if cap is None:
+                    return None
+                self._task = asyncio.create_task(self._run(cap))
+            return self.hub.subscribe()
+
+    async def unsubscribe(self, subscriber):
+        async with self._lock:
+            self.hub.unsubscribe(subscriber)
+            if self.hub.subscriber_count == 0 and self.running:
+                # Nobody is watching anymore: stop the loop and release the camera.
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+                self._task = None
+
+    async def stop(self):
+        """Stop the loop whoever is still watching (server shutdown)."""
+        async with self._lock:
+            if self.running:
+                self._task.cancel()
+                await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, cap):
+        try:
+            await self.run_stream(cap, self.hub.publish)
+        except Exception as exc:
+            print(f"⚠️  Producer stopped: {exc}")
+        finally:
+            # Always release the camera and wake up the viewers.
+            cap.release()
+            self.hub.close()
@@ -0,0 +1,105 @@
+# Settings of the stream apps, read from one TOML (or JSON) file.
+#
+# The file has shared sections ([model], [pipeline], [encode], ...) and one
+# [apps.<name>] section per server script. An app section only lists what
+# differs for that app (source, transports, post-processing...); everything
+# else comes from the shared sections, then from DEFAULTS below.
+import copy
+import json
+import os
+from pathlib import Path
+
+from .analytics import ANALYTICS_DEFAULTS
+from .encoding import ADAPTIVE_DEFAULTS
+from .motion import MOTION_DEFAULTS
+from .tiling import TILING_DEFAULTS
+
+try:
+    import tomllib  # Python 3.11+
+except ImportError:
+    tomllib = None
+
+
+# Repo root: `stream.toml` lives next to the app folders
+ROOT_DIR = Path(__file__).resolve().parent.parent
+CONFIG_PATH = ROOT_DIR / "stream.toml"
+
+DEFAULTS = {
+    "model": {
+        # "degirum" (Hailo) or "simulator" (see backends.py)
+        "backend": "degirum",
+        "name": "yolo11n_coco--640x640_quant_hailort_multidevice_1",
+        "inference_host_address": "@local",
+        "zoo_url": "degirum/hailo",
+        "token": "",
+        "device_type": "HAILORT/HAILO8L",
+    },
+    "source": {"type": "camera", "index": 0, "width": 640, "height": 480},
+    # frame_buffers: preallocated frames the source reads into (0 = a new array per frame);
+    # shared_memory: keep them in one shared-memory block (see framebuf.py);
+    # workers: processes drawing and encoding the frames (0 = in the server process, see workers.py)
+    "pipeline": {"queue_size": 2, "frame_buffers": 16, "shared_memory": False, "workers": 0},
+    # scale: output size relative to the source frame;
+    # adaptive: per-client quality ladder for WebSocket viewers (see encoding.py)
+    "encode": {"format": "jpeg", "quality": 95, "scale": 1.0, "adaptive": ADAPTIVE_DEFAULTS},
+    "transports": ["websocket"],
+    "postprocess": ["overlay", "fps"],
+    # "server": boxes drawn on the frame; "client": raw frame + detections in the
+    # stats message, drawn by the browser (WebSocket pages)
+    "overlay": "server",
+    "title": "AI Video Stream",
+    # Jinja2 template (relative to the app folder) used instead of the built-in page
+    "template": None,
+    "websocket": {"path": "/ws", "send_stats": False},
+    # buffer_frames: frames kept for slow MJPEG clients before they skip ahead
+    "mjpeg": {"path": "/video_feed", "buffer_frames": 8},
+    "webrtc": {"path": "/offer"},
+    "fps": {"position": [20, 30], "scale": 0.8, "smoothing": 0.1},
+    "tracker": {"label": "person", "min_score": 0.30, "max_distance_px": 90, "max_misses": 45},
+    # Enter/exit events of the tracker stored in SQLite, GET /analytics/... (see analytics.py)
+    "analytics": ANALYTICS_DEFAULTS,
+    # Skip inference while the scene doesn't change, reuse the last detections (see motion.py)
+    "motion": MOTION_DEFAULTS,
+    # Large frames cut into overlapping model-sized tiles, inferred as one batch (see tiling.py)
+    "tiling": TILING_DEFAULTS,
+}
+
+
+def _merge(base, override):
+    """Recursive dict update that returns a new dict."""
+    merged = copy.deepcopy(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _read(path):
+    path = Path(path)
+    if path.suffix == ".json":
+        return json.loads(path.read_text())
+    if tomllib is None:
+        raise RuntimeError("Reading TOML needs Python 3.11+, use a .json config instead")
+    with open(path, "rb") as f:
+        return tomllib.load(f)
+
+
+def load_config(app_name, path=None):
+    """
+    Settings of one app. The file is `path`, else $STREAM_CONFIG, else stream.toml.
+    Relative paths in the source and analytics settings are resolved from the file's folder.
+    """
+    path = Path(path or os.environ.get("STREAM_CONFIG") or CONFIG_PATH)
+    data = _read(path)
+    apps = data.pop("apps", {})
+    if app_name not in apps:
+        raise ValueError(f"No [apps.{app_name}] section in {path}")
+
+    config = _merge(_merge(DEFAULTS, data), apps[app_name])
+    for section in (config["source"], config["analytics"]):
+        if section.get("path") and not os.path.isabs(section["path"]):
+            section["path"] = str((path.parent / section["path"]).resolve())
+    config["name"] = app_name
+    return config
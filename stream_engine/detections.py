@@ -0,0 +1,175 @@
+# Columnar parsing of DeGirum detection results.
+#
+# Turns `inf_result.results` (a list of dicts, or a JSON string of it) into
+# three NumPy arrays in one pass: boxes (N, 4), scores (N,) and class_ids (N,).
+# Filtering by class and score then becomes a vectorized mask, and label text
+# is normalized once per distinct label instead of once per detection.
+import json
+from itertools import chain
+from operator import itemgetter
+
+import numpy as np
+
+
+# C-level accessors for the fields read from each detection dict
+_BBOX = itemgetter("bbox")
+_SCORE = itemgetter("score")
+_LABEL = itemgetter("label")
+
+
+def _normalize(label):
+    # Avoid case/spacing mismatches between the model labels and our settings.
+    return str(label).strip().lower()
+
+
+class LabelMap:
+    """Label text -> class id mapping, built once when the model is loaded."""
+
+    def __init__(self, labels=None):
+        # normalized label -> id
+        self._ids = {}
+        # raw label exactly as the model writes it -> id (cache, skips normalization)
+        self._raw_ids = {}
+        # id -> label as first seen, for display
+        self._names = {}
+        for class_id, label in (labels or {}).items():
+            self._ids.setdefault(_normalize(label), int(class_id))
+            self._names.setdefault(int(class_id), str(label))
+
+    @classmethod
+    def from_model(cls, model):
+        """Use the model's own label dictionary ({id: label}) when it has one."""
+        try:
+            labels = model.label_dictionary
+        except Exception:
+            labels = None
+        return cls(labels if isinstance(labels, dict) else None)
+
+    def id_of(self, label):
+        """Class id of a label; labels the model did not declare get a new id."""
+        class_id = self._raw_ids.get(label)
+        if class_id is None:
+            key = _normalize(label)
+            class_id = self._ids.get(key)
+            if class_id is None:
+                class_id = max(self._ids.values(), default=-1) + 1
+                self._ids[key] = class_id
+                self._names[class_id] = str(label)
+            self._raw_ids[label] = class_id
+        return class_id
+
+    def ids_of(self, labels):
+        """Class ids of a sequence of labels (one cached dict lookup per label)."""
+        try:
+            return np.fromiter(map(self._raw_ids.__getitem__, labels), dtype=np.int32, count=len(labels))
+        except KeyError:
+            # A label seen for the first time: normalize and cache it.
+            return np.array([self.id_of(label) for label in labels], dtype=np.int32)
+
+    def names(self):
+        """{class id: label} of every label known so far."""
+        return dict(self._names)
+
+    def ids_for(self, labels):
+        """Array of class ids for a list of label names (any class set)."""
+        return np.array([self.id_of(label) for label in labels], dtype=np.int32)
+
+
+class Detections:
+    """Detections of one frame stored as columns."""
+
+    def __init__(self, boxes, scores, class_ids):
+        self.boxes = boxes          # (N, 4) float32: x1, y1, x2, y2
+        self.scores = scores        # (N,) float32
+        self.class_ids = class_ids  # (N,) int32
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty((0, 4), dtype=np.float32),
+            np.empty(0, dtype=np.float32),
+            np.empty(0, dtype=np.int32),
+        )
+
+    def mask(self, class_ids=None, min_score=0.0):
+        """Boolean mask of detections in `class_ids` (all if None) with score >= min_score."""
+        keep = self.scores >= min_score
+        if class_ids is not None:
+            # Small class sets: broadcasting compare is much cheaper than np.isin.
+            keep &= (self.class_ids[:, None] == np.asarray(class_ids)[None, :]).any(axis=1)
+        return keep
+
+    def select(self, class_ids=None, min_score=0.0):
+        keep = self.mask(class_ids, min_score)
+        return Detections(self.boxes[keep], self.scores[keep], self.class_ids[keep])
+
+    def centers(self):
+        """(N, 2) bbox centers, used as tracking points."""
+        return (self.boxes[:, :2] + self.boxes[:, 2:]) / 2.0
+
+
+def _raw_results(inf_result):
+    # Depending on postprocessor configuration, results can be a list or a JSON string.
+    detections = getattr(inf_result, "results", [])
+    if isinstance(detections, str):
+        try:
+            detections = json.loads(detections)
+        except json.JSONDecodeError:
+            # Fail safe: malformed payload means no detections for this frame.
+            return []
+    if not isinstance(detections, list):
+        return []
+    return detections
+
+
+def _parse_checked(detections, label_map):
+    """Slow path: validate every detection, skipping malformed ones."""
+    boxes, scores, class_ids = [], [], []
+    for det in detections:
+        if not isinstance(det, dict):
+            continue
+        bbox = det.get("bbox")
+        # Expected bbox format: [x1, y1, x2, y2].
+        if not isinstance(bbox, (list, tuple)) or len(bbox) != 4:
+            continue
+        try:
+            box = [float(v) for v in bbox]
+            score = float(det.get("score", 0.0))
+            # Unhashable labels (a list or dict) can't be looked up: TypeError
+            class_id = label_map.id_of(det.get("label", ""))
+        except (TypeError, ValueError):
+            continue
+        boxes.append(box)
+        scores.append(score)
+        class_ids.append(class_id)
+    if not boxes:
+        return Detections.empty()
+    return Detections(
+        np.array(boxes, dtype=np.float32),
+        np.array(scores, dtype=np.float32),
+        np.array(class_ids, dtype=np.int32),
+    )
+
+
+def parse_detections(inf_result, label_map):
+    """Convert an inference result into a `Detections` object."""
+    detections = _raw_results(inf_result)
+    count = len(detections)
+    if not count:
+        return Detections.empty()
+    try:
+        # Fast path: C-level field access, then one array conversion per column.
+        bboxes = list(map(_BBOX, detections))
+        # Expected bbox format: [x1, y1, x2, y2].
+        if set(map(len, bboxes)) != {4}:
+            raise ValueError("bbox must have 4 values")
+        boxes = np.fromiter(chain.from_iterable(bboxes), dtype=np.float32, count=4 * count)
+        scores = np.fromiter(map(_SCORE, detections), dtype=np.float32, count=count)
+        class_ids = label_map.ids_of(list(map(_LABEL, detections)))
+    except (KeyError, TypeError, ValueError):
+        # Malformed entries (missing fields, wrong bbox length, non-numeric values...).
+        return _parse_checked(detections, label_map)
+    return Detections(boxes.reshape(count, 4), scores, class_ids)
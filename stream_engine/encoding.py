@@ -0,0 +1,125 @@
+# Image encoding of the published frames, and per-client adaptive quality.
+#
+# The pipeline encodes every frame once with the [encode] settings (format,
+# quality, scale) and all viewers share those bytes. With [encode.adaptive]
+# enabled, each WebSocket client also gets an `AdaptiveQuality` controller:
+# when its sends start to block (the socket buffer backs up) or the hub drops
+# frames for it, it moves down a ladder of smaller / lower quality versions;
+# when its sends are fast again for a while, it moves back up. A version is
+# encoded once per frame and shared by every client on that level, so LAN
+# viewers keep the full quality while slow remote viewers keep a usable
+# frame rate.
+import asyncio
+
+import cv2
+
+
+IMAGE_FORMATS = {
+    "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+}
+
+ADAPTIVE_DEFAULTS = {
+    "enabled": False,
+    # Versions used when a client falls behind, best first: [scale, quality]
+    "levels": [[1.0, 75], [0.75, 65], [0.5, 55], [0.35, 45]],
+    # Smoothed send time (ms) above which the client moves down a level...
+    "high_send_ms": 40.0,
+    # ... and below which it moves back up after `up_after` frames
+    "low_send_ms": 10.0,
+    "up_after": 30,
+    # Frames ignored after a change, to measure the new level
+    "cooldown": 10,
+}
+
+
+def encode_image(frame, fmt="jpeg", quality=95, scale=1.0):
+    """
+    Encode a BGR frame as JPEG or WebP, resized by `scale`.
+
+    Returns a memoryview of OpenCV's output buffer (no `.tobytes()` copy), or None.
+    """
+    ext, quality_flag, _ = IMAGE_FORMATS[fmt]
+    if scale != 1.0:
+        height, width = frame.shape[:2]
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    success, encoded = cv2.imencode(ext, frame, [quality_flag, int(quality)])
+    return memoryview(encoded).cast("B") if success else None
+
+
+async def encoded_variant(frame, fmt, scale, quality):
+    """
+    Encoded image of `frame` (an engine StreamFrame) at this scale / quality.
+
+    Encoded in a worker thread by the first client asking for it; clients on
+    the same level await the same task instead of encoding again.
+    """
+    key = (scale, quality)
+    if frame.variants is None:
+        frame.variants = {}
+    task = frame.variants.get(key)
+    if task is None:
+        task = asyncio.ensure_future(asyncio.to_thread(encode_image, frame.image, fmt, quality, scale))
+        frame.variants[key] = task
+    return await task
+
+
+class AdaptiveQuality:
+    """
+    Picks the version sent to one client from how long its sends take.
+
+    Level 0 is the shared full-quality encoding; levels 1.. come from `levels`.
+    """
+
+    def __init__(self, levels, high_send_ms=40.0, low_send_ms=10.0, up_after=30, cooldown=10, alpha=0.2):
+        self.levels = [None] + [tuple(level) for level in levels]
+        self.high_send_ms = high_send_ms
+        self.low_send_ms = low_send_ms
+        self.up_after = up_after
+        self.cooldown = cooldown
+        self.alpha = alpha
+        self.level = 0
+        self.send_ms = 0.0
+        self.changes = 0
+        self._calm = 0
+        self._skip = 0
+        # Frames sent since the last change, and current wait before moving up
+        self._frames = 0
+        self._up_after = up_after
+
+    @property
+    def setting(self):
+        """(scale, quality) of the current level, None for the shared encoding."""
+        return self.levels[self.level]
+
+    def record(self, send_seconds, dropped=0):
+        """Time of the last send, and frames the hub dropped for this client meanwhile."""
+        ms = send_seconds * 1000.0
+        self._frames += 1
+        self.send_ms = ms if self._skip else self.send_ms + self.alpha * (ms - self.send_ms)
+        if self._skip:
+            self._skip -= 1
+            return
+        # Frames dropped by the hub only count when the sends are not clearly fast
+        slow = self.send_ms > self.high_send_ms or (dropped and self.send_ms > self.low_send_ms)
+        if slow and self.level < len(self.levels) - 1:
+            self._change(self.level + 1)
+        elif not slow and self.send_ms < self.low_send_ms and self.level > 0:
+            self._calm += 1
+            if self._calm >= self._up_after:
+                self._change(self.level - 1)
+        else:
+            self._calm = 0
+
+    def _change(self, level):
+        if level > self.level and self._frames < self.up_after:
+            # Moving up just failed (the link can't carry that level): wait longer next time
+            self._up_after = min(self._up_after * 2, 16 * self.up_after)
+        elif self._frames >= 16 * self.up_after:
+            self._up_after = self.up_after
+        self._frames = 0
+        self.level = level
+        self.changes += 1
+        self._calm = 0
+        self._skip = self.cooldown
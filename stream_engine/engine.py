@@ -0,0 +1,261 @@
+# The stream engine: one source, one model, one post-processing chain, many viewers.
+#
+# `StreamEngine` ties the pieces together: the source from the config is
+# opened by the first viewer, frames go through the staged `FramePipeline`
+# (capture -> inference -> post-processing -> encode), and every processed
+# frame is published once to the `BroadcastHub` that the transports read from.
+import itertools
+
+from .analytics import AnalyticsStore
+from .broadcast import BroadcastHub, SharedProducer
+from .detections import LabelMap
+from .encoding import IMAGE_FORMATS, encode_image
+from .framebuf import FrameRing
+from .metrics import MetricsRegistry
+from .models import input_size
+from .motion import GatedModel, MotionGate
+from .pipeline import STAGES, FramePipeline
+from .postprocess import make_postprocess, postprocess_steps
+from .sources import make_source
+from .tiling import TiledModel
+from .workers import RenderPool
+
+
+# Transports that send encoded images (WebRTC encodes the raw frames itself)
+ENCODED_TRANSPORTS = {"mjpeg", "websocket"}
+
+
+class StreamFrame:
+    """One processed frame as published to the viewers."""
+
+    __slots__ = ("image", "data", "variants", "tagged")
+
+    def __init__(self, image, data):
+        self.image = image  # annotated BGR frame
+        self.data = data    # encoded image (bytes-like), None if no transport needs them
+        # (scale, quality) -> encoding task, for adaptive clients (see encoding.py)
+        self.variants = None
+        # (scale, quality) or None -> image prefixed with its frame id (overlay = "client")
+        self.tagged = None
+
+
+class StreamEngine:
+    """Shared capture/inference loop of one app, built from its config."""
+
+    def __init__(self, config, model):
+        self.config = config
+        self.model = model
+        if config["encode"]["format"] not in IMAGE_FORMATS:
+            raise ValueError(f"Unknown encode format {config['encode']['format']!r}")
+        self.media_type = IMAGE_FORMATS[config["encode"]["format"]][2]
+        # Label -> class id mapping computed once for the loaded model.
+        self.label_map = LabelMap.from_model(model)
+        self.needs_encoding = bool(ENCODED_TRANSPORTS & set(config["transports"]))
+        # Tiles of large frames batched through the model (None when disabled)
+        tiling_cfg = {**config["tiling"]}
+        if tiling_cfg.pop("enabled"):
+            tiling_cfg["tile"] = tiling_cfg["tile"] or min(input_size(config["model"]["name"]))
+            self.tiling = TiledModel(model, **tiling_cfg)
+        else:
+            self.tiling = None
+        self.hub = BroadcastHub()
+        self.producer = SharedProducer(self.hub, self.open_source, self.run_stream)
+        self.pipeline = None
+        # Motion gate of the last run of the stream (None when disabled)
+        self.motion = None
+        # Source being read (None when not streaming)
+        self.source = None
+        # Frame buffers of the open source (None when disabled or not streaming)
+        self.frame_buffers = None
+        # Worker processes drawing/encoding the frames (started with the first frame)
+        workers = config["pipeline"]["workers"]
+        self.workers = RenderPool(workers) if workers else None
+        # Enter/exit events of the tracker, kept across runs of the stream
+        analytics_cfg = {**config["analytics"]}
+        enabled = analytics_cfg.pop("enabled")
+        self.analytics = AnalyticsStore(app=config["name"], **analytics_cfg) if enabled else None
+        # name -> callable returning the stats of a transport (shown by GET /viewers)
+        self.transport_stats = {}
+        self.metrics = MetricsRegistry(app=config["name"])
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Histograms fed by the pipeline, and values read from it when /metrics is scraped."""
+        metrics = self.metrics
+        # Kept by the engine: they survive the pipeline being restarted by a new viewer
+        self.stage_histograms = {
+            stage: metrics.histogram("stream_stage_seconds", "Time spent in each pipeline stage", stage=stage)
+            for stage in STAGES
+        }
+        self.stage_histograms["latency"] = metrics.histogram(
+            "stream_frame_latency_seconds", "Time from capture to sent, per frame")
+        self.step_histograms = {
+            step: metrics.histogram("stream_postprocess_seconds", "Time spent in each post-processing step",
+                                    step=step)
+            for step in postprocess_steps(self.config)
+        }
+
+        # Pipeline counters restart with the stream (Prometheus' rate() handles counter resets)
+        def pipeline_value(read, default):
+            return lambda: read(self.pipeline) if self.pipeline is not None else default
+
+        empty = dict.fromkeys(("inference", "process", "send"), 0)
+        metrics.gauge("stream_queue_depth", "Frames waiting in front of a stage",
+                      pipeline_value(lambda p: p.queue_depths(), empty), label="queue")
+        metrics.counter("stream_frames_dropped_total", "Frames dropped in front of a busy stage",
+                        pipeline_value(lambda p: p.dropped_frames(), empty), label="queue")
+        metrics.counter("stream_frames_captured_total", "Frames read from the source",
+                        pipeline_value(lambda p: p.frames_captured, 0))
+        metrics.counter("stream_frames_sent_total", "Frames published to the viewers",
+                        lambda: self.hub.frames_published)
+        metrics.gauge("stream_viewers", "Clients reading the shared stream",
+                      lambda: self.hub.subscriber_count)
+        metrics.counter("stream_viewer_frames_dropped_total", "Frames skipped by slow viewers",
+                        lambda: sum(s["dropped"] for s in self.hub.stats()["per_subscriber"]))
+        metrics.gauge("stream_transport_clients", "Open connections per transport",
+                      lambda: {name: read().get("clients", 0) for name, read in self.transport_stats.items()},
+                      label="transport")
+        if self.analytics is not None:
+            metrics.gauge("stream_occupancy", "Tracks inside the scene now",
+                          lambda: self.analytics.occupancy()["occupancy"])
+            metrics.counter("stream_analytics_events_written_total", "Enter/exit events written to the store",
+                            lambda: self.analytics.written)
+        if self.config["motion"]["enabled"]:
+            metrics.counter("stream_inference_skipped_total", "Frames not sent to the model (still scene)",
+                            lambda: self.motion.skipped if self.motion is not None else 0)
+            metrics.gauge("stream_inference_skip_ratio", "Fraction of the frames not sent to the model",
+                          lambda: self.motion.skip_ratio if self.motion is not None else 0.0)
+        metrics.gauge("stream_frame_age_seconds", "Age of the camera frames when the pipeline takes them (smoothed)",
+                      lambda: getattr(self.source, "age_ms", 0.0) / 1000)
+        metrics.counter("stream_camera_frames_skipped_total", "Camera frames replaced by a newer one before use",
+                        lambda: getattr(self.source, "skipped", 0))
+        metrics.counter("stream_frame_buffers_reused_total", "Frames read into a preallocated buffer",
+                        lambda: self.frame_buffers.reused if self.frame_buffers is not None else 0)
+        metrics.counter("stream_frame_buffers_overflow_total", "Frames allocated because every buffer was in use",
+                        lambda: self.frame_buffers.overflows if self.frame_buffers is not None else 0)
+
+    def open_source(self):
+        """Open the configured source, or return None if it is not available."""
+        source = make_source(self.config["source"])
+        if not source.open():
+            source.release()
+            return None
+        pipeline_cfg = self.config["pipeline"]
+        if pipeline_cfg["frame_buffers"] and hasattr(source, "buffers"):
+            # Worker processes read the frames from the shared buffers instead of a copy
+            shared = pipeline_cfg["shared_memory"] or self.workers is not None
+            source.buffers = FrameRing(pipeline_cfg["frame_buffers"], shared)
+        return source
+
+    async def run_stream(self, source, publish):
+        """Capture + inference loop shared by every viewer; publishes each processed frame."""
+        # Fresh tracker / FPS state for every run of the stream
+        analytics = self.analytics.session() if self.analytics is not None else None
+        process = make_postprocess(self.config, self.label_map, self.step_histograms,
+                                   deferred=self.workers is not None, analytics=analytics)
+        encode_cfg = self.config["encode"]
+        encode_settings = (encode_cfg["format"], encode_cfg["quality"], encode_cfg["scale"])
+        frame_ids = itertools.count()
+        # The model only sees the frames where something moved
+        motion_cfg = {**self.config["motion"]}
+        self.motion = MotionGate(**motion_cfg) if motion_cfg.pop("enabled") else None
+        model = self.tiling if self.tiling is not None else self.model
+        model = GatedModel(model, self.motion) if self.motion is not None else model
+
+        def process_frame(result):
+            frame, stats = process(result)
+            stats["type"] = "stats"
+            # Matches the stats (and client-side detections) with their frame
+            stats["frame_id"] = next(frame_ids)
+            # Smoothed time spent in each pipeline stage (ms).
+            stats["stages_ms"] = pipeline.stage_timings()
+            # Number of clients currently watching the shared stream.
+            stats["viewers"] = self.hub.subscriber_count
+            return frame, stats
+
+        def encode(frame):
+            if self.workers is not None:
+                # Drawn and encoded in a worker process (this thread waits for it)
+                frame, data = self.workers.render(
+                    frame, encode_settings if self.needs_encoding else None, self.frame_buffers)
+            elif not self.needs_encoding:
+                return StreamFrame(frame, None)
+            else:
+                data = encode_image(frame, *encode_settings)
+            # Skip this frame if encoding fails
+            return StreamFrame(frame, data) if data is not None or not self.needs_encoding else None
+
+        # Capture, inference, post-processing and encode run concurrently,
+        # so the Hailo chip works on the next frame while the current one is encoded.
+        pipeline = FramePipeline(
+            read_frame=source.read,
+            model=model,
+            process=process_frame,
+            encode=encode,
+            send=publish,
+            queue_size=self.config["pipeline"]["queue_size"],
+            histograms=self.stage_histograms,
+            # One frame per worker process in flight, sent in capture order
+            encoders=self.workers.processes if self.workers is not None else 1,
+            # Cameras report when the frame was captured, not when it was read
+            frame_time=(lambda: source.frame_time) if hasattr(source, "frame_time") else None,
+        )
+        self.pipeline = pipeline
+        self.source = source
+        self.frame_buffers = getattr(source, "buffers", None)
+
+        print(f"✅  {self.config['source']['type'].capitalize()} source opened, starting stream...")
+        try:
+            await pipeline.run()
+        finally:
+            # run() only returns once the last read is done, and a reader thread
+            # is stopped here: nothing writes to the buffers anymore
+            if hasattr(source, "stop"):
+                source.stop()
+            self.source = None
+            if self.frame_buffers is not None:
+                self.frame_buffers.close()
+                self.frame_buffers = None
+            if analytics is not None:
+                analytics.close()
+
+    async def subscribe(self):
+        """Join the shared stream (starts it for the first viewer). None if the source failed."""
+        return await self.producer.subscribe()
+
+    async def unsubscribe(self, subscriber):
+        # The source is released when the last viewer leaves
+        await self.producer.unsubscribe(subscriber)
+
+    async def close(self):
+        """Stop the stream, the worker processes, then write the pending analytics (server shutdown)."""
+        # The stream first: closing its analytics session queues the exits of
+        # the tracks still inside, before the store's writer stops
+        await self.producer.stop()
+        if self.workers is not None:
+            self.workers.shutdown()
+        if self.analytics is not None:
+            self.analytics.close()
+
+    def stats(self):
+        stats = self.hub.stats()
+        if self.pipeline is not None:
+            stats["stages_ms"] = self.pipeline.stage_timings()
+            stats["dropped_frames"] = self.pipeline.dropped_frames()
+            # Smoothed capture -> sent time (ms)
+            stats["latency_ms"] = round(self.pipeline.latency.avg_ms, 2)
+        if self.motion is not None:
+            stats["motion"] = self.motion.stats()
+        if self.tiling is not None:
+            stats["tiling"] = self.tiling.stats()
+        if hasattr(self.source, "stats"):
+            stats["source"] = self.source.stats()
+        if self.frame_buffers is not None:
+            stats["frame_buffers"] = self.frame_buffers.stats()
+        if self.workers is not None:
+            stats["workers"] = self.workers.stats()
+        if self.analytics is not None:
+            stats["analytics"] = self.analytics.stats()
+        for name, transport_stats in self.transport_stats.items():
+            stats[name] = transport_stats()
+        return stats
@@ -0,0 +1,173 @@
+# Preallocated frame buffers reused by the capture stage.
+#
+# `cap.read()` normally allocates a new frame every time (640x480 BGR = 900 KB,
+# 30 times a second). `FrameRing` keeps a fixed set of buffers of the source's
+# frame size, and OpenCV decodes straight into a free one (`cap.read(buffer)`).
+# A buffer is free again once nothing references it anymore (dropped by a
+# queue, sent, replaced by the next frame), so memory stays flat over
+# multi-hour streams and the allocator / GC have nothing to do per frame.
+#
+# With `shared = true`, all buffers live in one memory-mapped file in /dev/shm
+# that worker processes can map too (`FrameRing.attach`) and read zero-copy.
+import mmap
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+
+# References to a free buffer: the ring's list and getrefcount's own argument
+_FREE_REFS = 2
+# References to the flat mapped array under a free shared slot: the slot's `.base`,
+# the local variable and getrefcount's argument
+_FREE_BASE_REFS = 3
+# RAM-backed on Linux; elsewhere the page cache keeps the mapped file in memory anyway
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class FrameRing:
+    """
+    `slots` reusable frame buffers; shape and dtype are taken from the first frame.
+
+    - acquire(): a free buffer to read into, or None (then the reader allocates)
+    - adopt(frame, buffer): tell the ring what the reader returned (sizes the buffers)
+    """
+
+    def __init__(self, slots=16, shared=False):
+        self.slots = slots
+        self.shared = shared
+        self.shape = None
+        self.dtype = None
+        # Mapped file of the shared buffers
+        self.path = None
+        self._mmap = None
+        self._buffers = []
+        self._next = 0
+        # Frames for which every buffer was still in use (a fresh array was allocated)
+        self.overflows = 0
+        self.reused = 0
+
+    def _allocate(self, shape, dtype):
+        self.close()
+        self.shape, self.dtype = shape, np.dtype(dtype)
+        frame_bytes = int(np.prod(shape)) * self.dtype.itemsize
+        if self.shared:
+            fd, self.path = tempfile.mkstemp(prefix="frames-", suffix=".ring", dir=SHM_DIR)
+            try:
+                os.ftruncate(fd, frame_bytes * self.slots)
+                self._mmap = mmap.mmap(fd, frame_bytes * self.slots)
+            finally:
+                os.close(fd)
+            self._buffers = _map_buffers(self._mmap, shape, self.dtype, self.slots)
+        else:
+            self._buffers = [np.empty(shape, self.dtype) for _ in range(self.slots)]
+
+    def acquire(self):
+        """Next buffer nobody references anymore, or None."""
+        for _ in range(len(self._buffers)):
+            buffer = self._buffers[self._next]
+            self._next = (self._next + 1) % len(self._buffers)
+            # Queues and viewers hold a reference to the buffer
+            if sys.getrefcount(buffer) > _FREE_REFS + 1:  # + the local variable
+                continue
+            # Views (frame[...], .view()) hold one to the array owning the memory:
+            # the buffer itself, or for a shared slot the flat mapped array it reshapes
+            base = buffer.base
+            if base is not None and sys.getrefcount(base) > _FREE_BASE_REFS:
+                continue
+            return buffer
+        if self._buffers:
+            self.overflows += 1
+        return None
+
+    def adopt(self, frame, buffer):
+        """After a read: size the buffers from the first frame (or a resolution change)."""
+        if frame is None:
+            return
+        if buffer is not None and frame is buffer:
+            self.reused += 1
+        elif frame.shape != self.shape or frame.dtype != self.dtype:
+            self._allocate(frame.shape, frame.dtype)
+
+    def slot_of(self, frame):
+        """Index of the buffer holding `frame` (for workers attached to the shared block), or None."""
+        if self._mmap is None or frame is None or frame.shape != self.shape or frame.dtype != self.dtype:
+            return None
+        offset = frame.ctypes.data - self._buffers[0].ctypes.data
+        frame_bytes = self._buffers[0].nbytes
+        if 0 <= offset < frame_bytes * self.slots and offset % frame_bytes == 0:
+            return offset // frame_bytes
+        return None
+
+    def layout(self):
+        """What another process needs to `attach` to the shared buffers (None if not shared)."""
+        if self._mmap is None:
+            return None
+        return {"path": self.path, "shape": self.shape, "dtype": self.dtype.str, "slots": self.slots}
+
+    @staticmethod
+    def attach(path, shape, dtype, slots):
+        """Buffers of a shared ring created by another process (read/write views)."""
+        with open(path, "r+b") as file:
+            mapped = mmap.mmap(file.fileno(), 0)
+        return _map_buffers(mapped, shape, np.dtype(dtype), slots)
+
+    def stats(self):
+        return {
+            "slots": len(self._buffers),
+            "shared": self.path,
+            "reused": self.reused,
+            "overflows": self.overflows,
+        }
+
+    def close(self):
+        self._buffers = []
+        self._next = 0
+        self.shape = self.dtype = None
+        if self._mmap is not None:
+            # Frames still referenced elsewhere keep the mapping alive: it is unmapped
+            # when the last of them is gone. Removing the file only frees the name.
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass
+            os.unlink(self.path)
+            self._mmap = self.path = None
+
+
+def _map_buffers(mapped, shape, dtype, slots):
+    # np.frombuffer holds the mmap's buffer, so it can't be unmapped under a live frame
+    count = int(np.prod(shape))
+    return [
+        np.frombuffer(mapped, dtype, count, offset=i * count * dtype.itemsize).reshape(shape)
+        for i in range(slots)
+    ]
+
+
+def read_into(cap, ring):
+    """`cap.read()` into a free buffer of `ring` (plain `cap.read()` without a ring)."""
+    if ring is None:
+        return cap.read()
+    buffer = ring.acquire()
+    ok, frame = cap.read(buffer) if buffer is not None else cap.read()
+    if ok:
+        ring.adopt(frame, buffer)
+    return ok, frame
+
+
+# A buffer is only reused once nothing (frame, view) references it anymore
+if __name__ == "__main__":
+    for shared in (False, True):
+        ring = FrameRing(2, shared=shared)
+        ring.adopt(np.zeros((4, 4, 3), np.uint8), None)
+        first = ring.acquire()
+        view = first[1:3]
+        second = ring.acquire()
+        assert second is not None and second is not first, "the slot of a live frame was handed out"
+        del first
+        assert ring.acquire() is None, "the slot of a live view was handed out"
+        del view
+        assert ring.acquire() is not None, "a free slot was not reused"
+        ring.close()
+        print(f"✅ {'shared' if shared else 'private'} buffers: live frames and views block reuse")
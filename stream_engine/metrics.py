@@ -0,0 +1,112 @@
+# Lightweight Prometheus-style metrics, served as text on GET /metrics.
+#
+# Histograms use fixed buckets: recording a value is one bisect and a few
+# additions, cheap enough to stay on for every frame in production. Values
+# that already exist elsewhere (queue sizes, viewers, drop counters) are not
+# copied on every frame; they are read by callbacks when /metrics is scraped.
+#
+# No dependency on prometheus_client: the output follows the text exposition
+# format, so Prometheus, VictoriaMetrics or a plain `curl` can read it.
+import bisect
+
+
+# Upper bounds of the histogram buckets, in seconds (1 ms .. 2.5 s)
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.015, 0.02, 0.03, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1.0, 2.5)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Count of observed durations per bucket, plus their sum."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        # One counter per bucket, the last one is +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        # Values equal to a bound belong to that bucket (Prometheus `le`)
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimated q-quantile (0..1) in seconds: upper bound of the bucket holding it."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class MetricsRegistry:
+    """
+    Named metrics of one process.
+
+    - histogram(name, help, **labels): a `Histogram` to observe durations with
+    - gauge / counter(name, help, read, label=None): `read()` is called at scrape
+      time; with `label`, it returns {label value: number} (one sample per entry)
+
+    `labels` given to the registry (e.g. app="http") are added to every sample.
+    """
+
+    def __init__(self, **labels):
+        self.labels = labels
+        # name -> (type, help, [(labels, Histogram or read callback, label)])
+        self._metrics = {}
+
+    def _add(self, name, kind, help, entry):
+        if name in self._metrics and self._metrics[name][0] != kind:
+            raise ValueError(f"Metric {name!r} is already a {self._metrics[name][0]}")
+        self._metrics.setdefault(name, (kind, help, []))[2].append(entry)
+
+    def histogram(self, name, help, buckets=BUCKETS, **labels):
+        histogram = Histogram(buckets)
+        self._add(name, "histogram", help, ({**self.labels, **labels}, histogram, None))
+        return histogram
+
+    def gauge(self, name, help, read, label=None):
+        self._add(name, "gauge", help, (dict(self.labels), read, label))
+
+    def counter(self, name, help, read, label=None):
+        self._add(name, "counter", help, (dict(self.labels), read, label))
+
+    def render(self):
+        """All metrics in the Prometheus text format."""
+        lines = []
+        for name, (kind, help, entries) in self._metrics.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, source, label in entries:
+                if kind == "histogram":
+                    cumulative = 0
+                    for bound, count in zip((*source.buckets, float("inf")), source.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {source.sum!r}")
+                    lines.append(f"{name}_count{_labels(labels)} {source.count}")
+                    continue
+                value = source()
+                if label is None:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                else:
+                    for key, item in value.items():
+                        lines.append(f"{name}{_labels({**labels, label: key})} {_number(item)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,164 @@
+# Encode-once MJPEG broadcast for `GET /video_feed`.
+#
+# The multipart chunk of each frame (boundary + headers + JPEG) is built ONCE
+# and stored in a small ring buffer. Every HTTP client reads the same bytes
+# from the ring with its own cursor; a client that falls more than the ring
+# size behind skips ahead to the newest frame instead of slowing anyone down.
+# Decode, inference and encode cost don't depend on the number of viewers.
+import asyncio
+
+from fastapi.responses import StreamingResponse
+
+from .pipeline import END_OF_STREAM
+
+
+# Frames kept for slow clients before they skip ahead
+BUFFER_FRAMES = 8
+
+
+class MjpegRing:
+    """Fixed-size ring of multipart chunks, indexed by an increasing sequence number."""
+
+    def __init__(self, size=BUFFER_FRAMES):
+        self.size = max(1, size)
+        self._chunks = [None] * self.size
+        self.head = -1  # sequence number of the newest chunk
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def append(self, chunk):
+        self.head += 1
+        self._chunks[self.head % self.size] = chunk
+        self._wake()
+
+    def close(self):
+        """No more chunks: readers get None once they reached the end."""
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        # Wake everyone waiting on the current event, the next wait uses a new one.
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def read(self, cursor):
+        """
+        Chunk number `cursor`, waiting for it if needed.
+        Returns (chunk or None at the end, next cursor, frames skipped).
+        """
+        while cursor > self.head:
+            if self.closed:
+                return None, cursor, 0
+            await self._changed.wait()
+        skipped = 0
+        if cursor <= self.head - self.size:
+            # Overwritten already: this client is too slow, jump to the newest frame.
+            skipped = self.head - cursor
+            cursor = self.head
+        return self._chunks[cursor % self.size], cursor + 1, skipped
+
+
+class MjpegBroadcaster:
+    """Feeds one ring from the engine while at least one HTTP client is connected."""
+
+    def __init__(self, engine, buffer_frames=BUFFER_FRAMES):
+        self.engine = engine
+        self.buffer_frames = buffer_frames
+        # Start of the part header, the same for every frame
+        self._header = b"--frame\r\nContent-Type: " + engine.media_type.encode() + b"\r\n"
+        self.ring = None
+        self.clients = 0
+        self.chunks_sent = 0
+        self.frames_skipped = 0
+        self._subscriber = None
+        self._pump = None
+        self._lock = asyncio.Lock()
+
+    async def join(self):
+        """Returns the ring to read from, or None if the video source is not available."""
+        async with self._lock:
+            if self._pump is None or self._pump.done():
+                await self._stop_pump()
+                subscriber = await self.engine.subscribe()
+                if subscriber is None:
+                    return None
+                self._subscriber = subscriber
+                self.ring = MjpegRing(self.buffer_frames)
+                self._pump = asyncio.create_task(self._run(subscriber, self.ring))
+            self.clients += 1
+            return self.ring
+
+    async def leave(self):
+        async with self._lock:
+            self.clients -= 1
+            if self.clients == 0:
+                # Last client gone: stop reading frames (the engine may release the source)
+                await self._stop_pump()
+
+    async def _stop_pump(self):
+        if self._pump is not None:
+            self._pump.cancel()
+            await asyncio.gather(self._pump, return_exceptions=True)
+            self._pump = None
+        if self._subscriber is not None:
+            await self.engine.unsubscribe(self._subscriber)
+            self._subscriber = None
+
+    async def _run(self, subscriber, ring):
+        try:
+            while True:
+                item = await subscriber.get()
+                if item is END_OF_STREAM:
+                    break
+                frame, stats = item
+                # The only place the multipart chunk is built.
+                # X-Timestamp: capture time, for latency measurements (bench_servers.py)
+                timestamp = b"X-Timestamp: %.6f\r\n\r\n" % stats.get("captured_at", 0.0)
+                ring.append(b"".join((self._header, timestamp, frame.data, b"\r\n")))
+        finally:
+            ring.close()
+
+    async def stream(self, ring):
+        """Async generator of multipart chunks for one client (starts at the newest frame)."""
+        cursor = max(ring.head, 0)
+        while True:
+            chunk, cursor, skipped = await ring.read(cursor)
+            if chunk is None:
+                break
+            self.frames_skipped += skipped
+            self.chunks_sent += 1
+            yield chunk
+
+    def response(self, ring):
+        """Response of a client that joined: it leaves when the response ends, whatever happened."""
+        return MjpegResponse(self, ring)
+
+    def stats(self):
+        return {
+            "clients": self.clients,
+            "buffer_frames": self.buffer_frames,
+            "frames_buffered": self.ring.head + 1 if self.ring else 0,
+            "chunks_sent": self.chunks_sent,
+            "frames_skipped": self.frames_skipped,
+        }
+
+
+class MjpegResponse(StreamingResponse):
+    """
+    Multipart stream of one client of `broadcaster`.
+
+    Leaving is tied to the response, not to the generator: a client gone before
+    the first chunk never starts the generator (its `finally` would never run).
+    """
+
+    def __init__(self, broadcaster, ring):
+        super().__init__(broadcaster.stream(ring), media_type="multipart/x-mixed-replace; boundary=frame")
+        self.broadcaster = broadcaster
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Runs inside the response's cancelled scope when the client disconnects:
+            # shielded, or the last client would never stop the pump.
+            await asyncio.shield(self.broadcaster.leave())
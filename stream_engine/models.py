@@ -0,0 +1,161 @@
+# Model registry: several zoo models offered by one server, loaded on demand.
+#
+# `ModelRegistry.acquire(name)` returns a loaded model, loading it on first use
+# and running one dummy frame through it (the first real frame isn't slowed
+# down by the accelerator's setup). Loads happen outside the registry lock:
+# sessions asking for a model that is being loaded wait for that one load, all
+# the others keep running. At most `capacity` models stay resident; when one
+# more is loaded, the least recently used model that nobody uses is unloaded.
+# A model in use is never evicted (the registry then briefly holds more).
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+from .backends import load_model
+
+
+# Models kept loaded at the same time (each one takes memory on the host and the chip)
+CAPACITY = 2
+# Input size in zoo model names: "yolo11n_coco--640x640_quant_hailort_..."
+_INPUT_SIZE = re.compile(r"--(\d+)x(\d+)")
+DEFAULT_INPUT_SIZE = (640, 640)
+
+
+def read_model_list(path):
+    """Model names of a text file, one per line (blank lines and # comments are skipped)."""
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def input_size(name):
+    """(width, height) the model expects, from its zoo name."""
+    match = _INPUT_SIZE.search(name)
+    return (int(match[1]), int(match[2])) if match else DEFAULT_INPUT_SIZE
+
+
+class _Entry:
+    """One model of the registry, loaded or being loaded."""
+
+    def __init__(self):
+        self.model = None
+        self.error = None
+        self.users = 0
+        self.load_ms = None
+        self.ready = threading.Event()
+
+
+class ModelRegistry:
+    """
+    Models of a [model] config section, by name; `cfg["name"]` is the default.
+
+    - acquire(name) / release(name): use a model (blocks while it loads)
+    - use(name): the same as a context manager
+    """
+
+    def __init__(self, cfg, names=(), capacity=CAPACITY, warmup=True):
+        self.cfg = cfg
+        self.default = cfg["name"]
+        self.names = list(dict.fromkeys([self.default, *names]))
+        self.capacity = max(1, capacity)
+        self.warmup = warmup
+        # name -> _Entry, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def acquire(self, name=None):
+        """Loaded model `name` (default model if None), in use until `release(name)`."""
+        name = name or self.default
+        if name not in self.names:
+            raise KeyError(f"Unknown model {name!r}")
+        with self._lock:
+            entry = self._entries.get(name)
+            loading = entry is None
+            if loading:
+                entry = self._entries[name] = _Entry()
+                self.loads += 1
+            else:
+                self.hits += 1
+            entry.users += 1
+            self._entries.move_to_end(name)
+
+        if loading:
+            try:
+                entry.model, entry.load_ms = self._load(name)
+            except BaseException as exc:
+                entry.error = exc
+                with self._lock:
+                    if self._entries.get(name) is entry:
+                        del self._entries[name]
+                raise
+            finally:
+                # Wakes the sessions waiting for the same model
+                entry.ready.set()
+            self._evict()
+        else:
+            entry.ready.wait()
+            if entry.error is not None:
+                raise entry.error
+        return entry.model
+
+    def release(self, name=None):
+        name = name or self.default
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry.users > 0:
+                entry.users -= 1
+        self._evict()
+
+    @contextmanager
+    def use(self, name=None):
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(name)
+
+    def _load(self, name):
+        start = time.perf_counter()
+        print(f"⏳ Loading model {name}...")
+        model = load_model({**self.cfg, "name": name})
+        if self.warmup:
+            width, height = input_size(name)
+            model(np.zeros((height, width, 3), dtype=np.uint8))
+        load_ms = (time.perf_counter() - start) * 1000
+        print(f"✅ Model {name} ready in {load_ms:.0f} ms")
+        return model, load_ms
+
+    def _evict(self):
+        with self._lock:
+            # Oldest first; models in use or still loading are skipped
+            idle = [name for name, entry in self._entries.items() if entry.users == 0 and entry.ready.is_set()]
+            unloaded = idle[:max(len(self._entries) - self.capacity, 0)]
+            for name in unloaded:
+                del self._entries[name]
+            self.evictions += len(unloaded)
+        for name in unloaded:
+            # The model is freed once the last reference to it is gone
+            print(f"♻️  Model {name} unloaded")
+
+    def stats(self):
+        with self._lock:
+            resident = [
+                {"name": name, "users": entry.users,
+                 "load_ms": round(entry.load_ms, 1) if entry.load_ms is not None else None}
+                for name, entry in self._entries.items()
+            ]
+        return {
+            "default": self.default,
+            "available": self.names,
+            "capacity": self.capacity,
+            "resident": resident,
+            "loads": self.loads,
+            "hits": self.hits,
+            "evictions": self.evictions,
+        }
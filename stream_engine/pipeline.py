@@ -0,0 +1,313 @@
+# Staged capture -> inference -> tracking/overlay -> encode/send pipeline.
+#
+# Each stage runs in its own asyncio task and hands frames to the next stage
+# through a small bounded queue. When a queue is full the OLDEST frame is
+# dropped, so a slow client never makes the camera or the Hailo chip wait and
+# the latency of what the user sees stays bounded.
+import asyncio
+import time
+from collections import deque
+
+
+# Frames waiting between two stages (small = low latency)
+QUEUE_SIZE = 2
+# Smoothing factor for the per-stage timing averages
+TIMING_ALPHA = 0.1
+STAGES = ("capture", "inference", "process", "encode", "send")
+
+# Marker pushed through the queues when the source stops or a stage fails
+END_OF_STREAM = object()
+
+
+class DropOldestQueue:
+    """Bounded asyncio queue that drops the oldest item instead of blocking."""
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self._queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def put(self, item):
+        # Never wait on a slow consumer: throw away the stalest frame.
+        if self._queue.full():
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(item)
+
+    async def get(self):
+        return await self._queue.get()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+class StageTimer:
+    """Keeps the last and smoothed (EMA) duration of one stage, in ms."""
+
+    def __init__(self, alpha=TIMING_ALPHA, histogram=None):
+        self.alpha = alpha
+        self.last_ms = 0.0
+        self.avg_ms = 0.0
+        self.count = 0
+        # Optional metrics.Histogram fed with every duration (for GET /metrics)
+        self.histogram = histogram
+
+    def record(self, seconds):
+        if self.histogram is not None:
+            self.histogram.observe(seconds)
+        ms = seconds * 1000.0
+        self.last_ms = ms
+        # First sample seeds the average, then use an exponential moving average.
+        self.avg_ms = ms if self.count == 0 else self.avg_ms + self.alpha * (ms - self.avg_ms)
+        self.count += 1
+
+
+class FramePipeline:
+    """
+    Runs the four stages of a stream concurrently.
+
+    - read_frame(): returns (ok, frame), e.g. `cap.read`
+    - model(frame): any inference callable (Hailo model or `FakeModel`)
+    - process(inference_result): returns (frame_to_send, stats_dict)
+    - encode(frame): returns bytes to send, or None to skip the frame
+    - send(payload, stats): coroutine pushing one frame to the client;
+      `stats["captured_at"]` is the capture time of the frame (time.time())
+    - histograms: optional {stage or "latency": metrics.Histogram}, kept
+      across runs by the caller
+    - encoders: frames encoded at the same time (e.g. by worker processes);
+      they are still sent in capture order
+    - frame_time(): capture time (time.time()) of the frame read_frame() just
+      returned, for sources that know it (a frame can wait in a camera buffer);
+      else the time read_frame() returned
+
+    The blocking calls run in worker threads so the stages overlap:
+    while frame N is being sent, N+1 is tracked and N+2 is on the accelerator.
+    """
+
+    def __init__(self, read_frame, model, process, encode, send, queue_size=QUEUE_SIZE, histograms=None,
+                 encoders=1, frame_time=None):
+        self.read_frame = read_frame
+        self.frame_time = frame_time
+        self.model = model
+        self.process = process
+        self.encode = encode
+        self.send = send
+        histograms = histograms or {}
+        self.timers = {name: StageTimer(histogram=histograms.get(name)) for name in STAGES}
+        self._inference_queue = DropOldestQueue(queue_size)
+        self._process_queue = DropOldestQueue(queue_size)
+        self._send_queue = DropOldestQueue(queue_size)
+        self.encoders = encoders
+        # Encodings started, in capture order: (task, stats, captured_at)
+        self._encoding = deque()
+        self._encoded = asyncio.Event()
+        self.frames_captured = 0
+        self.frames_sent = 0
+        # read_frame() call running in a worker thread, if any
+        self._reading = None
+        # Capture -> sent time of each frame (ms)
+        self.latency = StageTimer(histogram=histograms.get("latency"))
+
+    def stage_timings(self):
+        """Smoothed duration of each stage in milliseconds."""
+        return {name: round(timer.avg_ms, 2) for name, timer in self.timers.items()}
+
+    def dropped_frames(self):
+        """Frames dropped in front of each stage because it was busy."""
+        return {
+            "inference": self._inference_queue.dropped,
+            "process": self._process_queue.dropped,
+            "send": self._send_queue.dropped,
+        }
+
+    def queue_depths(self):
+        """Frames currently waiting in front of each stage."""
+        return {
+            "inference": self._inference_queue.qsize(),
+            "process": self._process_queue.qsize(),
+            "send": self._send_queue.qsize(),
+        }
+
+    async def run(self):
+        """Run until the source stops, a stage fails or `send` raises."""
+        upstream = [
+            asyncio.create_task(self._capture_stage()),
+            asyncio.create_task(self._inference_stage()),
+            asyncio.create_task(self._process_stage()),
+            asyncio.create_task(self._encode_stage()),
+        ]
+        try:
+            # The send stage ends last: either END_OF_STREAM reached it, or the client left.
+            await self._send_stage()
+        finally:
+            # Encodings never sent (the client left) are cancelled with the stages
+            upstream += [task for task, _, _ in self._encoding if task is not END_OF_STREAM]
+            for task in upstream:
+                task.cancel()
+            results = await asyncio.gather(*upstream, return_exceptions=True)
+            # Cancelling doesn't stop the thread: wait for a pending read, the caller
+            # releases the source right after (releasing during a read crashes OpenCV).
+            if self._reading is not None:
+                await asyncio.wait([self._reading])
+
+        # Surface the first real error from an upstream stage to the caller.
+        for result in results:
+            if isinstance(result, Exception) and not isinstance(result, asyncio.CancelledError):
+                raise result
+
+    async def _capture_stage(self):
+        try:
+            while True:
+                start = time.perf_counter()
+                self._reading = asyncio.ensure_future(asyncio.to_thread(self.read_frame))
+                ok, frame = await asyncio.shield(self._reading)
+                if not ok:
+                    break  # Camera failed or video ended
+                self.timers["capture"].record(time.perf_counter() - start)
+                self.frames_captured += 1
+                # The capture time travels with the frame through every stage.
+                captured_at = self.frame_time() if self.frame_time is not None else None
+                self._inference_queue.put((frame, captured_at or time.time()))
+        finally:
+            self._inference_queue.put(END_OF_STREAM)
+
+    async def _inference_stage(self):
+        try:
+            while True:
+                item = await self._inference_queue.get()
+                if item is END_OF_STREAM:
+                    break
+                frame, captured_at = item
+                start = time.perf_counter()
+                result = await asyncio.to_thread(self.model, frame)
+                self.timers["inference"].record(time.perf_counter() - start)
+                self._process_queue.put((result, captured_at))
+        finally:
+            self._process_queue.put(END_OF_STREAM)
+
+    async def _process_stage(self):
+        try:
+            while True:
+                item = await self._process_queue.get()
+                if item is END_OF_STREAM:
+                    break
+                result, captured_at = item
+                start = time.perf_counter()
+                frame, stats = await asyncio.to_thread(self.process, result)
+                self.timers["process"].record(time.perf_counter() - start)
+                self._send_queue.put((frame, stats, captured_at))
+        finally:
+            self._send_queue.put(END_OF_STREAM)
+
+    async def _encode(self, frame):
+        start = time.perf_counter()
+        payload = await asyncio.to_thread(self.encode, frame)
+        self.timers["encode"].record(time.perf_counter() - start)
+        return payload
+
+    async def _encode_stage(self):
+        # Starts up to `encoders` encodings; the send stage waits for them in order.
+        try:
+            while True:
+                while len(self._encoding) >= self.encoders:
+                    self._encoded.clear()
+                    await self._encoded.wait()
+                # Taken only once an encoder is free, so it is the newest frame
+                item = await self._send_queue.get()
+                if item is END_OF_STREAM:
+                    break
+                frame, stats, captured_at = item
+                self._encoding.append((asyncio.ensure_future(self._encode(frame)), stats, captured_at))
+                self._encoded.set()
+        finally:
+            self._encoding.append((END_OF_STREAM, None, None))
+            self._encoded.set()
+
+    async def _send_stage(self):
+        while True:
+            while not self._encoding:
+                self._encoded.clear()
+                await self._encoded.wait()
+            task, stats, captured_at = self._encoding[0]
+            if task is END_OF_STREAM:
+                return
+            if isinstance(stats, dict):
+                stats["captured_at"] = captured_at
+
+            payload = await task
+            self._encoding.popleft()
+            self._encoded.set()
+            if payload is None:
+                continue  # Skip this frame if encoding fails
+
+            start = time.perf_counter()
+            await self.send(payload, stats)
+            self.timers["send"].record(time.perf_counter() - start)
+            self.latency.record(time.time() - captured_at)
+            self.frames_sent += 1
+
+
+class FakeResult:
+    """Minimal look-alike of a DeGirum inference result."""
+
+    def __init__(self, image, results):
+        self.image = image
+        self.results = results
+
+    @property
+    def image_overlay(self):
+        # The real property returns a new annotated image, so return a copy too.
+        return self.image.copy()
+
+
+class FakeModel:
+    """
+    Model stand-in used to run the pipeline without Hailo hardware.
+    Sleeps `latency` seconds per frame and returns fixed `detections`.
+    """
+
+    def __init__(self, latency=0.02, detections=None):
+        self.latency = latency
+        self.detections = detections or []
+
+    def __call__(self, frame):
+        time.sleep(self.latency)
+        return FakeResult(frame, list(self.detections))
+
+
+# Quick check without camera or accelerator: `python -m stream_engine.pipeline`
+if __name__ == "__main__":
+    import cv2
+    import numpy as np
+
+    frames_left = 200
+    blank = np.zeros((480, 640, 3), dtype=np.uint8)
+
+    def fake_camera():
+        global frames_left
+        time.sleep(1 / 30)  # ~30 FPS webcam
+        frames_left -= 1
+        return frames_left >= 0, blank.copy()
+
+    def encode(frame):
+        ok, jpg = cv2.imencode(".jpg", frame)
+        return jpg.tobytes() if ok else None
+
+    async def slow_client(payload, stats):
+        await asyncio.sleep(0.01)
+
+    async def main():
+        pipeline = FramePipeline(
+            fake_camera,
+            FakeModel(latency=0.03),
+            lambda inf: (inf.image_overlay, {}),
+            encode,
+            slow_client,
+        )
+        start = time.perf_counter()
+        await pipeline.run()
+        elapsed = time.perf_counter() - start
+        print(f"End-to-end FPS: {pipeline.frames_sent / elapsed:.1f}")
+        print("Stage timings (ms):", pipeline.stage_timings())
+        print("Dropped frames:", pipeline.dropped_frames())
+
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+# Post-processing steps run on each inference result before encoding.
+#
+# A step is a callable `step(result, frame, stats) -> frame`: it may draw on
+# the frame and add entries to the stats dict sent to the clients. Steps are
+# listed by name in the config (`postprocess = ["overlay", "tracker", "fps"]`)
+# and run in that order. With worker processes (`[pipeline] workers`), the
+# frame is a `DeferredFrame`: drawing steps record what to draw on it instead.
+import time
+
+import cv2
+
+from .detections import parse_detections
+from .tracker import CentroidTracker
+from .workers import DeferredFrame
+
+
+class Overlay:
+    """Replace the frame by the model's own annotated image (boxes, labels, keypoints)."""
+
+    def __call__(self, result, frame, stats):
+        if isinstance(frame, DeferredFrame):
+            # Drawn by a worker process, on the frame itself
+            return frame.add("detections", result.results)
+        return result.image_overlay
+
+
+class FpsOverlay:
+    """Draw the output frame rate in the corner, smoothed so it doesn't flicker."""
+
+    def __init__(self, position=(20, 30), scale=0.8, smoothing=0.1):
+        self.position = tuple(position)
+        self.scale = scale
+        # Weight of the newest frame interval in the moving average (1 = no smoothing)
+        self.smoothing = smoothing
+        self._prev = time.perf_counter()
+        self._interval = None
+
+    def __call__(self, result, frame, stats):
+        now = time.perf_counter()
+        interval, self._prev = now - self._prev, now
+        # EMA of the interval between frames, not of 1 / interval (a single stall would dominate)
+        if self._interval is None:
+            self._interval = interval
+        else:
+            self._interval += self.smoothing * (interval - self._interval)
+        fps = 1 / max(self._interval, 1e-6)
+        stats["fps"] = round(fps, 1)
+        text = (f"FPS: {fps:.0f}", self.position, cv2.FONT_HERSHEY_SIMPLEX, self.scale, (0, 255, 0), 2, cv2.LINE_AA)
+        if isinstance(frame, DeferredFrame):
+            return frame.add("text", *text)
+        cv2.putText(frame, *text)
+        return frame
+
+
+class PersonCounter:
+    """Track one class (people by default) and count the visible and unique tracks."""
+
+    def __init__(self, label_map, label="person", min_score=0.30, max_distance_px=90, max_misses=45,
+                 analytics=None):
+        self.label_map = label_map
+        self.class_ids = label_map.ids_for([label])
+        self.min_score = min_score
+        # Matches centers across frames and counts unique track IDs.
+        self.tracker = CentroidTracker(max_distance_px, max_misses)
+        # Optional analytics.AnalyticsSession receiving the enter/exit events
+        self.analytics = analytics
+
+    def __call__(self, result, frame, stats):
+        detections = parse_detections(result, self.label_map)
+        # Keep only confident detections of the class (one vectorized mask).
+        keep = detections.mask(self.class_ids, self.min_score)
+        # Track IDs visible in this frame (used for "Persons now").
+        visible_track_ids = self.tracker.update(detections.centers()[keep])
+        if self.analytics is not None:
+            self.analytics.record(self.tracker.entered, self.tracker.exited, self.tracker.seen)
+        stats["persons_now"] = len(visible_track_ids)
+        stats["unique_persons"] = self.tracker.unique_count
+        return frame
+
+
+class DetectionsMetadata:
+    """
+    Put the detections in the stats instead of drawing them (client-side overlay).
+
+    `stats["detections"]` is a compact list of [x1, y1, x2, y2, class_id, score]
+    in frame pixels, and `stats["size"]` the frame [width, height], so the
+    browser can draw them at any canvas size.
+    """
+
+    def __init__(self, label_map):
+        self.label_map = label_map
+
+    def __call__(self, result, frame, stats):
+        detections = parse_detections(result, self.label_map)
+        boxes = detections.boxes.round().astype(int).tolist()
+        # Rounded in float64, float32 values print as 0.8399999737...
+        scores = detections.scores.astype(float).round(2).tolist()
+        stats["detections"] = [
+            [*box, class_id, score]
+            for box, class_id, score in zip(boxes, detections.class_ids.tolist(), scores)
+        ]
+        stats["size"] = [frame.shape[1], frame.shape[0]]
+        return frame
+
+
+POSTPROCESSORS = {
+    "overlay": lambda config, label_map, analytics: Overlay(),
+    "fps": lambda config, label_map, analytics: FpsOverlay(**config["fps"]),
+    "tracker": lambda config, label_map, analytics: PersonCounter(label_map, **config["tracker"],
+                                                                  analytics=analytics),
+    "detections": lambda config, label_map, analytics: DetectionsMetadata(label_map),
+}
+# Steps that draw on the frame: replaced by "detections" with `overlay = "client"`
+DRAWING_STEPS = {"overlay", "fps"}
+OVERLAY_MODES = ("server", "client")
+
+
+class PostProcessChain:
+    """
+    Runs the steps in order; usable as the `process` stage of a FramePipeline.
+
+    `timings` is an optional list of metrics.Histogram, one per step, fed with
+    the duration of each step. With `deferred`, the steps get a DeferredFrame.
+    """
+
+    def __init__(self, steps, timings=None, deferred=False):
+        self.steps = steps
+        self.timings = timings
+        self.deferred = deferred
+
+    def __call__(self, result):
+        # Without an "overlay" step the raw frame is sent.
+        frame = DeferredFrame(result.image) if self.deferred else result.image
+        stats = {}
+        if self.timings is None:
+            for step in self.steps:
+                frame = step(result, frame, stats)
+            return frame, stats
+        for step, histogram in zip(self.steps, self.timings):
+            start = time.perf_counter()
+            frame = step(result, frame, stats)
+            histogram.observe(time.perf_counter() - start)
+        return frame, stats
+
+
+def make_postprocess(config, label_map, histograms=None, deferred=False, analytics=None):
+    """
+    New chain (with fresh tracker/FPS state) from the `postprocess` list of the config.
+    `histograms`: optional {step name: metrics.Histogram} for the step durations.
+    `deferred`: the drawing is done later by worker processes (see workers.py).
+    `analytics`: optional analytics.AnalyticsSession for the tracker's events.
+    """
+    names = postprocess_steps(config)
+    steps = []
+    for name in names:
+        if name not in POSTPROCESSORS:
+            raise ValueError(f"Unknown post-processing step {name!r}, expected one of {sorted(POSTPROCESSORS)}")
+        steps.append(POSTPROCESSORS[name](config, label_map, analytics))
+    timings = [histograms[name] for name in names] if histograms else None
+    return PostProcessChain(steps, timings, deferred)
+
+
+def postprocess_steps(config):
+    """Names of the steps to run, once the overlay mode is applied."""
+    if config["overlay"] not in OVERLAY_MODES:
+        raise ValueError(f"Unknown overlay mode {config['overlay']!r}, expected one of {OVERLAY_MODES}")
+    names = list(config["postprocess"])
+    if config["overlay"] == "client":
+        # The browser draws the boxes (and its own FPS): the frame is sent as captured.
+        names = [name for name in names if name not in DRAWING_STEPS]
+        if "detections" not in names:
+            names.append("detections")
+    return names
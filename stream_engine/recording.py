@@ -0,0 +1,317 @@
+# Record / replay of a frame source, without the camera or the Hailo chip.
+#
+# A recording is one chunked file: frames (with their capture time) and,
+# optionally, the detections the model returned for each of them. Replaying it
+# (`source = { type = "replay", path = "..." }`) behaves like the camera it was
+# recorded from: same frames, same timing (or as fast as possible), so
+# performance problems on the camera path can be reproduced on any machine.
+#
+# File layout (all integers big-endian):
+#   b"SREC" + version (1 byte)
+#   chunks: kind (1 byte) + payload length (4 bytes) + payload
+#     META        JSON: codec, source config, creation time
+#     FRAME       index (u32), capture time (f64), width, height (u16), channels (u8), image
+#     DETECTIONS  index (u32) + JSON of `inf_result.results` for that frame
+# A recording cut short (crash, Ctrl+C) is readable up to its last complete chunk.
+#
+#   python -m stream_engine.recording record cam.rec --app webcam --seconds 30 --detections
+#   python -m stream_engine.recording info cam.rec
+#   python -m stream_engine.recording reprocess cam.rec --app raspberry
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+
+MAGIC = b"SREC"
+VERSION = 1
+META, FRAME, DETECTIONS = 0, 1, 2
+_CHUNK = struct.Struct(">BI")
+_FRAME = struct.Struct(">IdHHB")
+_INDEX = struct.Struct(">I")
+
+# How images are stored: "raw" = lossless zlib of the pixels (fast), "png" = lossless
+# and smaller but slower, "jpeg" = smallest, lossy (replays are still identical)
+CODECS = ("raw", "png", "jpeg")
+# Frames captured but not written yet before `record` waits for the writer
+MAX_PENDING = 64
+
+
+class RecordedFrame(np.ndarray):
+    """Frame of a recording that has detections: knows its index in the file."""
+
+    frame_index = None
+
+
+def _encode(frame, codec):
+    if codec == "raw":
+        return zlib.compress(np.ascontiguousarray(frame).tobytes(), 1)
+    ext, params = (".png", [cv2.IMWRITE_PNG_COMPRESSION, 1]) if codec == "png" else (".jpg", [cv2.IMWRITE_JPEG_QUALITY, 95])
+    ok, encoded = cv2.imencode(ext, frame, params)
+    if not ok:
+        raise ValueError("Cannot encode frame")
+    return encoded.tobytes()
+
+
+def _decode(data, codec, width, height, channels):
+    if codec == "raw":
+        pixels = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+        return pixels.reshape((height, width, channels) if channels > 1 else (height, width))
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+class RecordingWriter:
+    """Appends frames (and detections) to a recording file."""
+
+    def __init__(self, path, codec="raw", meta=None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}, expected one of {CODECS}")
+        self.codec = codec
+        self.frames = 0
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + bytes([VERSION]))
+        self._chunk(META, json.dumps({**(meta or {}), "codec": codec, "created": time.time()}).encode())
+
+    def _chunk(self, kind, payload):
+        self._file.write(_CHUNK.pack(kind, len(payload)))
+        self._file.write(payload)
+
+    def encode(self, frame):
+        """Image bytes as stored in the file (thread-safe, may run in a worker)."""
+        return _encode(frame, self.codec)
+
+    def write(self, frame, timestamp, detections=None, encoded=None):
+        """
+        One frame with its capture time (time.time()) and optional `inf_result.results`.
+        `encoded`: result of `encode(frame)` if it was already computed.
+        """
+        height, width = frame.shape[:2]
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        header = _FRAME.pack(self.frames, timestamp, width, height, channels)
+        self._chunk(FRAME, header + (encoded if encoded is not None else self.encode(frame)))
+        if detections is not None:
+            self._chunk(DETECTIONS, _INDEX.pack(self.frames) + json.dumps(detections).encode())
+        self.frames += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RecordingReader:
+    """Reads a recording sequentially: `meta`, then `read()` frame by frame."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        if self._file.read(len(MAGIC) + 1)[:len(MAGIC)] != MAGIC:
+            self._file.close()
+            raise ValueError(f"{path} is not a recording")
+        kind, payload = self._next_chunk()
+        if kind != META:
+            raise ValueError(f"{path}: missing metadata")
+        self.meta = json.loads(payload)
+        self.codec = self.meta["codec"]
+        # Position of the first frame, for rewind()
+        self._start = self._file.tell()
+        self._pending = None
+
+    def _next_chunk(self):
+        header = self._file.read(_CHUNK.size)
+        if len(header) < _CHUNK.size:
+            return None, None
+        kind, length = _CHUNK.unpack(header)
+        payload = self._file.read(length)
+        if len(payload) < length:
+            return None, None  # Truncated last chunk
+        return kind, payload
+
+    def read(self, decode=True):
+        """Next (index, timestamp, frame or None, detections or None); None at the end."""
+        chunk = self._pending or self._next_chunk()
+        self._pending = None
+        while chunk[0] is not None and chunk[0] != FRAME:
+            chunk = self._next_chunk()
+        if chunk[0] is None:
+            return None
+        payload = chunk[1]
+        index, timestamp, width, height, channels = _FRAME.unpack_from(payload)
+        frame = _decode(payload[_FRAME.size:], self.codec, width, height, channels) if decode else None
+        # Detections, if recorded, are in the chunk right after their frame
+        detections = None
+        following = self._next_chunk()
+        if following[0] == DETECTIONS and _INDEX.unpack_from(following[1])[0] == index:
+            detections = json.loads(following[1][_INDEX.size:])
+        else:
+            self._pending = following
+        return index, timestamp, frame, detections
+
+    def rewind(self):
+        self._file.seek(self._start)
+        self._pending = None
+
+    def detections(self):
+        """All recorded detections, one list per frame (frames without any get [])."""
+        self.rewind()
+        frames = []
+        while (item := self.read(decode=False)) is not None:
+            frames.append(item[3] or [])
+        self.rewind()
+        return frames if any(frames) else None
+
+    def close(self):
+        self._file.close()
+
+
+def read_detections(path):
+    """Detections of a recording, for the simulator backend (`detections = "cam.rec"`)."""
+    reader = RecordingReader(path)
+    try:
+        return reader.detections()
+    finally:
+        reader.close()
+
+
+# ---------------------------------------------------------------- command line
+
+def record(args):
+    from .backends import load_model
+    from .config import load_config
+    from .sources import make_source
+
+    config = load_config(args.app)
+    source = make_source(config["source"])
+    if not source.open():
+        sys.exit(f"Cannot open the {config['source']['type']} source of [apps.{args.app}]")
+    model = load_model(config["model"]) if args.detections else None
+    # Compression and inference run in worker threads, so reading keeps the source's pace
+    encoders = ThreadPoolExecutor(max_workers=args.threads)
+    inference = ThreadPoolExecutor(max_workers=1)
+    # (frame, capture time, encoding future, detections future), in capture order
+    pending = deque()
+
+    def write_oldest(writer):
+        frame, captured_at, encoded, detections = pending.popleft()
+        results = detections.result().results if detections is not None else None
+        writer.write(frame, captured_at, results, encoded.result())
+
+    start = time.time()
+    captured = 0
+    writer = RecordingWriter(args.output, args.codec, {"app": args.app, "source": config["source"]})
+    try:
+        while captured < args.frames and time.time() - start < args.seconds:
+            ok, frame = source.read()
+            # The camera knows when the frame was captured (it can be older than the read)
+            captured_at = getattr(source, "frame_time", None) or time.time()
+            if not ok:
+                break
+            captured += 1
+            pending.append((
+                frame, captured_at, encoders.submit(writer.encode, frame),
+                inference.submit(model, frame) if model is not None else None,
+            ))
+            # Write what is ready; wait only when too many frames are in memory
+            while pending and (len(pending) > MAX_PENDING or
+                               (pending[0][2].done() and (pending[0][3] is None or pending[0][3].done()))):
+                write_oldest(writer)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        source.release()
+        while pending:
+            write_oldest(writer)
+        writer.close()
+        encoders.shutdown()
+        inference.shutdown()
+    print(f"✅ {writer.frames} frames recorded to {args.output} in {time.time() - start:.1f} s")
+
+
+def info(args):
+    reader = RecordingReader(args.recording)
+    frames, first, last, size, with_detections = 0, None, None, None, 0
+    while (item := reader.read(decode=size is None)) is not None:
+        index, timestamp, frame, detections = item
+        if size is None:
+            size = frame.shape
+        first = timestamp if first is None else first
+        last = timestamp
+        frames += 1
+        with_detections += detections is not None
+    reader.close()
+    duration = (last - first) if frames > 1 else 0.0
+    print(json.dumps({
+        **reader.meta,
+        "frames": frames,
+        "frames_with_detections": with_detections,
+        "shape": list(size) if size else None,
+        "duration_s": round(duration, 2),
+        "fps": round((frames - 1) / duration, 2) if duration else None,
+    }, indent=2))
+
+
+def reprocess(args):
+    """Run the post-processing of an app (tracking/counting) on the recorded detections."""
+    from .backends import SimulatedBackend
+    from .config import load_config
+    from .detections import LabelMap
+    from .postprocess import DRAWING_STEPS, make_postprocess
+
+    config = load_config(args.app)
+    # Nothing is drawn: only the steps that compute stats
+    config["postprocess"] = [step for step in config["postprocess"] if step not in DRAWING_STEPS]
+    model = SimulatedBackend({"latency_ms": 0, "detections": args.recording})
+    process = make_postprocess(config, LabelMap.from_model(model))
+    reader = RecordingReader(args.recording)
+    # The steps only look at the detections: the pixels are not decoded
+    placeholder = np.zeros((1, 1, 3), dtype=np.uint8).view(RecordedFrame)
+    frames, stats = 0, {}
+    start = time.perf_counter()
+    while (item := reader.read(decode=False)) is not None:
+        placeholder.frame_index = item[0]
+        _, stats = process(model(placeholder))
+        frames += 1
+    elapsed = time.perf_counter() - start
+    reader.close()
+    print(json.dumps({"frames": frames, "seconds": round(elapsed, 3),
+                      "fps": round(frames / elapsed, 1) if elapsed else None, "last_stats": stats}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record and replay frame sources")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rec = commands.add_parser("record", help="record the source of an app")
+    rec.add_argument("output")
+    rec.add_argument("--app", default="webcam", help="[apps.<name>] whose source is recorded")
+    rec.add_argument("--seconds", type=float, default=30.0)
+    rec.add_argument("--frames", type=int, default=10**9)
+    rec.add_argument("--codec", choices=CODECS, default="raw")
+    rec.add_argument("--detections", action="store_true", help="also record the model's detections")
+    rec.add_argument("--threads", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                     help="compression threads")
+    rec.set_defaults(run=record)
+
+    inf = commands.add_parser("info", help="frames, duration and fps of a recording")
+    inf.add_argument("recording")
+    inf.set_defaults(run=info)
+
+    rep = commands.add_parser("reprocess", help="re-run tracking/counting on recorded detections")
+    rep.add_argument("recording")
+    rep.add_argument("--app", default="raspberry", help="[apps.<name>] whose post-processing is used")
+    rep.set_defaults(run=reprocess)
+
+    args = parser.parse_args()
+    args.run(args)
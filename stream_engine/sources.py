@@ -0,0 +1,365 @@
+# Frame sources: video file, camera, RTSP stream, a folder of images or a recording.
+#
+# Every source has the same small interface as `cv2.VideoCapture`, which is
+# what the pipeline and `SharedProducer` expect:
+#   open() -> bool, read() -> (ok, frame_bgr), release()
+# `read()` runs in a worker thread, so it may block (e.g. to pace a file).
+# Sources decoded by OpenCV (camera, file, rtsp) have a `buffers` attribute:
+# set it to a `FrameRing` to read into preallocated frames (see framebuf.py).
+# The camera also has `frame_time`, the capture time of the frame returned last
+# (it can be older than the `read()` call), and `stop()` for its reader thread.
+import os
+import threading
+import time
+
+import cv2
+
+from .framebuf import read_into
+from .recording import RecordedFrame, RecordingReader
+
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+
+
+class _Pacer:
+    """Sleeps so that frames are returned at most `fps` times per second."""
+
+    def __init__(self, fps):
+        self.period = 1 / fps if fps and fps > 0 else 0
+        self._next = None
+
+    def wait(self):
+        if not self.period:
+            return
+        now = time.perf_counter()
+        if self._next is not None and self._next > now:
+            time.sleep(self._next - now)
+        # Don't try to catch up after a stall: restart from now.
+        self._next = max(self._next or now, now) + self.period
+
+
+class CameraSource:
+    """
+    Local camera (`cv2.VideoCapture(index)`) at the requested format and resolution.
+
+    - format: pixel format asked from the driver ("MJPG", "YUYV"; "" = driver default).
+      MJPG is needed for 720p and above at 30 fps on most USB cameras.
+    - fps: frame rate asked from the driver (0 = driver default)
+    - threaded: read continuously on a dedicated thread and keep only the newest
+      frame. Without it, V4L2 queues frames while inference is busy and `read()`
+      returns one that is several hundred milliseconds old.
+    - timeout_s: the stream ends if the camera sends nothing for that long
+    """
+
+    def __init__(self, index=0, width=640, height=480, format="MJPG", fps=30, threaded=True, timeout_s=5.0):
+        self.index = index
+        self.width = width
+        self.height = height
+        self.format = format
+        self.fps = fps
+        self.threaded = threaded
+        self.timeout_s = timeout_s
+        self.cap = None
+        self.buffers = None
+        # What the driver actually gave: {"format", "width", "height", "fps"}
+        self.negotiated = None
+        # Capture time (time.time()) of the frame `read()` returned last
+        self.frame_time = None
+        # Smoothed age of the frames when `read()` returns them (ms)
+        self.age_ms = 0.0
+        self.frames = 0
+        self.captured = 0
+        # Frames replaced by a newer one before anybody read them
+        self.skipped = 0
+        self._latest = None
+        self._failed = False
+        self._stopped = False
+        self._ready = threading.Condition()
+        self._thread = None
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.index)
+        if not self.cap.isOpened():
+            return False
+        # V4L2 applies the pixel format first, then the sizes it allows
+        if self.format:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.format))
+        if self.width and self.height:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            self.cap.set(cv2.CAP_PROP_FPS, self.fps)
+        # Driver-side queue of one frame: the newest is what gets decoded
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._report_format()
+        if self.threaded:
+            self._stopped = self._failed = False
+            self._thread = threading.Thread(target=self._read_loop, name=f"camera-{self.index}", daemon=True)
+            self._thread.start()
+        return True
+
+    def _report_format(self):
+        code = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+        self.negotiated = {
+            "format": "".join(chr((code >> 8 * i) & 0xFF) for i in range(4)).strip("\0 ") or None,
+            "width": int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": round(self.cap.get(cv2.CAP_PROP_FPS), 1),
+        }
+        got = self.negotiated
+        print(f"✅ Camera {self.index}: {got['width']}x{got['height']} {got['format']} @ {got['fps']} fps")
+        asked = {"format": self.format, "width": self.width, "height": self.height, "fps": self.fps}
+        refused = {key: value for key, value in asked.items() if value and got[key] and got[key] != value}
+        if refused:
+            print(f"⚠️  Camera {self.index} did not accept {refused}")
+
+    def _read_loop(self):
+        # Always reading: V4L2 never holds more than the frame being decoded
+        while not self._stopped:
+            ok, frame = read_into(self.cap, self.buffers)
+            captured_at = time.time()
+            with self._ready:
+                if not ok:
+                    self._failed = True
+                    self._ready.notify_all()
+                    return
+                if self._latest is not None:
+                    self.skipped += 1
+                self._latest = (frame, captured_at)
+                self.captured += 1
+                self._ready.notify_all()
+
+    def read(self):
+        if not self.threaded:
+            ok, frame = read_into(self.cap, self.buffers)
+            self.frame_time = time.time()
+            return ok, frame
+        with self._ready:
+            self._ready.wait_for(lambda: self._latest is not None or self._failed, timeout=self.timeout_s)
+            if self._latest is None:
+                return False, None
+            frame, self.frame_time = self._latest
+            self._latest = None
+        age_ms = (time.time() - self.frame_time) * 1000
+        self.age_ms = age_ms if not self.frames else self.age_ms + 0.1 * (age_ms - self.age_ms)
+        self.frames += 1
+        return True, frame
+
+    def stop(self):
+        """Stop the reader thread (nothing writes to the frame buffers afterwards)."""
+        self._stopped = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {
+            **(self.negotiated or {}),
+            "threaded": self.threaded,
+            "frame_age_ms": round(self.age_ms, 2),
+            "captured": self.captured,
+            "skipped": self.skipped,
+        }
+
+    def release(self):
+        self.stop()
+        if self.cap is not None:
+            self.cap.release()
+
+
+class FileSource:
+    """
+    Video file.
+
+    - loop: start again at the end instead of ending the stream
+    - realtime: return frames at the file's frame rate (default). With False the file
+      is decoded as fast as possible: the pipeline's drop-oldest queues then throw
+      away every frame inference isn't ready for (only useful to measure decoding)
+    """
+
+    def __init__(self, path, loop=False, realtime=True):
+        self.path = path
+        self.loop = loop
+        self.realtime = realtime
+        self.cap = None
+        self.buffers = None
+        self._pacer = None
+
+    def open(self):
+        if not os.path.isfile(self.path):
+            return False
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            return False
+        self._pacer = _Pacer(self.cap.get(cv2.CAP_PROP_FPS) if self.realtime else 0)
+        return True
+
+    def read(self):
+        self._pacer.wait()
+        ok, frame = read_into(self.cap, self.buffers)
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = read_into(self.cap, self.buffers)
+        return ok, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class RtspSource:
+    """Network stream (RTSP/HTTP) that reconnects after `reconnect_s` when it drops (0 = end)."""
+
+    def __init__(self, url, reconnect_s=2.0):
+        self.url = url
+        self.reconnect_s = reconnect_s
+        self.cap = None
+        self.buffers = None
+        self.reconnects = 0
+
+    def _connect(self):
+        self.cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+        # Keep only the newest frame in OpenCV's buffer (lower latency)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return self.cap.isOpened()
+
+    def open(self):
+        return self._connect()
+
+    def read(self):
+        ok, frame = read_into(self.cap, self.buffers)
+        while not ok and self.reconnect_s > 0:
+            print(f"⚠️  Stream lost, reconnecting to {self.url}...")
+            self.cap.release()
+            time.sleep(self.reconnect_s)
+            self.reconnects += 1
+            if self._connect():
+                ok, frame = read_into(self.cap, self.buffers)
+        return ok, frame
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class ImageDirSource:
+    """Images of a folder, in name order, at `fps` frames per second."""
+
+    def __init__(self, path, fps=10, loop=True):
+        self.path = path
+        self.loop = loop
+        self.files = []
+        self._index = 0
+        self._pacer = _Pacer(fps)
+
+    def open(self):
+        if not os.path.isdir(self.path):
+            return False
+        self.files = sorted(
+            os.path.join(self.path, name) for name in os.listdir(self.path)
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTS
+        )
+        return bool(self.files)
+
+    def read(self):
+        self._pacer.wait()
+        # Unreadable images are skipped (at most one pass over the folder)
+        for _ in range(len(self.files)):
+            if self._index >= len(self.files):
+                if not self.loop:
+                    break
+                self._index = 0
+            frame = cv2.imread(self.files[self._index])
+            self._index += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def release(self):
+        pass
+
+
+class ReplaySource:
+    """
+    Recording made with `python -m stream_engine.recording record` (drop-in camera).
+
+    - realtime: frames come at the recorded rate (`speed` x), else as fast as they are read
+    - loop: start again at the end
+    Frames of a recording with detections carry their `frame_index`, so the
+    simulator backend returns the detections recorded for that exact frame.
+    """
+
+    def __init__(self, path, realtime=True, speed=1.0, loop=False):
+        self.path = path
+        self.realtime = realtime
+        self.speed = speed
+        self.loop = loop
+        self.reader = None
+        self._indexed = False
+        # (recorded time, perf_counter) of the frame the timing is measured from
+        self._origin = None
+
+    def open(self):
+        if not os.path.isfile(self.path):
+            return False
+        try:
+            self.reader = RecordingReader(self.path)
+        except ValueError as exc:
+            print(f"⚠️  {exc}")
+            return False
+        # Look for detections in the first frame
+        item = self.reader.read(decode=False)
+        self._indexed = item is not None and item[3] is not None
+        self.reader.rewind()
+        return item is not None
+
+    def _wait(self, timestamp):
+        now = time.perf_counter()
+        if self._origin is None:
+            self._origin = (timestamp, now)
+            return
+        due = self._origin[1] + (timestamp - self._origin[0]) / self.speed
+        if due > now:
+            time.sleep(due - now)
+        elif now - due > 0.5:
+            # Far behind (stall, slow reader): don't rush through frames to catch up
+            self._origin = (timestamp, now)
+
+    def read(self):
+        item = self.reader.read()
+        if item is None and self.loop:
+            self.reader.rewind()
+            self._origin = None
+            item = self.reader.read()
+        if item is None:
+            return False, None
+        index, timestamp, frame, _ = item
+        if self.realtime:
+            self._wait(timestamp)
+        if self._indexed:
+            frame = frame.view(RecordedFrame)
+            frame.frame_index = index
+        return True, frame
+
+    def release(self):
+        if self.reader is not None:
+            self.reader.close()
+
+
+SOURCES = {
+    "camera": lambda cfg: CameraSource(cfg.get("index", 0), cfg.get("width"), cfg.get("height"),
+                                       cfg.get("format", "MJPG"), cfg.get("fps", 30), cfg.get("threaded", True),
+                                       cfg.get("timeout_s", 5.0)),
+    "file": lambda cfg: FileSource(cfg["path"], cfg.get("loop", False), cfg.get("realtime", True)),
+    "rtsp": lambda cfg: RtspSource(cfg["url"], cfg.get("reconnect_s", 2.0)),
+    "images": lambda cfg: ImageDirSource(cfg["path"], cfg.get("fps", 10), cfg.get("loop", True)),
+    "replay": lambda cfg: ReplaySource(cfg["path"], cfg.get("realtime", True), cfg.get("speed", 1.0),
+                                       cfg.get("loop", False)),
+}
+
+
+def make_source(cfg):
+    """New (not opened) source from a `source` config section."""
+    if cfg.get("type") not in SOURCES:
+        raise ValueError(f"Unknown source type {cfg.get('type')!r}, expected one of {sorted(SOURCES)}")
+    return SOURCES[cfg["type"]](cfg)
@@ -0,0 +1,225 @@
+# Tiled inference for sources larger than the model input.
+#
+# The zoo models take 640x640: a 1080p frame is shrunk 3x before inference and
+# small vehicles or people far away disappear. `TiledModel` cuts the frame into
+# overlapping tiles of the model's input size, sends them (plus the whole frame,
+# for objects larger than a tile) to the accelerator as ONE batch, and merges
+# the detections back into frame coordinates.
+#
+# With `predict_batch` the accelerator pipelines the tiles: a frame of T tiles
+# costs about one latency + (T - 1) x the time between two results, not T
+# latencies. Objects cut by a tile edge are found by two tiles (or the tile and
+# the whole frame): detections of the same label that mostly cover each other
+# (intersection over the smaller box) are merged into one box, highest score
+# first, with the pairwise overlaps computed as one matrix.
+#
+# Only boxes are moved to frame coordinates: use it with detection models
+# (keypoints and masks stay in tile coordinates).
+#
+#   python -m stream_engine.tiling Ressources/example.mp4   # frames/s, tiled vs full frame
+import math
+
+import numpy as np
+
+from .backends import SimulatedResult
+
+
+TILING_DEFAULTS = {
+    "enabled": False,
+    # Tile side in pixels (0 = the model's input size, from its zoo name)
+    "tile": 0,
+    # Fraction of a tile shared with its neighbour
+    "overlap": 0.2,
+    # Also run the whole (downscaled) frame, for objects larger than a tile
+    "full_frame": True,
+    # Same-label detections whose intersection covers more than this fraction
+    # of the smaller box are merged
+    "match_threshold": 0.5,
+}
+
+
+def tile_grid(width, height, tile, overlap=0.2):
+    """(T, 4) int array of tiles x1, y1, x2, y2 covering the frame, overlapping by at least `overlap`."""
+    def starts(length):
+        if length <= tile:
+            return np.zeros(1, dtype=np.int64)
+        step = max(1, tile - int(tile * overlap))
+        count = math.ceil((length - tile) / step) + 1
+        # Spread evenly: the last tile ends on the frame edge
+        return np.linspace(0, length - tile, count).round().astype(np.int64)
+
+    xs, ys = np.meshgrid(starts(width), starts(height))
+    x1, y1 = xs.ravel(), ys.ravel()
+    return np.stack([x1, y1, np.minimum(x1 + tile, width), np.minimum(y1 + tile, height)], axis=1)
+
+
+def merge_boxes(boxes, scores, class_ids, threshold=0.5):
+    """
+    Greedy merge of duplicate detections. Returns (kept indices, merged boxes).
+
+    Going down by score, each kept box absorbs the lower-scored boxes of its
+    class it overlaps by more than `threshold` (intersection over the smaller
+    area) and grows to their union: the box cut by a tile edge and the whole
+    one become a single box.
+    """
+    count = len(scores)
+    if count == 0:
+        return np.empty(0, dtype=np.int64), boxes.reshape(0, 4)
+    order = np.argsort(-scores, kind="stable")
+    boxes = boxes[order]
+    class_ids = class_ids[order]
+    # Pairwise intersection / smaller area, (N, N)
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area = np.clip(boxes[:, 2:] - boxes[:, :2], 0, None).prod(axis=1)
+    smaller = np.minimum(area[:, None], area[None, :])
+    overlap = np.divide(inter, smaller, out=np.zeros_like(inter), where=smaller > 0)
+    # Only lower-scored boxes can be absorbed: upper triangle
+    matches = np.triu((overlap > threshold) & (class_ids[:, None] == class_ids[None, :]), 1)
+
+    keep = np.ones(count, dtype=bool)
+    # Box each detection was merged into (itself if kept)
+    owner = np.arange(count)
+    # Python loop over the boxes that have duplicates only (a few per tile edge)
+    for i in np.flatnonzero(matches.any(axis=1)):
+        if keep[i]:
+            group = matches[i] & keep
+            keep[group] = False
+            owner[group] = i
+    merged = boxes.copy()
+    np.minimum.at(merged[:, :2], owner, boxes[:, :2])
+    np.maximum.at(merged[:, 2:], owner, boxes[:, 2:])
+    return order[keep], merged[keep]
+
+
+class TiledResult(SimulatedResult):
+    """Merged detections of all the tiles of a frame, in frame coordinates."""
+
+
+class TiledModel:
+    """`model(frame)` run on overlapping tiles of the frame, batched; frames that fit in one tile go through as is."""
+
+    def __init__(self, model, tile=640, overlap=0.2, full_frame=True, match_threshold=0.5):
+        self.model = model
+        self.tile = tile
+        self.overlap = overlap
+        self.full_frame = full_frame
+        self.match_threshold = match_threshold
+        self.frames = 0
+        self.tiles = 0
+
+    def _predict(self, images):
+        predict_batch = getattr(self.model, "predict_batch", None)
+        if predict_batch is None:
+            return [self.model(image) for image in images]
+        # The accelerator works on the next tiles while the first results come back
+        return list(predict_batch(images))
+
+    def __call__(self, frame):
+        height, width = frame.shape[:2]
+        if width <= self.tile and height <= self.tile:
+            return self.model(frame)
+        grid = tile_grid(width, height, self.tile, self.overlap)
+        images = [np.ascontiguousarray(frame[y1:y2, x1:x2]) for x1, y1, x2, y2 in grid]
+        offsets = grid[:, :2]
+        if self.full_frame:
+            images.append(frame)
+            offsets = np.vstack([offsets, [[0, 0]]])
+        results = self._predict(images)
+        self.frames += 1
+        self.tiles += len(images)
+        return TiledResult(frame, self._merge(results, offsets, width, height))
+
+    def _merge(self, results, offsets, width, height):
+        detections, shifts = [], []
+        for result, offset in zip(results, offsets):
+            found = [det for det in result.results if isinstance(det, dict) and "bbox" in det]
+            detections += found
+            shifts += [offset] * len(found)
+        if not detections:
+            return []
+        shift = np.asarray(shifts, dtype=np.float32)
+        boxes = np.asarray([det["bbox"] for det in detections], dtype=np.float32) + np.hstack([shift, shift])
+        np.clip(boxes, 0, [width, height, width, height], out=boxes)
+        scores = np.asarray([det.get("score", 0.0) for det in detections], dtype=np.float32)
+        _, class_ids = np.unique([str(det.get("label", "")) for det in detections], return_inverse=True)
+        kept, merged = merge_boxes(boxes, scores, class_ids, self.match_threshold)
+        return [
+            {**detections[index], "bbox": [round(v, 1) for v in box]}
+            for index, box in zip(kept.tolist(), merged.tolist())
+        ]
+
+    def stats(self):
+        return {"frames": self.frames, "tiles_per_frame": round(self.tiles / self.frames, 1) if self.frames else 0}
+
+
+# Frames/s of full-frame, tiled one by one and tiled batched inference (simulator)
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    import cv2
+
+    from .backends import SimulatedBackend
+
+    parser = argparse.ArgumentParser(description="Throughput of tiled inference against full-frame inference")
+    parser.add_argument("video")
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--tile", type=int, default=640)
+    parser.add_argument("--overlap", type=float, default=TILING_DEFAULTS["overlap"])
+    parser.add_argument("--no-full-frame", action="store_true")
+    # Hailo-8L with a 640x640 YOLO: about 25 ms per frame, several frames in flight
+    parser.add_argument("--latency-ms", type=float, default=25.0)
+    parser.add_argument("--parallel", type=int, default=4)
+    parser.add_argument("--objects", type=int, default=20)
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    frames = []
+    while len(frames) < args.frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Cannot read {args.video}")
+    height, width = frames[0].shape[:2]
+    tiles = len(tile_grid(width, height, args.tile, args.overlap)) + (0 if args.no_full_frame else 1)
+    print(f"{args.video}: {width}x{height}, {tiles} images per frame ({args.tile}px tiles)")
+
+    def simulator():
+        return SimulatedBackend({"latency_ms": args.latency_ms, "parallel": args.parallel, "objects": args.objects})
+
+    class OneByOne:
+        """The simulator without predict_batch: every tile waits for the previous one."""
+
+        def __init__(self, model):
+            self.model = model
+
+        def __call__(self, frame):
+            return self.model(frame)
+
+    modes = {
+        "full frame": simulator(),
+        "tiled, one by one": TiledModel(OneByOne(simulator()), args.tile, args.overlap, not args.no_full_frame),
+        "tiled, batched": TiledModel(simulator(), args.tile, args.overlap, not args.no_full_frame),
+    }
+    for name, model in modes.items():
+        start = time.perf_counter()
+        for frame in frames:
+            model(frame)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>18}: {len(frames) / elapsed:6.1f} frames/s, {elapsed / len(frames) * 1000:7.1f} ms per frame")
+
+    # Cost of the merge alone, on the detections of one tiled frame
+    batched = modes["tiled, batched"]
+    results = batched._predict([np.ascontiguousarray(frames[0][y1:y2, x1:x2])
+                                for x1, y1, x2, y2 in tile_grid(width, height, args.tile, args.overlap)])
+    offsets = tile_grid(width, height, args.tile, args.overlap)[:, :2]
+    start = time.perf_counter()
+    for _ in range(100):
+        merged = batched._merge(results, offsets, width, height)
+    print(f"merge: {sum(len(r.results) for r in results)} -> {len(merged)} detections, "
+          f"{(time.perf_counter() - start) * 10:.2f} ms")
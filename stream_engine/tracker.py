@@ -0,0 +1,255 @@
+# Person tracker used by the people counter.
+#
+# Same idea as the original inline loop (match each detection center to the
+# closest previous track, create a new track otherwise, forget tracks after too
+# many missed frames) but:
+#   - candidate pairs and distances are computed at once with NumPy,
+#   - matching is globally optimal (minimum total distance) instead of greedy,
+#   - track state lives in flat arrays that are compacted when tracks expire.
+import numpy as np
+
+try:
+    # SciPy's C implementation is much faster in crowded scenes (`pip install scipy`).
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+MAX_MATCH_DISTANCE_PX = 90
+MAX_TRACK_MISSES = 45
+# Below this many detection x track pairs a full distance matrix is cheaper than the grid
+DENSE_PAIRS_LIMIT = 4096
+
+
+def _hungarian(cost):
+    """
+    Minimum-cost assignment for a dense matrix, NumPy fallback when SciPy is missing.
+    Returns (rows, cols) like `scipy.optimize.linear_sum_assignment`.
+    """
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # Shortest augmenting path version (potentials u/v), vectorized over columns.
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_col = np.zeros(m + 1, dtype=np.int64)  # 0 = free column
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        row_of_col[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = row_of_col[j0]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            used_cols = np.flatnonzero(used)
+            u[row_of_col[used_cols]] += delta
+            v[used_cols] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if row_of_col[j0] == 0:
+                break
+        # Flip the augmenting path.
+        while j0:
+            j1 = way[j0]
+            row_of_col[j0] = row_of_col[j1]
+            j0 = j1
+
+    cols = np.flatnonzero(row_of_col[1:])
+    rows = row_of_col[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def _solve_assignment(cost):
+    if linear_sum_assignment is not None:
+        return linear_sum_assignment(cost)
+    return _hungarian(cost)
+
+
+def _candidate_pairs(det_centers, trk_centers, max_distance):
+    """
+    All (detection, track) pairs closer than `max_distance`, with their distance.
+    Points are binned in a grid of `max_distance` cells so only the 3x3 neighbor
+    cells are compared, instead of building the full detections x tracks matrix.
+    """
+    if len(det_centers) * len(trk_centers) <= DENSE_PAIRS_LIMIT:
+        # Few people: the full pairwise matrix is the quickest way.
+        dist = np.linalg.norm(det_centers[:, None, :] - trk_centers[None, :, :], axis=2)
+        det_idx, trk_idx = np.nonzero(dist <= max_distance)
+        return det_idx, trk_idx, dist[det_idx, trk_idx]
+
+    det_cells = np.floor(det_centers / max_distance).astype(np.int64)
+    trk_cells = np.floor(trk_centers / max_distance).astype(np.int64)
+    # Encode (cx, cy) as one sortable integer key, with a 1-cell margin on each side.
+    origin = np.minimum(det_cells.min(axis=0), trk_cells.min(axis=0)) - 1
+    rows = max(det_cells[:, 1].max(), trk_cells[:, 1].max()) - origin[1] + 2
+
+    def cell_key(cells):
+        return (cells[:, 0] - origin[0]) * rows + (cells[:, 1] - origin[1])
+
+    trk_order = np.argsort(cell_key(trk_cells), kind="stable")
+    sorted_keys = cell_key(trk_cells)[trk_order]
+
+    det_parts, trk_parts = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            keys = cell_key(det_cells + (dx, dy))
+            lo = np.searchsorted(sorted_keys, keys, side="left")
+            counts = np.searchsorted(sorted_keys, keys, side="right") - lo
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            # Expand each detection into one row per track found in that cell.
+            det_parts.append(np.repeat(np.arange(len(det_centers)), counts))
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            trk_parts.append(trk_order[np.repeat(lo, counts) + np.arange(total) - first])
+
+    if not det_parts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0)
+    det_idx = np.concatenate(det_parts)
+    trk_idx = np.concatenate(trk_parts)
+    dist = np.linalg.norm(det_centers[det_idx] - trk_centers[trk_idx], axis=1)
+    close = dist <= max_distance
+    return det_idx[close], trk_idx[close], dist[close]
+
+
+def _connected_components(det_idx, trk_idx, n_det, n_trk):
+    """Component label of every edge in the bipartite detection/track graph."""
+    # Nodes 0..n_det-1 are detections, n_det.. are tracks.
+    labels = np.arange(n_det + n_trk)
+    trk_nodes = trk_idx + n_det
+    # Propagate the smallest label along the edges until stable.
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, det_idx, labels[trk_nodes])
+        np.minimum.at(labels, trk_nodes, labels[det_idx])
+        labels = labels[labels]  # pointer jumping speeds up long chains
+        if np.array_equal(labels, previous):
+            return labels[det_idx]
+
+
+def match_centers(det_centers, trk_centers, max_distance):
+    """
+    Globally optimal matching of detections to tracks within `max_distance`
+    (maximum number of matches, then minimum total distance).
+    Returns (det_idx, trk_idx) arrays of matched pairs.
+    """
+    empty = np.empty(0, dtype=np.int64)
+    if len(det_centers) == 0 or len(trk_centers) == 0:
+        return empty, empty
+
+    det_idx, trk_idx, dist = _candidate_pairs(det_centers, trk_centers, max_distance)
+    if len(det_idx) == 0:
+        return empty, empty
+
+    # Fast path: pairs where the detection and the track have no other candidate.
+    det_degree = np.bincount(det_idx, minlength=len(det_centers))
+    trk_degree = np.bincount(trk_idx, minlength=len(trk_centers))
+    unique = (det_degree[det_idx] == 1) & (trk_degree[trk_idx] == 1)
+    matched_det = [det_idx[unique]]
+    matched_trk = [trk_idx[unique]]
+
+    # The ambiguous rest is split into independent groups, each solved optimally.
+    det_idx, trk_idx, dist = det_idx[~unique], trk_idx[~unique], dist[~unique]
+    if len(det_idx):
+        labels = _connected_components(det_idx, trk_idx, len(det_centers), len(trk_centers))
+        order = np.argsort(labels, kind="stable")
+        bounds = np.flatnonzero(np.diff(labels[order])) + 1
+        for edges in np.split(order, bounds):
+            rows, row_pos = np.unique(det_idx[edges], return_inverse=True)
+            cols, col_pos = np.unique(trk_idx[edges], return_inverse=True)
+            # Out-of-range pairs get a huge cost so valid matches always win.
+            cost = np.full((len(rows), len(cols)), max_distance * 1e6)
+            cost[row_pos, col_pos] = dist[edges]
+            r, c = _solve_assignment(cost)
+            valid = cost[r, c] <= max_distance
+            matched_det.append(rows[r[valid]])
+            matched_trk.append(cols[c[valid]])
+
+    return np.concatenate(matched_det), np.concatenate(matched_trk)
+
+
+class CentroidTracker:
+    """
+    Tracks bbox centers across frames and counts unique track IDs.
+
+    `update(centers)` takes an (N, 2) array-like of detection centers and returns
+    the track ID assigned to each of them, in the same order. After each update,
+    `entered` and `exited` hold the IDs of the tracks it created and dropped, and
+    `seen` those matched or created (a dropped track was last seen `max_misses` + 1
+    updates before).
+    """
+
+    def __init__(self, max_distance=MAX_MATCH_DISTANCE_PX, max_misses=MAX_TRACK_MISSES):
+        self.max_distance = max_distance
+        self.max_misses = max_misses
+        self.reset()
+
+    def reset(self):
+        # One row per active track.
+        self._ids = np.empty(0, dtype=np.int64)
+        self._centers = np.empty((0, 2), dtype=np.float64)
+        self._misses = np.empty(0, dtype=np.int32)
+        # Monotonic counter used to assign unique IDs to newly seen people.
+        self._next_id = 0
+        self.entered = self.exited = self.seen = self._ids
+
+    @property
+    def active_count(self):
+        """Number of tracks currently kept (visible or recently missed)."""
+        return len(self._ids)
+
+    @property
+    def unique_count(self):
+        """Every track ID is counted once when created, so this is the unique counter."""
+        return self._next_id
+
+    def update(self, centers):
+        centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        det_idx, trk_idx = match_centers(centers, self._centers, self.max_distance)
+
+        # Matched tracks: move to the new center and reset their miss counter.
+        self._centers[trk_idx] = centers[det_idx]
+        self._misses += 1
+        self._misses[trk_idx] = 0
+
+        assigned_ids = np.empty(len(centers), dtype=np.int64)
+        assigned_ids[det_idx] = self._ids[trk_idx]
+
+        # Drop stale tracks to keep memory bounded and avoid wrong re-associations.
+        keep = self._misses <= self.max_misses
+        self.exited = self._ids[~keep]
+        if not keep.all():
+            self._ids = self._ids[keep]
+            self._centers = self._centers[keep]
+            self._misses = self._misses[keep]
+
+        # Unmatched detections start new tracks.
+        new_det = np.ones(len(centers), dtype=bool)
+        new_det[det_idx] = False
+        new_count = int(new_det.sum())
+        self.entered = np.arange(self._next_id, self._next_id + new_count)
+        if new_count:
+            new_ids = self.entered
+            self._next_id += new_count
+            assigned_ids[new_det] = new_ids
+            self._ids = np.concatenate([self._ids, new_ids])
+            self._centers = np.concatenate([self._centers, centers[new_det]])
+            self._misses = np.concatenate([self._misses, np.zeros(new_count, dtype=np.int32)])
+
+        self.seen = self._ids[self._misses == 0]
+        return assigned_ids
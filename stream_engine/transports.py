@@ -0,0 +1,334 @@
+# Transports: how processed frames reach the browser.
+#
+# Each `mount_*` function adds its routes to a FastAPI app and reads frames
+# from the engine's broadcast hub, so any number of clients (and transports)
+# share the same capture/inference loop.
+#
+# - mjpeg:     GET /video_feed, a multipart/x-mixed-replace stream for an <img>
+# - websocket: /ws, one binary message per frame (plus a JSON stats message if enabled);
+#              with `overlay = "client"` the stats carry the detections and each
+#              binary message starts with the 4-byte frame id they belong to
+# - webrtc:    POST /offer, the frames as a WebRTC video track (needs aiortc)
+import asyncio
+import json
+import struct
+import time
+
+from fastapi import Request, WebSocket
+from fastapi.responses import JSONResponse
+from starlette.websockets import WebSocketState
+
+from .encoding import AdaptiveQuality, encoded_variant
+from .mjpeg import BUFFER_FRAMES, MjpegBroadcaster
+from .pipeline import END_OF_STREAM
+
+try:
+    from aiortc import RTCPeerConnection, RTCSessionDescription, VideoStreamTrack
+    from aiortc.mediastreams import MediaStreamError
+    from av import VideoFrame
+except ImportError:
+    RTCPeerConnection = None
+
+
+# Frame id in front of the image with `overlay = "client"` (big-endian uint32)
+FRAME_ID = struct.Struct(">I")
+
+
+def tagged_image(frame, level, data, frame_id):
+    """
+    `data` (the image of `frame` at this quality level) prefixed with its frame id.
+
+    Built once per frame and level in one preallocated buffer, then sent as is
+    to every client on that level (no concatenation per client).
+    """
+    if frame.tagged is None:
+        frame.tagged = {}
+    buffer = frame.tagged.get(level)
+    if buffer is None:
+        buffer = bytearray(FRAME_ID.size + len(data))
+        FRAME_ID.pack_into(buffer, 0, frame_id & 0xFFFFFFFF)
+        buffer[FRAME_ID.size:] = data
+        frame.tagged[level] = buffer
+    return buffer
+
+
+def mount_mjpeg(app, engine, path="/video_feed", buffer_frames=BUFFER_FRAMES):
+    # Every client reads the same encoded chunks (see mjpeg.py)
+    broadcaster = MjpegBroadcaster(engine, buffer_frames)
+    engine.transport_stats["mjpeg"] = broadcaster.stats
+
+    @app.get(path)
+    async def video_feed():
+        """MJPEG stream with the AI inference overlay."""
+        ring = await broadcaster.join()
+        if ring is None:
+            print("⚠️  Video source not available")
+            return JSONResponse({"error": "Video source not available"}, status_code=503)
+        return broadcaster.response(ring)
+
+
+def mount_websocket(app, engine, path="/ws", send_stats=False):
+    # The browser needs the detections (in the stats) to draw the boxes
+    client_overlay = engine.config["overlay"] == "client"
+    send_stats = send_stats or client_overlay
+    encode_cfg = engine.config["encode"]
+    adaptive_cfg = {**encode_cfg["adaptive"]}
+    adaptive = adaptive_cfg.pop("enabled")
+    # Quality controller of each connected client (an entry per client, None if not adaptive)
+    clients = {}
+
+    def websocket_stats():
+        stats = {"clients": len(clients)}
+        if adaptive:
+            levels = [controller.level for controller in clients.values()]
+            stats["clients_per_level"] = {level: levels.count(level) for level in sorted(set(levels))}
+            stats["level_changes"] = sum(controller.changes for controller in clients.values())
+        return stats
+
+    engine.transport_stats["websocket"] = websocket_stats
+
+    @app.websocket(path)
+    async def websocket_endpoint(websocket: WebSocket):
+        # Join the shared stream (opens the source for the first viewer)
+        subscriber = await engine.subscribe()
+        if subscriber is None:
+            print("⚠️  Video source not available")
+            # Reject WebSocket with proper close code
+            await websocket.close(code=1003)  # 1003 = unsupported data
+            return
+
+        await websocket.accept()
+        quality = AdaptiveQuality(**adaptive_cfg) if adaptive else None
+        clients[websocket] = quality
+        # Labels already sent to this client (class ids in the detections)
+        labels_sent = 0
+        dropped = subscriber.dropped
+
+        try:
+            while True:
+                # Wait for the newest frame (older ones are skipped if we are slow)
+                item = await subscriber.get()
+                if item is END_OF_STREAM:
+                    break  # Source ended or failed
+                frame, stats = item
+                data = frame.data
+                level = None
+
+                if quality is not None and quality.setting is not None:
+                    # This client is behind: smaller / lower quality version of the frame
+                    level = quality.setting
+                    scale, level_quality = level
+                    data = await encoded_variant(frame, encode_cfg["format"], scale, level_quality)
+                    if data is None:
+                        continue
+
+                if client_overlay:
+                    labels = engine.label_map.names()
+                    if len(labels) != labels_sent:
+                        # Shared by all viewers: add the labels to a copy
+                        stats = {**stats, "labels": labels}
+                        labels_sent = len(labels)
+                    data = tagged_image(frame, level, data, stats["frame_id"])
+
+                try:
+                    start = time.perf_counter()
+                    # Stats first (text), then the annotated frame (binary).
+                    if send_stats:
+                        await websocket.send_text(json.dumps(stats))
+                    await websocket.send_bytes(data)
+                except Exception:
+                    # If the client disconnected or network error → exit loop
+                    print("⚠️  Streaming stopped")
+                    break
+
+                if quality is not None:
+                    # Sends wait when the socket buffer is full: slow link
+                    quality.record(time.perf_counter() - start, subscriber.dropped - dropped)
+                    dropped = subscriber.dropped
+
+        finally:
+            clients.pop(websocket, None)
+            # Leave the stream (the source is released when the last viewer leaves)
+            await engine.unsubscribe(subscriber)
+
+            # Gracefully close the WebSocket if it's still open
+            if websocket.application_state == WebSocketState.CONNECTED:
+                await websocket.close()
+
+
+if RTCPeerConnection is not None:
+    class HubVideoTrack(VideoStreamTrack):
+        """WebRTC video track fed with the processed frames of the engine."""
+
+        def __init__(self, engine):
+            super().__init__()
+            self.engine = engine
+            self.subscriber = None
+
+        async def recv(self):
+            if self.subscriber is None:
+                # Join the shared stream when the browser starts pulling frames
+                self.subscriber = await self.engine.subscribe()
+                if self.subscriber is None:
+                    self.stop()
+                    raise MediaStreamError
+            item = await self.subscriber.get()
+            if item is END_OF_STREAM:
+                self.stop()
+                raise MediaStreamError
+            frame, _ = item
+
+            video_frame = VideoFrame.from_ndarray(frame.image, format="bgr24")
+            video_frame.pts, video_frame.time_base = await self.next_timestamp()
+            return video_frame
+
+        def stop(self):
+            super().stop()
+            if self.subscriber is not None:
+                subscriber, self.subscriber = self.subscriber, None
+                asyncio.ensure_future(self.engine.unsubscribe(subscriber))
+
+
+def mount_webrtc(app, engine, path="/offer"):
+    if RTCPeerConnection is None:
+        raise RuntimeError("The webrtc transport needs aiortc: pip install aiortc")
+
+    # Active peer connections, closed when they fail or the client leaves
+    pcs = set()
+    engine.transport_stats["webrtc"] = lambda: {"clients": len(pcs)}
+
+    @app.post(path)
+    async def offer(request: Request):
+        """Handle the SDP offer from the client and answer with our video track."""
+        params = await request.json()
+        pc = RTCPeerConnection()
+        pcs.add(pc)
+        track = HubVideoTrack(engine)
+
+        @pc.on("connectionstatechange")
+        async def on_connectionstatechange():
+            if pc.connectionState in ("failed", "closed"):
+                track.stop()
+                await pc.close()
+                pcs.discard(pc)
+
+        await pc.setRemoteDescription(RTCSessionDescription(sdp=params["sdp"], type=params["type"]))
+        pc.addTrack(track)
+        answer = await pc.createAnswer()
+        await pc.setLocalDescription(answer)
+        return JSONResponse({"sdp": pc.localDescription.sdp, "type": pc.localDescription.type})
+
+
+TRANSPORTS = {
+    "mjpeg": lambda app, engine, config: mount_mjpeg(
+        app, engine, config["mjpeg"]["path"], config["mjpeg"]["buffer_frames"]),
+    "websocket": lambda app, engine, config: mount_websocket(
+        app, engine, config["websocket"]["path"], config["websocket"]["send_stats"]),
+    "webrtc": lambda app, engine, config: mount_webrtc(app, engine, config["webrtc"]["path"]),
+}
+
+
+# Built-in pages, one per transport ({title} and {path} are filled in)
+PAGES = {
+    "mjpeg": """
+    <html>
+      <head><title>{title}</title></head>
+      <body>
+        <h1>{title}</h1>
+        <img src="{path}" width="640" />
+      </body>
+    </html>
+    """,
+    "websocket": """
+    <html>
+      <head><title>{title}</title></head>
+      <body>
+        <h1>{title}</h1>
+        <canvas id="canvas" width="640" height="480"></canvas>
+        <script>
+          const canvas = document.getElementById("canvas");
+          const ctx = canvas.getContext("2d");
+          const socket = new WebSocket("ws://" + location.host + "{path}");
+          socket.binaryType = "blob";
+
+          // overlay = "client": frame id -> stats with the detections, and class id -> label
+          const pending = new Map();
+          const labels = {{}};
+
+          socket.onmessage = async function(event) {{
+            if (typeof event.data === "string") {{
+              const stats = JSON.parse(event.data);
+              Object.assign(labels, stats.labels || {{}});
+              if (stats.detections) pending.set(stats.frame_id, stats);
+              return;
+            }}
+            let image = event.data, stats = null;
+            if (pending.size) {{
+              // Client-side overlay: 4-byte frame id, then the image
+              const frameId = new DataView(await image.slice(0, 4).arrayBuffer()).getUint32(0);
+              stats = pending.get(frameId);
+              for (const id of pending.keys()) if (id <= frameId) pending.delete(id);
+              image = image.slice(4);
+            }}
+            const bitmap = await createImageBitmap(image);
+            ctx.drawImage(bitmap, 0, 0, canvas.width, canvas.height);
+            if (!stats) return;
+            const sx = canvas.width / stats.size[0], sy = canvas.height / stats.size[1];
+            ctx.strokeStyle = ctx.fillStyle = "#00ff00";
+            ctx.lineWidth = 2;
+            ctx.font = "14px sans-serif";
+            for (const [x1, y1, x2, y2, classId, score] of stats.detections) {{
+              ctx.strokeRect(x1 * sx, y1 * sy, (x2 - x1) * sx, (y2 - y1) * sy);
+              ctx.fillText(`${{labels[classId] ?? classId}} ${{score.toFixed(2)}}`, x1 * sx, Math.max(y1 * sy - 5, 12));
+            }}
+          }};
+        </script>
+      </body>
+    </html>
+    """,
+    "webrtc": """
+    <html>
+      <head><title>{title}</title></head>
+      <body>
+        <h1>{title}</h1>
+        <video id="video" width="640" autoplay playsinline muted></video>
+        <script>
+          const pc = new RTCPeerConnection();
+          pc.addTransceiver("video", {{ direction: "recvonly" }});
+          pc.ontrack = (event) => {{
+            document.getElementById("video").srcObject = event.streams[0] || new MediaStream([event.track]);
+          }};
+          (async () => {{
+            await pc.setLocalDescription(await pc.createOffer());
+            // Send the offer once all ICE candidates are in it
+            await new Promise((resolve) => {{
+              if (pc.iceGatheringState === "complete") return resolve();
+              pc.addEventListener("icegatheringstatechange", () => {{
+                if (pc.iceGatheringState === "complete") resolve();
+              }});
+            }});
+            const response = await fetch("{path}", {{
+              method: "POST",
+              headers: {{ "Content-Type": "application/json" }},
+              body: JSON.stringify({{ sdp: pc.localDescription.sdp, type: pc.localDescription.type }}),
+            }});
+            await pc.setRemoteDescription(await response.json());
+          }})();
+        </script>
+      </body>
+    </html>
+    """,
+}
+
+
+def mount_transports(app, engine, config):
+    for name in config["transports"]:
+        if name not in TRANSPORTS:
+            raise ValueError(f"Unknown transport {name!r}, expected one of {sorted(TRANSPORTS)}")
+        TRANSPORTS[name](app, engine, config)
+
+
+def index_page(config):
+    """Built-in HTML page for the first transport of the app."""
+    name = config["transports"][0]
+    return PAGES[name].format(title=config["title"], path=config[name]["path"])
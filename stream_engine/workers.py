@@ -0,0 +1,197 @@
+# Worker processes for the CPU-heavy part of each frame: drawing and encoding.
+#
+# With `[pipeline] workers = N`, the post-processing steps that draw ("overlay",
+# "fps") don't touch the pixels in the server process: they record what to
+# draw on a `DeferredFrame`. A pool of N processes then draws it, resizes and
+# encodes the frame, N frames at a time, and the pipeline sends the results in
+# capture order. Frames read into the shared frame ring (framebuf.py) are not
+# copied: the worker gets their slot number and draws in place, so WebRTC
+# viewers see the annotated frame too.
+#
+# Boxes and labels are drawn from `result.results` (like the simulator does),
+# not by the model's own `image_overlay`: keypoints or masks need workers = 0.
+# Web_app's WebRTC tracks (RENDER_WORKERS) also convert their YUV frames to
+# BGR here (`RenderPool.to_bgr`).
+#
+#   python -m stream_engine.workers --processes 1 2 4   # frames/s on this machine
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from .backends import draw_detections
+from .encoding import encode_image
+from .framebuf import FrameRing
+
+
+class DeferredFrame:
+    """Frame plus the drawing a worker will do on it (what the post-processing steps get)."""
+
+    __slots__ = ("image", "ops")
+
+    def __init__(self, image):
+        self.image = image
+        self.ops = []
+
+    @property
+    def shape(self):
+        return self.image.shape
+
+    def add(self, op, *args):
+        """Record a drawing: ("detections", results) or ("text", cv2.putText arguments)."""
+        self.ops.append((op, args))
+        return self
+
+
+def draw(image, ops):
+    """Apply the recorded drawing to `image`, in place."""
+    for op, args in ops:
+        if op == "detections":
+            draw_detections(image, *args)
+        elif op == "text":
+            cv2.putText(image, *args)
+    return image
+
+
+# Shared ring this worker process mapped last: (path, buffers)
+_attached = (None, None)
+
+
+def _init_worker():
+    # Ctrl+C reaches the whole process group: the server shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _render(frame, ops, encode):
+    """In a worker: draw on the frame, then encode it with (format, quality, scale) unless None."""
+    global _attached
+    if isinstance(frame, dict):
+        # Slot of the shared ring (see FrameRing.layout)
+        if _attached[0] != frame["path"]:
+            _attached = (frame["path"], FrameRing.attach(frame["path"], frame["shape"], frame["dtype"],
+                                                          frame["slots"]))
+        image = _attached[1][frame["slot"]]
+    else:
+        image = frame
+    draw(image, ops)
+    data = encode_image(image, *encode) if encode is not None else None
+    # A memoryview can't be pickled; pixels sent by value come back drawn
+    return (bytes(data) if data is not None else None), (image if image is frame and ops else None)
+
+
+def _to_bgr(planes):
+    """In a worker: BGR image of I420 planes (av's `to_ndarray(format="yuv420p")`)."""
+    return cv2.cvtColor(planes, cv2.COLOR_YUV2BGR_I420)
+
+
+class RenderPool:
+    """`processes` worker processes that draw and encode frames for one engine."""
+
+    def __init__(self, processes):
+        self.processes = processes
+        # Not forked: the server process runs an event loop and threads
+        self._executor = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker)
+        self.frames = 0
+        # Frames whose pixels were copied to the worker (not in the shared ring)
+        self.copied = 0
+        self.converted = 0
+
+    def render(self, frame, encode, ring=None):
+        """
+        Draw and encode `frame` (a DeferredFrame or an image) in a worker; returns (image, data).
+
+        Blocks until it is done: call it from a thread (the pipeline's encode stage).
+        `encode`: (format, quality, scale), or None to only draw.
+        """
+        image, ops = (frame.image, frame.ops) if isinstance(frame, DeferredFrame) else (frame, [])
+        if not ops and encode is None:
+            return image, None
+        slot = ring.slot_of(image) if ring is not None else None
+        if slot is None:
+            job = image
+            self.copied += 1
+        else:
+            job = {**ring.layout(), "slot": slot}
+        data, drawn = self._executor.submit(_render, job, ops, encode).result()
+        self.frames += 1
+        return (drawn if drawn is not None else image), data
+
+    def to_bgr(self, planes):
+        """
+        BGR image of I420 planes, converted in a worker.
+
+        Blocks until it is done: call it from a thread.
+        """
+        image = self._executor.submit(_to_bgr, planes).result()
+        self.converted += 1
+        return image
+
+    def stats(self):
+        return {"processes": self.processes, "frames": self.frames, "copied": self.copied,
+                "converted": self.converted}
+
+    def shutdown(self):
+        self._executor.shutdown(cancel_futures=True)
+
+
+# Draw + encode throughput with 0 (in this process) to N worker processes
+if __name__ == "__main__":
+    import argparse
+    import time
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    import numpy as np
+
+    from .backends import SyntheticDetections
+
+    parser = argparse.ArgumentParser(description="Frames/s of the render pool")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", type=int, nargs=2, default=[1280, 720], metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--format", default="jpeg")
+    parser.add_argument("--quality", type=int, default=95)
+    args = parser.parse_args()
+
+    width, height = args.size
+    boxes = SyntheticDetections(objects=10)
+    noise = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+
+    def frames(ring):
+        for index in range(args.frames):
+            buffer = ring.acquire() if ring is not None else None
+            image = buffer if buffer is not None else noise.copy()
+            if buffer is not None:
+                image[:] = noise
+            ring.adopt(image, buffer)
+            yield DeferredFrame(image).add("detections", boxes(index, width, height)).add(
+                "text", f"FPS: {index}", (20, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2, cv2.LINE_AA)
+
+    encode = (args.format, args.quality, 1.0)
+    ring = FrameRing(8, shared=True)
+    start = time.perf_counter()
+    for frame in frames(ring):
+        draw(frame.image, frame.ops)
+        encode_image(frame.image, *encode)
+    print(f"in process: {args.frames / (time.perf_counter() - start):.1f} frames/s")
+
+    for processes in args.processes:
+        pool = RenderPool(processes)
+        # Start the processes before timing
+        with ThreadPoolExecutor(processes) as threads:
+            list(threads.map(lambda _: pool.render(noise, encode), range(processes)))
+        with ThreadPoolExecutor(processes) as threads:
+            # Like the pipeline: `processes` frames in flight, results taken in order
+            pending = deque()
+            start = time.perf_counter()
+            for frame in frames(ring):
+                if len(pending) >= processes:
+                    pending.popleft().result()
+                pending.append(threads.submit(pool.render, frame, encode, ring))
+            for future in pending:
+                future.result()
+        print(f"{processes} processes: {args.frames / (time.perf_counter() - start):.1f} frames/s, {pool.stats()}")
+        pool.shutdown()
+    ring.close()